@@ -1,9 +1,22 @@
 # app/app.py
+"""
+Starts all the servers.
+
+    python app.py                   shared: one inference service hosts the Whisper
+                                    model, main and the transcription service call it
+    python app.py --mode separate   every service loads its own model (old behaviour)
+    python app.py --reload          restart a server when its code changes
+
+Poll GET /ready on a service to know when it can take work.
+"""
+import argparse
 import subprocess
 import sys
 import os
 import signal
 
+INFERENCE_PORT = int(os.getenv("INFERENCE_PORT", "8002"))
+
 # Paths to your app modules
 APPS = [
     ("main:app", 8001),  # main.py -> app
@@ -11,18 +24,32 @@ APPS = [
     ("room.transcription_service:app", 8000),  # room/transcription_service.py -> app
 ]
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--mode", choices=["shared", "separate"], default=os.getenv("LAUNCH_MODE", "shared"))
+parser.add_argument("--reload", action="store_true")
+args = parser.parse_args()
+
+apps = list(APPS)
+env = dict(os.environ)
+if args.mode == "shared":
+    apps.insert(0, ("inference_service:app", INFERENCE_PORT))
+    env["INFERENCE_URL"] = f"http://127.0.0.1:{INFERENCE_PORT}"
+
 processes = []
 
 try:
-    for module, port in APPS:
+    for module, port in apps:
         print(f"Starting {module} on port {port}...")
-        # Run uvicorn in a subprocess
-        proc = subprocess.Popen(
-            [sys.executable, "-m", "uvicorn", module, "--host", "0.0.0.0", "--port", str(port), "--reload"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        processes.append(proc)
+        # the inference service only serves INFERENCE_URL on this host
+        host = "127.0.0.1" if module == "inference_service:app" else "0.0.0.0"
+        cmd = [sys.executable, "-m", "uvicorn", module, "--host", host, "--port", str(port)]
+        if args.reload:
+            cmd.append("--reload")
+        proc_env = dict(env)
+        if module == "inference_service:app":
+            proc_env.pop("INFERENCE_URL", None)
+        # output goes to this console; an unread PIPE stalls a server once it fills
+        processes.append(subprocess.Popen(cmd, env=proc_env))
 
     # Wait for all processes
     for proc in processes:
@@ -0,0 +1,74 @@
+# batching.py
+"""
+Cross-request micro-batching for short live-room clips.
+
+Callers `await batcher.transcribe(audio, language="ta")`. Clips are held for
+up to BATCH_WINDOW_MS (or until BATCH_MAX_SIZE are waiting), then sent to the
+inference pool as one batched encoder/decoder pass, and each caller gets its
+own result back. Clips longer than one 30 s Whisper window go through the
+normal per-request transcribe instead. Everything here is live audio, so it
+runs at "live" priority in the inference pool.
+
+Config (env):
+    WHISPER_BATCHING  1 to enable (default), 0 to transcribe every clip on its own
+    BATCH_WINDOW_MS   how long the first clip of a batch may wait
+    BATCH_MAX_SIZE    clips per batch
+"""
+import asyncio
+import os
+
+import inference_pool
+
+BATCHING = os.getenv("WHISPER_BATCHING", "1") != "0"
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "100"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+
+SAMPLE_RATE = 16000
+MAX_CLIP_SECONDS = 30
+
+
+class MicroBatcher:
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_size=BATCH_MAX_SIZE):
+        self.window = window_ms / 1000.0
+        self.max_size = max_size
+        # options key -> list of (audio, future) waiting for the next flush
+        self._pending = {}
+        self._timers = {}
+
+    async def transcribe(self, audio, **options):
+        if (not BATCHING or isinstance(audio, str)
+                or len(audio) > MAX_CLIP_SECONDS * SAMPLE_RATE):
+            return await inference_pool.transcribe(audio, priority="live", **options)
+
+        key = tuple(sorted(options.items()))
+        future = asyncio.get_running_loop().create_future()
+        bucket = self._pending.setdefault(key, [])
+        bucket.append((audio, future))
+        if len(bucket) >= self.max_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, [])
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch, dict(key)))
+
+    async def _run_batch(self, batch, options):
+        try:
+            results = await inference_pool.transcribe_batch([a for a, _ in batch], priority="live", **options)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+batcher = MicroBatcher()
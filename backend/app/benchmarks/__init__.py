@@ -0,0 +1,5 @@
+# Benchmarks for the transcription backend. Run from backend/app, e.g.
+#   python -m benchmarks.bench_decode
+# bench_suite (in-process regression suite) and load_rooms (Socket.IO load
+# test against both room servers) run on the stub Whisper backend and write
+# --json results to diff between runs.
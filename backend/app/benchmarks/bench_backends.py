@@ -0,0 +1,118 @@
+# benchmarks/bench_backends.py
+"""
+Compare Whisper backends on a local Tamil reference set: real-time factor,
+peak RSS and WER/CER against reference transcripts.
+
+The reference set is a directory of audio files, each with a UTF-8 .txt
+transcript next to it (clip01.wav + clip01.txt, ...). Each backend runs in
+its own process so peak RSS is not shared between them.
+
+    python -m benchmarks.bench_backends --refs benchmarks/data/tamil_refs \\
+        --backends openai-whisper faster-whisper --model medium
+"""
+import argparse
+import json
+import multiprocessing
+import re
+import resource
+import time
+from pathlib import Path
+
+AUDIO_EXTS = {".wav", ".mp3", ".m4a", ".webm", ".ogg", ".flac"}
+
+
+def normalise(text: str):
+    # drop punctuation, keep Tamil letters/vowel signs, split on whitespace
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return text.split()
+
+
+def edit_distance(ref, hyp):
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1]
+
+
+def load_refs(ref_dir: Path):
+    refs = []
+    for audio in sorted(ref_dir.iterdir()):
+        txt = audio.with_suffix(".txt")
+        if audio.suffix.lower() in AUDIO_EXTS and txt.exists():
+            refs.append((audio, txt.read_text(encoding="utf-8")))
+    return refs
+
+
+def run_backend(backend, model_name, refs, language, out):
+    # child process: load, transcribe every clip, report timings and peak RSS
+    from transcribe_utils import decode_to_array
+    from whisper_backends import load_backend
+
+    start = time.perf_counter()
+    engine = load_backend(backend, model_name)
+    load_s = time.perf_counter() - start
+
+    audio_s = infer_s = 0.0
+    word_err = word_total = char_err = char_total = 0
+    for path, reference in refs:
+        audio = decode_to_array(path.read_bytes(), fmt=path.suffix)
+        audio_s += len(audio) / 16000
+        start = time.perf_counter()
+        hyp = engine.transcribe(audio, language=language)["text"]
+        infer_s += time.perf_counter() - start
+        ref_words, hyp_words = normalise(reference), normalise(hyp)
+        word_err += edit_distance(ref_words, hyp_words)
+        word_total += len(ref_words)
+        ref_chars, hyp_chars = list("".join(ref_words)), list("".join(hyp_words))
+        char_err += edit_distance(ref_chars, hyp_chars)
+        char_total += len(ref_chars)
+
+    out.put({
+        "backend": backend,
+        "model": model_name,
+        "load_seconds": round(load_s, 2),
+        "audio_seconds": round(audio_s, 2),
+        "rtf": round(infer_s / audio_s, 3) if audio_s else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "wer": round(word_err / word_total, 4) if word_total else None,
+        "cer": round(char_err / char_total, 4) if char_total else None,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--refs", default="benchmarks/data/tamil_refs")
+    parser.add_argument("--backends", nargs="+", default=["openai-whisper", "faster-whisper"])
+    parser.add_argument("--model", default="medium")
+    parser.add_argument("--language", default="ta")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    refs = load_refs(Path(args.refs))
+    if not refs:
+        raise SystemExit(f"no <clip>.<audio> + <clip>.txt pairs found in {args.refs}")
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for backend in args.backends:
+        out = ctx.Queue()
+        proc = ctx.Process(target=run_backend, args=(backend, args.model, refs, args.language, out))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0:
+            print(f"{backend}: failed (exit {proc.exitcode})")
+            continue
+        r = out.get()
+        results.append(r)
+        print(f"{backend:>15}: RTF {r['rtf']}  peak RSS {r['peak_rss_mb']} MB  "
+              f"WER {r['wer']}  CER {r['cer']}  load {r['load_seconds']} s")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/bench_batching.py
+"""
+Throughput of micro-batched vs one-at-a-time Whisper for N concurrent
+speakers, each sending a short live-room clip. Loads WHISPER_MODEL in this
+process (WHISPER_WORKERS=0) so both modes share the same weights.
+
+    WHISPER_MODEL=small python -m benchmarks.bench_batching --speakers 4 8 16
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("WHISPER_WORKERS", "0")
+os.environ.setdefault("WHISPER_MAX_QUEUE", "1024")
+
+import numpy as np
+
+import inference_pool
+from batching import MicroBatcher
+
+
+def synth_clip(seconds: float, seed: int, sr: int = 16000) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    voice = 0.2 * np.sin(2 * np.pi * (180 + 40 * seed) * t) * (np.sin(2 * np.pi * 2 * t) > 0)
+    return (voice + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+async def sequential(clips):
+    for clip in clips:
+        await inference_pool.transcribe(clip, language="ta", fp16=False)
+
+
+async def batched(clips, window_ms, max_size):
+    batcher = MicroBatcher(window_ms=window_ms, max_size=max_size)
+    await asyncio.gather(*(batcher.transcribe(c, language="ta") for c in clips))
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--speakers", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--clip-seconds", type=float, default=5.0)
+    parser.add_argument("--window-ms", type=float, default=100.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    await inference_pool.warm_up()
+    print(f"model={inference_pool.MODEL_NAME} clip={args.clip_seconds}s window={args.window_ms}ms")
+    for n in args.speakers:
+        clips = [synth_clip(args.clip_seconds, i) for i in range(n)]
+        timings = {}
+        for name, run in (("sequential", lambda: sequential(clips)),
+                          ("batched", lambda: batched(clips, args.window_ms, n))):
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                await run()
+            timings[name] = (time.perf_counter() - start) / args.rounds
+        audio_s = n * args.clip_seconds
+        print(f"{n:3d} speakers: sequential {audio_s / timings['sequential']:6.2f}x RT  "
+              f"batched {audio_s / timings['batched']:6.2f}x RT  "
+              f"gain {timings['sequential'] / timings['batched']:5.2f}x")
+    inference_pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+# benchmarks/bench_decode.py
+"""
+Compare the in-memory decode path with the temp-file path used by
+/api/transcribe_text: per-request latency and bytes written to disk.
+Whisper is not run; only decode + denoise, which is what differs.
+
+    python -m benchmarks.bench_decode --seconds 30 --runs 5
+    python -m benchmarks.bench_decode --input sample.webm
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import uuid
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from transcribe_utils import prepare_audio
+
+
+def synth_wav_bytes(seconds: float, sr: int = 44100) -> bytes:
+    # speech-like tone bursts over background noise, stereo like a browser capture
+    t = np.arange(int(seconds * sr)) / sr
+    tone = 0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    noise = 0.02 * np.random.default_rng(0).standard_normal(len(t))
+    mono = (tone + noise).astype(np.float32)
+    buf = BytesIO()
+    sf.write(buf, np.stack([mono, mono], axis=1), sr, format="WAV")
+    return buf.getvalue()
+
+
+def dir_bytes(path: str) -> int:
+    return sum(p.stat().st_size for p in Path(path).iterdir() if p.is_file())
+
+
+def run(raw: bytes, ext: str, in_memory: bool, runs: int, do_denoise: bool):
+    latencies = []
+    written = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as upload_dir:
+            start = time.perf_counter()
+            prepare_audio(raw, ext, str(uuid.uuid4()), upload_dir,
+                          do_denoise=do_denoise, in_memory=in_memory)
+            latencies.append(time.perf_counter() - start)
+            written.append(dir_bytes(upload_dir))
+    return latencies, written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="audio file to decode (default: synthetic WAV)")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-denoise", action="store_true")
+    args = parser.parse_args()
+
+    if args.input:
+        raw = Path(args.input).read_bytes()
+        ext = Path(args.input).suffix or ".webm"
+    else:
+        raw = synth_wav_bytes(args.seconds)
+        ext = ".wav"
+
+    print(f"input: {len(raw)} bytes ({ext}), runs={args.runs}, denoise={not args.no_denoise}")
+    for name, in_memory in (("temp files", False), ("in-memory", True)):
+        lat, written = run(raw, ext, in_memory, args.runs, not args.no_denoise)
+        print(f"{name:>10}: median {statistics.median(lat) * 1000:8.1f} ms  "
+              f"min {min(lat) * 1000:8.1f} ms  disk written {statistics.mean(written):12.0f} B/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/bench_denoise.py
+"""
+Denoise throughput (x real time), peak memory and output SNR: the previous
+noisereduce path (float64, first 0.5 s as noise profile, non-stationary)
+against the block-wise spectral gate in denoise.py.
+
+    python -m benchmarks.bench_denoise --seconds 60 600
+    python -m benchmarks.bench_denoise --seconds 3600 --skip-noisereduce
+
+The synthetic signal starts with speech-like tone bursts, which is where
+a first-0.5 s profile goes wrong.
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+import denoise
+from transcribe_utils import detect_speech
+
+RATE = 16000
+
+
+def synth(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * RATE), dtype=np.float32) / RATE
+    voiced = np.sin(2 * np.pi * 0.25 * t + 1) > 0
+    clean = (0.3 * voiced * (np.sin(2 * np.pi * 220 * t) + 0.5 * np.sin(2 * np.pi * 660 * t))).astype(np.float32)
+    noise = 0.03 * rng.standard_normal(len(t)).astype(np.float32)
+    return clean, clean + noise
+
+
+def old_noisereduce(data):
+    import noisereduce as nr
+    data = data.astype(np.float64)
+    noise = data[:int(0.5 * RATE)]
+    return nr.reduce_noise(y=data, sr=RATE, y_noise=noise)
+
+
+def spectral_gate(data):
+    data = data.copy()
+    profile = denoise.estimate_profile(data, RATE, detect_speech(data, RATE))
+    return denoise.denoise(data, RATE, profile)
+
+
+def snr_db(clean, out):
+    return 10 * np.log10(np.sum(clean.astype(np.float64) ** 2) / np.sum((out - clean).astype(np.float64) ** 2))
+
+
+def measure(fn, data):
+    tracemalloc.start()
+    start = time.perf_counter()
+    out = fn(data)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, nargs="+", default=[60, 600])
+    parser.add_argument("--skip-noisereduce", action="store_true")
+    args = parser.parse_args()
+
+    runs = [("spectral gate", spectral_gate)]
+    if not args.skip_noisereduce:
+        runs.insert(0, ("noisereduce", old_noisereduce))
+    print(f"{'audio s':>8} {'denoiser':<14} {'x realtime':>11} {'peak MB':>9} {'SNR dB':>7}")
+    for seconds in args.seconds:
+        clean, noisy = synth(seconds)
+        print(f"{seconds:8.0f} {'(input)':<14} {'':>11} {'':>9} {snr_db(clean, noisy):7.1f}")
+        for name, fn in runs:
+            out, elapsed, peak = measure(fn, noisy)
+            print(f"{seconds:8.0f} {name:<14} {seconds / elapsed:11.1f} {peak / 1e6:9.1f} {snr_db(clean, out):7.1f}")
+
+
+if __name__ == "__main__":
+    main()
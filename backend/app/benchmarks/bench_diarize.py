@@ -0,0 +1,135 @@
+# benchmarks/bench_diarize.py
+"""
+Diarization cost per audio hour and label quality on a synthetic meeting
+(harmonic "voices" with their own pitch and formants, taking turns).
+
+    whole file      embed + cluster the whole recording in one request
+    chunked         the same audio as a live session: one request per
+                    --chunk-s, each embedding only its own chunk and
+                    clustering into the shared session
+    rerun (before)  what re-diarizing everything received so far on every
+                    request costs over the same session
+    cached          a repeated upload: embeddings from transcript_cache,
+                    clustering only
+
+    python -m benchmarks.bench_diarize --minutes 60 --speakers 3
+    DIARIZE_MODEL_PATH=/models/wespeaker python -m benchmarks.bench_diarize --minutes 10
+
+Purity is the share of speech time whose label belongs to the true speaker
+that label mostly covers; "speakers" is how many labels were handed out.
+The embedder is chosen as in the service (DIARIZE_EMBEDDER / _MODEL_PATH).
+"""
+import argparse
+import time
+
+import numpy as np
+
+from diarization import Diarizer, SessionStore
+
+RATE = 16000
+# (pitch Hz, formant scale)
+VOICES = [(110, 1.0), (210, 1.18), (150, 0.9), (250, 1.3), (130, 1.1), (180, 0.95)]
+VOWELS = [(700, 1200, 2600), (300, 2300, 3000), (500, 900, 2500), (400, 1700, 2600)]
+
+
+def voice(seconds, pitch, scale, rng):
+    from scipy.signal import lfilter
+    n = int(seconds * RATE)
+    t = np.arange(n) / RATE
+    phase = np.cumsum(pitch * (1 + 0.08 * np.sin(2 * np.pi * 3 * t + rng.uniform(0, 6)))) / RATE
+    pulses = (np.diff(np.floor(phase), prepend=0) > 0).astype(np.float64)
+    out = np.zeros(n)
+    step = int(0.2 * RATE)
+    r = np.exp(-np.pi * 100 / RATE)
+    for i in range(0, n, step):
+        y = pulses[i:i + step]
+        for f in VOWELS[rng.integers(len(VOWELS))]:
+            theta = 2 * np.pi * f * scale / RATE
+            y = lfilter([1 - r], [1, -2 * r * np.cos(theta), r * r], y)
+        out[i:i + step] = y
+    out *= np.sin(2 * np.pi * 4 * t + rng.uniform(0, 6)) > -0.6   # syllables
+    return (0.3 * out / (np.max(np.abs(out)) + 1e-9)).astype(np.float32)
+
+
+def meeting(seconds, speakers, seed=0):
+    rng = np.random.default_rng(seed)
+    pieces, truth, pos = [], [], 0.0
+    while pos < seconds:
+        k, turn = int(rng.integers(speakers)), float(rng.uniform(2, 8))
+        pieces.append(voice(turn, *VOICES[k], rng))
+        truth.append((pos, pos + turn, k))
+        pause = float(rng.uniform(0.2, 0.8))
+        pieces.append(np.zeros(int(pause * RATE), dtype=np.float32))
+        pos += turn + pause
+    audio = np.concatenate(pieces)
+    audio += 0.003 * rng.standard_normal(len(audio)).astype(np.float32)
+    return audio, truth
+
+
+def score(turns, truth):
+    starts = np.array([s for s, _, _ in truth])
+    ref, hyp = [], []
+    for turn in turns:
+        for t in np.arange(turn["start"], turn["end"], 0.1):
+            i = np.searchsorted(starts, t, side="right") - 1
+            if i >= 0 and t < truth[i][1]:
+                ref.append(truth[i][2])
+                hyp.append(turn["speaker"])
+    ref, hyp = np.array(ref), np.array(hyp)
+    labels = set(hyp.tolist())
+    purity = sum(np.bincount(ref[hyp == h]).max() for h in labels) / max(len(ref), 1)
+    return purity, len(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=60)
+    parser.add_argument("--speakers", type=int, default=3)
+    parser.add_argument("--chunk-s", type=float, default=60)
+    parser.add_argument("--rerun-chunks", type=int, default=20,
+                        help="requests to time for the rerun baseline (it grows quadratically)")
+    args = parser.parse_args()
+
+    seconds = args.minutes * 60
+    audio, truth = meeting(seconds, args.speakers)
+    hours = len(audio) / RATE / 3600
+    chunk = int(args.chunk_s * RATE)
+    diarizer = Diarizer(sessions=SessionStore(""))
+    diarizer.embedder  # load the model outside the timings
+    print(f"{len(audio) / RATE / 60:.1f} min, {args.speakers} speakers, embedder {diarizer.name}\n")
+    print(f"{'method':<16} {'s / audio h':>12} {'x realtime':>11} {'purity':>7} {'speakers':>9}")
+
+    def row(name, elapsed, turns=None, audio_hours=hours):
+        purity, found = score(turns, truth) if turns is not None else (None, None)
+        print(f"{name:<16} {elapsed / audio_hours:12.1f} {audio_hours * 3600 / elapsed:11.0f}"
+              + (f" {purity:7.3f} {found:9d}" if turns is not None else ""))
+
+    start = time.perf_counter()
+    windows = diarizer.embed(audio)
+    embedded = time.perf_counter() - start
+    turns = diarizer.assign("whole", windows, key="whole")
+    whole = time.perf_counter() - start
+    row("whole file", whole, turns)
+
+    start = time.perf_counter()
+    turns = []
+    for i in range(0, len(audio), chunk):
+        part = diarizer.embed(audio[i:i + chunk]).shifted(i / RATE)
+        turns += diarizer.assign("chunked", part, key=f"chunk-{i}")
+    row("chunked", time.perf_counter() - start, turns)
+
+    # before: every request re-diarized all audio so far; timed over the first requests
+    n = min(args.rerun_chunks, -(-len(audio) // chunk))
+    start = time.perf_counter()
+    for i in range(1, n + 1):
+        diarizer.assign(None, diarizer.embed(audio[:i * chunk]))
+    row("rerun (before)", time.perf_counter() - start, audio_hours=min(n * chunk, len(audio)) / RATE / 3600)
+
+    start = time.perf_counter()
+    turns = diarizer.assign("whole", windows, key="whole")
+    row("cached", time.perf_counter() - start, turns)
+    print(f"\n{len(windows)} windows; embedding is {embedded / whole * 100:.0f}% of the whole-file time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_export.py
+"""
+Export time and peak Python memory: the old python-docx build (document in
+memory, saved to a temp file) against export_stream for each format.
+
+    python -m benchmarks.bench_export --segments 1000 10000 100000
+    python -m benchmarks.bench_export --segments 100000 --docx-limit 10000
+
+Python-docx is skipped above --docx-limit segments (it takes minutes there).
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from exports import DEFAULT_TITLE, EXPORT_FORMATS, export_stream
+
+WORDS = "வணக்கம் இன்று கூட்டம் நூலகம் திட்டம் முடிவு அடுத்த வாரம் பட்ஜெட் குழு".split()
+
+
+def segments(n, seed=0):
+    rng = random.Random(seed)
+    return [{"speaker": f"Speaker {i % 4 + 1}", "start": i * 2.0, "end": i * 2.0 + 1.8,
+             "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 20)))}
+            for i in range(n)]
+
+
+def python_docx(segs):
+    from docx import Document
+    doc = Document()
+    doc.add_heading(DEFAULT_TITLE, level=1)
+    for seg in segs:
+        p = doc.add_paragraph()
+        p.add_run(f"{seg['speaker']} [{seg['start']:.2f}s - {seg['end']:.2f}s]\n").bold = True
+        p.add_run(seg["text"] + "\n\n")
+    fd, path = tempfile.mkstemp(suffix=".docx")
+    os.close(fd)
+    doc.save(path)
+    with open(path, "rb") as f:
+        size = len(f.read())
+    os.remove(path)
+    return size
+
+
+def streamed(segs, fmt):
+    return sum(len(block) for block in export_stream(segs, fmt))
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--docx-limit", type=int, default=10000,
+                        help="skip python-docx above this many segments")
+    args = parser.parse_args()
+
+    print(f"{'segments':>9} {'exporter':<14} {'seconds':>9} {'peak MB':>9} {'size MB':>9}")
+    for n in args.segments:
+        segs = segments(n)
+        runs = [("python-docx", python_docx, (segs,))] if n <= args.docx_limit else []
+        runs += [(f"stream {fmt}", streamed, (segs, fmt)) for fmt in EXPORT_FORMATS]
+        for name, fn, fn_args in runs:
+            seconds, peak, size = measure(fn, *fn_args)
+            print(f"{n:>9} {name:<14} {seconds:9.3f} {peak / 1e6:9.1f} {size / 1e6:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
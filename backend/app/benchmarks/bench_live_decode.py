@@ -0,0 +1,123 @@
+# benchmarks/bench_live_decode.py
+"""
+Per-chunk decode latency for live-room audio_blob chunks (MediaRecorder
+WebM/Opus cut every few seconds; only the first chunk has the header).
+
+    ffmpeg per chunk one ffmpeg process per chunk, header re-sent with every
+                     chunk so it can decode (the old pydub path, without its
+                     ffprobe call and WAV round trip)
+    pyav per chunk   decode_bytes on header + chunk, in process
+    stream pyav      StreamDecoders: persistent demuxer + Opus decoder
+    stream ffmpeg    StreamDecoders: long-lived ffmpeg worker per stream
+
+    python -m benchmarks.bench_live_decode --seconds 120 --chunk-s 3
+    python -m benchmarks.bench_live_decode --input recording.webm
+
+Without --input a test stream is encoded with PyAV. The ffmpeg methods
+are skipped when there is no ffmpeg binary.
+"""
+import argparse
+import shutil
+import statistics
+import time
+from io import BytesIO
+
+import numpy as np
+
+import decoding
+
+
+def synth_webm(seconds, rate=48000):
+    t = np.arange(int(seconds * rate)) / rate
+    return encode_webm((0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)).astype(np.float32),
+                       rate)
+
+
+def encode_webm(signal, rate=48000, cluster_s=None):
+    # mono float32 -> WebM/Opus bytes, in 20 ms frames like MediaRecorder
+    # (which starts a Cluster per timeslice; set cluster_s to match)
+    import av
+    buf = BytesIO()
+    options = {"cluster_time_limit": str(int(cluster_s * 1000))} if cluster_s else {}
+    with av.open(buf, "w", format="webm", options=options) as out:
+        stream = out.add_stream("libopus", rate=rate, layout="mono")
+        for i in range(0, len(signal), 960):
+            frame = av.AudioFrame.from_ndarray(signal[None, i:i + 960], format="fltp", layout="mono")
+            frame.sample_rate, frame.pts = rate, i
+            for packet in stream.encode(frame):
+                out.mux(packet)
+        for packet in stream.encode(None):
+            out.mux(packet)
+    return buf.getvalue()
+
+
+def split(raw, seconds, chunk_s):
+    # cut at the first Cluster after every chunk_s worth of bytes, as
+    # MediaRecorder's timeslice does, so each chunk decodes after a header
+    step = max(int(len(raw) / seconds * chunk_s), 1)
+    cuts, pos = [0], raw.find(decoding._CLUSTER_ID)
+    while pos >= 0:
+        if pos - cuts[-1] >= step:
+            cuts.append(pos)
+        pos = raw.find(decoding._CLUSTER_ID, pos + 1)
+    return [raw[a:b] for a, b in zip(cuts, cuts[1:] + [len(raw)])]
+
+
+def ffmpeg_chunk(header, chunk, first):
+    return decoding._decode_ffmpeg("pipe:0", 16000, chunk if first else header + chunk)
+
+
+def pyav_chunk(header, chunk, first):
+    return decoding._decode_pyav(BytesIO(chunk if first else header + chunk), 16000)
+
+
+def streamed(mode):
+    decoders = decoding.StreamDecoders(mode=mode)
+    seq = iter(range(1 << 30))
+    return lambda header, chunk, first: decoders.decode("bench", next(seq), chunk)
+
+
+def run(name, decode, header, chunks):
+    latencies, samples = [], 0
+    for i, chunk in enumerate(chunks):
+        start = time.perf_counter()
+        samples += len(decode(header, chunk, i == 0))
+        latencies.append((time.perf_counter() - start) * 1000)
+    total = sum(latencies) / 1000
+    q = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else latencies * 19
+    print(f"{name:<16} {statistics.median(latencies):8.2f} {q[18]:8.2f} {max(latencies):8.2f}"
+          f" {samples / 16000:9.1f} {samples / 16000 / total if total else 0:11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="a WebM/Opus recording to cut into chunks")
+    parser.add_argument("--seconds", type=float, default=120)
+    parser.add_argument("--chunk-s", type=float, default=3.0)
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, "rb") as f:
+            raw = f.read()
+        seconds = len(decoding.decode_bytes(raw)) / 16000
+    else:
+        raw, seconds = synth_webm(args.seconds), args.seconds
+    chunks = split(raw, seconds, args.chunk_s)
+    header = raw[:raw.find(decoding._CLUSTER_ID)]
+    print(f"{len(chunks)} chunks of ~{args.chunk_s:g} s, header {len(header)} bytes\n")
+
+    methods = []
+    have_ffmpeg = shutil.which("ffmpeg") is not None
+    if have_ffmpeg:
+        methods.append(("ffmpeg per chunk", ffmpeg_chunk))
+    methods += [("pyav per chunk", pyav_chunk), ("stream pyav", streamed("pyav"))]
+    if have_ffmpeg:
+        methods.append(("stream ffmpeg", streamed("ffmpeg")))
+
+    print(f"{'method':<16} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'audio s':>9} {'x realtime':>11}")
+    for name, decode in methods:
+        run(name, decode, header, chunks)
+
+
+if __name__ == "__main__":
+    main()
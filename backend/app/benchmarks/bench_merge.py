@@ -0,0 +1,87 @@
+# benchmarks/bench_merge.py
+"""
+merge() micro-benchmark: the vectorised interval merge against the original
+all-pairs loop, on synthetic meetings. Also checks both give the same output.
+
+    python -m benchmarks.bench_merge --segments 10000 --turns 10000
+"""
+import argparse
+import random
+import time
+
+from merge_utils import merge
+
+
+def merge_reference(whisper_segments, diarization_list=None):
+    # the original O(S*D log D) implementation from main.py
+    merged = []
+    speaker_map = {}
+    for seg in whisper_segments:
+        s_start = seg.get("start", 0.0)
+        s_end = seg.get("end", 0.0)
+        text = seg.get("text", "").strip()
+        label = None
+        if diarization_list:
+            overlaps = []
+            for d in diarization_list:
+                overlap = max(0.0, min(s_end, d["end"]) - max(s_start, d["start"]))
+                if overlap > 0:
+                    overlaps.append((overlap, d["speaker"]))
+            if overlaps:
+                overlaps.sort(reverse=True)
+                label = overlaps[0][1]
+        if label is None:
+            bucket = int(s_start // 30) + 1
+            label = f"Speaker_{bucket}"
+        if label not in speaker_map:
+            speaker_map[label] = f"பேச்சாளர் {len(speaker_map)+1}"
+        merged.append({"speaker": speaker_map[label], "start": s_start, "end": s_end, "text": text})
+    return merged
+
+
+def timeline(n, duration, speakers, seed, gaps=True):
+    rng = random.Random(seed)
+    step = duration / n
+    out = []
+    for i in range(n):
+        start = i * step + (rng.uniform(0, step * 0.3) if gaps else 0.0)
+        end = (i + 1) * step + rng.uniform(-step * 0.2, step * 0.5)
+        out.append({"start": start, "end": max(start, end),
+                    "speaker": f"SPEAKER_{rng.randrange(speakers):02d}", "text": f" seg {i} "})
+    return out
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=10000)
+    parser.add_argument("--hours", type=float, default=3.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-reference", action="store_true", help="skip the slow all-pairs loop")
+    args = parser.parse_args()
+
+    duration = args.hours * 3600
+    segments = timeline(args.segments, duration, 1, seed=1)
+    turns = timeline(args.turns, duration, 6, seed=2)
+    # a diarization gap so the 30 s bucket fallback is exercised too
+    turns = [t for t in turns if not (600 <= t["start"] < 700)]
+
+    fast, out = best_of(lambda: merge(segments, turns), args.repeat)
+    print(f"vectorised merge {args.segments}x{len(turns)}: {fast * 1000:9.1f} ms")
+    if not args.skip_reference:
+        slow, ref = best_of(lambda: merge_reference(segments, turns), 1)
+        print(f"reference merge  {args.segments}x{len(turns)}: {slow * 1000:9.1f} ms  ({slow / fast:.0f}x slower)")
+        print("outputs identical:", out == ref)
+
+
+if __name__ == "__main__":
+    main()
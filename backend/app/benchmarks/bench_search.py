@@ -0,0 +1,140 @@
+# benchmarks/bench_search.py
+"""
+Transcript search at scale: build time and size of the search_index.py
+index over --words synthetic Tamil words, then query latency by query type,
+against rescanning the stored segment lists (what finding a topic took
+before there was an index).
+
+    python -m benchmarks.bench_search --words 1000000
+    python -m benchmarks.bench_search --words 2000000 --prefix "" --no-ngram
+
+Results are newest first except "ranked" (BM25, which scores every match).
+Words are made of random Tamil syllables with a Zipf-like frequency, plus
+case endings (கு, இல், உடன், ...) so prefix queries have stems to find.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from search_index import SearchIndex, Query, tokenize
+
+CONSONANTS = "கஙசஞடணதநபமயரலவழளறன"
+VOWEL_SIGNS = ["", "ா", "ி", "ீ", "ு", "ூ", "ெ", "ே", "ை", "ொ", "ோ", "்"]
+ENDINGS = ["", "", "", "க்கு", "யில்", "உடன்", "கள்", "த்தை", "ஆல்"]
+WORDS_PER_SEGMENT = 14
+
+
+def vocabulary(size, rng):
+    vocab = set()
+    while len(vocab) < size:
+        n = int(rng.integers(2, 5))
+        vocab.add("".join(CONSONANTS[rng.integers(len(CONSONANTS))] + VOWEL_SIGNS[rng.integers(len(VOWEL_SIGNS))]
+                          for _ in range(n)))
+    return sorted(vocab)
+
+
+def make_segments(total_words, vocab_size, seed=0):
+    rng = np.random.default_rng(seed)
+    stems = vocabulary(vocab_size, rng)
+    ranks = np.arange(1, len(stems) + 1)
+    p = 1 / ranks ** 1.1
+    p /= p.sum()
+    picks = rng.choice(len(stems), size=total_words, p=p)
+    endings = rng.integers(len(ENDINGS), size=total_words)
+    words = [stems[i] + ENDINGS[e] for i, e in zip(picks, endings)]
+    segments, t = [], 0.0
+    for i in range(0, total_words, WORDS_PER_SEGMENT):
+        chunk = words[i:i + WORDS_PER_SEGMENT]
+        start = t
+        timed = []
+        for w in chunk:
+            timed.append({"word": " " + w, "start": t, "end": t + 0.35})
+            t += 0.4
+        segments.append({"speaker": f"பேச்சாளர் {1 + i // WORDS_PER_SEGMENT % 4}", "start": start, "end": t,
+                         "text": " ".join(chunk), "words": timed})
+        t += 0.5
+    return segments, stems, p
+
+
+def scan(segments, query):
+    # before: every stored segment's text searched in turn (plain containment,
+    # so this is a lower bound for any tokenised rescan)
+    terms = [t for t, _ in query.terms] if query.mode != "substring" else [query.text]
+    return [seg for seg in segments if all(t in seg["text"] for t in terms)][:20]
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), max(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=1_000_000)
+    parser.add_argument("--vocab", type=int, default=50_000)
+    parser.add_argument("--sessions", type=int, default=200, help="transcripts the words are spread over")
+    parser.add_argument("--prefix", default="2 3", help='FTS5 prefix index lengths ("" for none)')
+    parser.add_argument("--no-ngram", action="store_true")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip-scan", action="store_true")
+    args = parser.parse_args()
+
+    segments, stems, p = make_segments(args.words, args.vocab)
+    path = os.path.join(tempfile.mkdtemp(), "search.sqlite3")
+    index = SearchIndex(path, prefix=args.prefix, ngram=not args.no_ngram)
+
+    start = time.perf_counter()
+    per_session = -(-len(segments) // args.sessions)
+    for i in range(0, len(segments), per_session):
+        index.add("upload", f"session-{i // per_session}", segments[i:i + per_session])
+    build = time.perf_counter() - start
+    size = sum(os.path.getsize(path + ext) for ext in ("", "-wal") if os.path.exists(path + ext))
+    print(f"{args.words:,} words in {len(segments):,} segments, {args.sessions} sessions; "
+          f"prefix index {args.prefix or 'none'!r}, trigrams {'off' if args.no_ngram else 'on'}")
+    print(f"indexed in {build:.1f} s ({args.words / build:,.0f} words/s), {size / 1e6:.0f} MB on disk")
+
+    # one live segment appended to an index of this size
+    live = [{"speaker": "பேச்சாளர் 1", "start": 0, "end": 3, "text": segments[0]["text"]}]
+    append_ms, _ = timed(lambda: index.add("room", "live-room", live), args.repeat)
+    print(f"live append: {append_ms:.2f} ms per segment\n")
+
+    common, mid, rare = stems[0], stems[len(stems) // 20], stems[-1]
+    phrase = " ".join(segments[len(segments) // 2]["text"].split()[3:5])
+    queries = [
+        ("common word", common, "all"),
+        ("mid word", mid, "all"),
+        ("rare word", rare, "all"),
+        ("two words", f"{common} {mid}", "all"),
+        ("phrase", phrase, "phrase"),
+        ("prefix", stems[1][:2] + "*", "all"),
+        ("substring", tokenize(mid)[0][1:4], "substring"),
+        ("in session", common, "all"),
+        ("ranked", common, "all"),
+    ]
+    print(f"{'query':<12} {'hits':>5} {'p50 ms':>8} {'max ms':>8} {'scan p50 ms':>12}")
+    for name, text, mode in queries:
+        if mode == "substring" and args.no_ngram:
+            continue
+        session = "session-7" if name == "in session" else None
+        order = "rank" if name == "ranked" else "recent"
+        result = index.search(text, mode, session=session, order=order)
+        p50, worst = timed(lambda: index.search(text, mode, session=session, order=order), args.repeat)
+        line = f"{name:<12} {len(result['hits']):5d} {p50:8.2f} {worst:8.2f}"
+        if not args.skip_scan:
+            query = Query(text, mode)
+            scan_ms, _ = timed(lambda: scan(segments, query), 1)
+            line += f" {scan_ms:12.0f}"
+        print(line)
+    print(f"\n{index.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/bench_startup.py
+"""
+Startup time and resident memory of the services, shared vs separate models.
+
+For each launch mode the services are started as in app.py; the script
+records when each one first answers /health (process up, imports done) and
+/ready (model loaded), then the RSS of every server including its inference
+worker processes. RSS is read from /proc, so this runs on Linux only.
+
+    python -m benchmarks.bench_startup --modes separate shared --model small
+
+To see what the lazy imports buy, run it against the parent commit too.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+SERVICES = [("main:app", 8001), ("room.transcription_service:app", 8000)]
+INFERENCE = ("inference_service:app", 8002)
+
+
+def rss_mb(pid):
+    # resident memory of pid and all its descendants
+    total = 0
+    stack = [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            for line in Path(f"/proc/{p}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+            for task in Path(f"/proc/{p}/task").iterdir():
+                stack.extend(int(c) for c in (task / "children").read_text().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total / 1024
+
+
+def status(port, route):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{route}", timeout=1) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception:
+        return None
+
+
+def import_seconds(module):
+    # cold import of a service module in a fresh interpreter
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR, capture_output=True, text=True)
+    return float(out.stdout.strip()) if out.returncode == 0 else None
+
+
+def run_mode(mode, model, timeout):
+    env = dict(os.environ, WHISPER_MODEL=model)
+    env.pop("INFERENCE_URL", None)
+    apps = list(SERVICES)
+    procs = {}
+    if mode == "shared":
+        apps.insert(0, INFERENCE)
+    start = time.perf_counter()
+    for module, port in apps:
+        proc_env = dict(env)
+        if mode == "shared" and module != INFERENCE[0]:
+            proc_env["INFERENCE_URL"] = f"http://127.0.0.1:{INFERENCE[1]}"
+        procs[module] = (port, subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"], cwd=APP_DIR, env=proc_env))
+
+    report = {}
+    pending = dict(procs)
+    try:
+        while pending and time.perf_counter() - start < timeout:
+            for module, (port, proc) in list(pending.items()):
+                row = report.setdefault(module, {"health_s": None, "ready_s": None})
+                if proc.poll() is not None:
+                    row["error"] = f"exited with {proc.returncode}"
+                    del pending[module]
+                    continue
+                if row["health_s"] is None and status(port, "/health") == 200:
+                    row["health_s"] = time.perf_counter() - start
+                if row["health_s"] is not None and status(port, "/ready") == 200:
+                    row["ready_s"] = time.perf_counter() - start
+                    del pending[module]
+            time.sleep(0.05)
+        for module, (port, proc) in procs.items():
+            report[module]["rss_mb"] = rss_mb(proc.pid)
+    finally:
+        for _, proc in procs.values():
+            proc.terminate()
+        for _, proc in procs.values():
+            proc.wait()
+    report["total_rss_mb"] = sum(r["rss_mb"] for r in report.values() if isinstance(r, dict))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", default=["separate", "shared"], choices=["separate", "shared"])
+    parser.add_argument("--model", default=os.getenv("WHISPER_MODEL", "small"))
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--json", help="write the results here as well")
+    args = parser.parse_args()
+
+    results = {"imports": {m: import_seconds(m) for m in ("main", "room.transcription_service")}}
+    for module, seconds in results["imports"].items():
+        print(f"import {module:<32} {seconds if seconds is None else f'{seconds:.2f}s'}")
+    for mode in args.modes:
+        report = run_mode(mode, args.model, args.timeout)
+        results[mode] = report
+        print(f"\n{mode}  (total RSS {report['total_rss_mb']:.0f} MB)")
+        for module, row in report.items():
+            if isinstance(row, dict):
+                fmt = lambda v: "-" if v is None else f"{v:.2f}s"
+                print(f"  {module:<34} health {fmt(row['health_s']):>8}  ready {fmt(row['ready_s']):>8}"
+                      f"  rss {row['rss_mb']:.0f} MB {row.get('error', '')}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# benchmarks/bench_suite.py
+"""
+Regression suite: per-call latency of the transcription path's building
+blocks, run in process with the stub Whisper backend (see whisper_backends.py),
+so it needs no model and the numbers only move when our code does.
+
+    merge                     merge_utils.merge, --segments x diarization turns
+    build_docx_from_segments  --segments to a .docx file
+    transcribe_text upload    main.py POST /api/transcribe_text, --clip-s WAV
+    transcribe_text blob      transcription service POST /api/transcribe_text,
+                              one live-room WebM chunk of a continuing stream
+                              (includes the batcher's BATCH_WINDOW_MS wait)
+
+    python -m benchmarks.bench_suite --json suite.json
+    python -m benchmarks.bench_suite --only merge build_docx_from_segments --repeat 200
+
+The transcript cache is off so every call does the full work. For the
+Socket.IO audio_blob flow under load see benchmarks/load_rooms.py.
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+# before any app module reads them
+os.environ.setdefault("WHISPER_BACKEND", "stub")
+os.environ.setdefault("WHISPER_MODEL", "stub")
+os.environ.setdefault("WHISPER_WORKERS", "0")
+os.environ.setdefault("TRANSCRIPT_CACHE", "0")
+os.environ.setdefault("SEARCH_INDEX", "0")
+
+RATE = 16000
+BENCHMARKS = ("merge", "build_docx_from_segments", "transcribe_text upload", "transcribe_text blob")
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {"p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3),
+            "max": round(float(values.max()), 3), "mean": round(float(values.mean()), 3)}
+
+
+def speech(seconds, seed=0):
+    # a harmonic "voice" with syllables (see bench_diarize), so VAD keeps it
+    from benchmarks.bench_diarize import VOICES, voice
+    rng = np.random.default_rng(seed)
+    return voice(seconds, *VOICES[seed % len(VOICES)], rng)
+
+
+def live_blobs(seconds, chunk_s, seed=0):
+    """
+    A speaker's recording as audio_blob chunks: 48 kHz WebM/Opus with one
+    Cluster per chunk_s timeslice, cut at every Cluster like MediaRecorder.
+    """
+    from benchmarks.bench_live_decode import encode_webm, split
+    audio = speech(seconds, seed)
+    audio = np.interp(np.arange(len(audio) * 3) / 3, np.arange(len(audio)), audio).astype(np.float32)
+    blobs = split(encode_webm(audio, cluster_s=chunk_s), seconds, 0)
+    # the header goes out with the first timeslice
+    return [blobs[0] + blobs[1]] + blobs[2:]
+
+
+def wav_bytes(audio):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+    return buf.getvalue()
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    cpu = time.process_time()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    wall = time.perf_counter() - start
+    return {"calls": repeat, "latency_ms": percentiles(times), "calls_per_s": round(repeat / wall, 2),
+            "cpu_ms_per_call": round((time.process_time() - cpu) * 1000 / repeat, 3)}
+
+
+def bench_merge(args):
+    from merge_utils import merge
+    from benchmarks.bench_merge import timeline
+    duration = args.segments * 4.0
+    segments = timeline(args.segments, duration, 1, seed=1)
+    turns = timeline(args.segments // 2, duration, 4, seed=2)
+    return measure(lambda: merge(segments, turns), args.repeat)
+
+
+def bench_docx(args):
+    from docx_utils import build_docx_from_segments
+    from benchmarks.bench_export import segments
+    segs = segments(args.segments)
+    path = os.path.join(tempfile.mkdtemp(), "bench.docx")
+    result = measure(lambda: build_docx_from_segments(segs, path), args.repeat)
+    result["bytes"] = os.path.getsize(path)
+    return result
+
+
+def bench_upload(args):
+    from fastapi.testclient import TestClient
+    import main
+    raw = wav_bytes(speech(args.clip_s))
+    form = {"language": "ta", "do_denoise": "false", "do_diarize": "false"}
+    with TestClient(main.app) as client:
+        def call():
+            r = client.post("/api/transcribe_text", files={"audio": ("clip.wav", raw, "audio/wav")}, data=form)
+            assert r.status_code == 200, r.text
+        result = measure(call, max(1, args.repeat // 5))
+    result["audio_s"] = args.clip_s
+    return result
+
+
+def bench_blob(args):
+    from fastapi.testclient import TestClient
+    from room import transcription_service
+    chunks = live_blobs(args.stream_s, args.chunk_s, seed=1)
+    state = {"stream": 0, "seq": 0}
+
+    with TestClient(transcription_service.app) as client:
+        def call():
+            # a new stream whenever the recording runs out
+            if state["seq"] == len(chunks):
+                state["stream"] += 1
+                state["seq"] = 0
+            data = {"do_denoise": "false", "do_diarize": "false", "stream_key": f"bench:{state['stream']}",
+                    "stream_seq": str(state["seq"]), "stream_gap": "false"}
+            r = client.post("/api/transcribe_text",
+                            files={"audio": ("chunk.webm", chunks[state["seq"]], "audio/webm")}, data=data)
+            assert r.status_code == 200, r.text
+            state["seq"] += 1
+        result = measure(call, args.repeat, warmup=0)
+    result["audio_s"] = args.chunk_s
+    return result
+
+
+RUNNERS = {
+    "merge": bench_merge,
+    "build_docx_from_segments": bench_docx,
+    "transcribe_text upload": bench_upload,
+    "transcribe_text blob": bench_blob,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--segments", type=int, default=1000, help="for merge and the DOCX")
+    parser.add_argument("--clip-s", type=float, default=30.0, help="upload length")
+    parser.add_argument("--stream-s", type=float, default=60.0, help="live recording cut into blobs")
+    parser.add_argument("--chunk-s", type=float, default=3.0)
+    parser.add_argument("--json", help="write the results here as well")
+    args = parser.parse_args()
+
+    results = {"config": {k: v for k, v in vars(args).items() if k != "json"},
+               "backend": os.environ["WHISPER_BACKEND"], "benchmarks": {}}
+    print(f"{'benchmark':<26} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'calls/s':>9} {'cpu ms':>8}")
+    for name in args.only:
+        r = RUNNERS[name](args)
+        results["benchmarks"][name] = r
+        lat = r["latency_ms"]
+        print(f"{name:<26} {r['calls']:6d} {lat['p50']:9.2f} {lat['p95']:9.2f} {lat['p99']:9.2f}"
+              f" {r['calls_per_s']:9.1f} {r['cpu_ms_per_call']:8.2f}")
+    # ru_maxrss is KB on Linux
+    results["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(f"\npeak RSS {results['peak_rss_mb']:.0f} MB")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_translate.py
+"""
+Translation latency for one transcript: one request per segment in sequence
+(the old translate_segments loop) against the batched, concurrent
+Translator, cold and then warm (cache hits).
+
+    python -m benchmarks.bench_translate --engine nllb --segments 200 --target hi
+    python -m benchmarks.bench_translate --engine google --segments 500
+
+--engine nllb runs fully offline once the model is on disk
+(TRANSLATE_MODEL may point at a local directory).
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from translation import Translator
+
+WORDS = ("the meeting will start after the budget review and the team will share "
+         "their progress on the new library project before lunch").split()
+
+
+def sentences(n, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 16))).capitalize() + "."
+            for _ in range(n)]
+
+
+async def run(args):
+    texts = sentences(args.segments)
+
+    translator = Translator(args.engine)
+    start = time.perf_counter()
+    if not args.skip_serial:
+        for text in texts[:args.serial_limit]:
+            await translator.engine.translate_batch([text], "auto", args.target)
+        serial = (time.perf_counter() - start) * len(texts) / min(len(texts), args.serial_limit)
+        print(f"per-segment, serial     {serial:8.2f} s  ({len(texts)} requests"
+              f"{', extrapolated' if args.serial_limit < len(texts) else ''})")
+
+    # fresh translator so the batched run starts with an empty cache
+    await translator.close()
+    translator = Translator(args.engine)
+    _, cold = await translator.translate_texts(texts, args.target)
+    print(f"batched, cold cache     {cold['seconds']:8.2f} s  ({cold['requests']} requests)")
+    _, warm = await translator.translate_texts(texts, args.target)
+    print(f"batched, warm cache     {warm['seconds'] * 1000:8.2f} ms ({warm['cache_hits']} cache hits)")
+    await translator.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", default="nllb", choices=["google", "nllb"])
+    parser.add_argument("--segments", type=int, default=200)
+    parser.add_argument("--target", default="hi")
+    parser.add_argument("--serial-limit", type=int, default=50,
+                        help="time this many per-segment requests and extrapolate")
+    parser.add_argument("--skip-serial", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
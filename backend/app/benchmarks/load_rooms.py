@@ -0,0 +1,305 @@
+# benchmarks/load_rooms.py
+"""
+End-to-end load test of live rooms: --rooms x --speakers Socket.IO clients,
+each sending its own WebM/Opus recording as audio_blob chunks (cut like
+MediaRecorder's timeslice) to the room server, which forwards them to the
+transcription service. Both servers are started here as subprocesses
+(room.main:socket_app and room.transcription_service:app) with the stub
+Whisper backend, so the test runs offline and only measures our code; use
+--backend env to keep WHISPER_BACKEND / WHISPER_MODEL from the environment.
+
+    python -m benchmarks.load_rooms --rooms 4 --speakers 3 --seconds 60
+    python -m benchmarks.load_rooms --rooms 20 --speakers 4 --speed 2 --json load.json
+    python -m benchmarks.load_rooms --stub-rtf 0.1 --workers 2   # model time per audio second
+
+Speakers send in real time (--speed 2 sends twice as fast). Latency is from
+sending a blob to the first new_transcript carrying its seq (audio_blob
+acknowledges with the seq); the last blob of each recording is the encoder's
+final few ms and normally gets none. RSS and CPU cover each server's process tree,
+inference workers included, and are read from /proc (Linux only; null
+elsewhere). --json writes config and results for diffing between runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.bench_suite import live_blobs, percentiles
+
+
+# ------------------- servers ------------------- #
+def start_server(target, port, env, log):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(port, proc, timeout=60):
+    import aiohttp
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server on port {port} exited with {proc.returncode}")
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/docs") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server on port {port} not ready after {timeout}s")
+
+
+def _proc_stat(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # after the command name: state ppid ... utime(11) stime(12) ... rss(21)
+    return int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[21])
+
+
+def tree_usage(root):
+    """
+    (rss bytes, cpu seconds) of root and all its descendants, or None
+    without /proc.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    stats = {}
+    for name in os.listdir("/proc"):
+        if name.isdigit():
+            try:
+                stats[int(name)] = _proc_stat(name)
+            except (OSError, IndexError, ValueError):
+                pass
+    members, frontier = {root}, [root]
+    while frontier:
+        parent = frontier.pop()
+        for pid, (ppid, _, _) in stats.items():
+            if ppid == parent and pid not in members:
+                members.add(pid)
+                frontier.append(pid)
+    ticks, page = os.sysconf("SC_CLK_TCK"), os.sysconf("SC_PAGE_SIZE")
+    used = [stats[pid] for pid in members if pid in stats]
+    return sum(rss for _, _, rss in used) * page, sum(cpu for _, cpu, _ in used) / ticks
+
+
+class Sampler:
+    # peak/mean RSS and CPU time of each server while the load runs
+    def __init__(self, procs, interval=0.5):
+        self.procs = procs
+        self.interval = interval
+        self.rss = {name: [] for name in procs}
+        self.cpu_start = {}
+        self.cpu_end = {}
+
+    def _sample(self):
+        out = {}
+        for name, proc in self.procs.items():
+            usage = tree_usage(proc.pid)
+            if usage is not None:
+                self.rss[name].append(usage[0])
+                out[name] = usage[1]
+        return out
+
+    async def run(self):
+        self.cpu_start = self._sample()
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                self.cpu_end = self._sample()
+        except asyncio.CancelledError:
+            self.cpu_end = self._sample()
+
+    def results(self, wall):
+        out = {}
+        for name in self.procs:
+            if not self.rss[name]:
+                out[name] = {"rss_peak_mb": None, "rss_mean_mb": None, "cpu_s": None, "cpu_percent": None}
+                continue
+            cpu = self.cpu_end[name] - self.cpu_start[name]
+            out[name] = {"rss_peak_mb": round(max(self.rss[name]) / 2 ** 20, 1),
+                         "rss_mean_mb": round(float(np.mean(self.rss[name])) / 2 ** 20, 1),
+                         "cpu_s": round(cpu, 2), "cpu_percent": round(100 * cpu / wall, 1)}
+        return out
+
+
+# ------------------- clients ------------------- #
+class Speaker:
+    def __init__(self, url, room_id, index, chunks, chunk_s, speed, denoise):
+        self.url = url
+        self.room_id = room_id
+        self.user_id = f"{room_id}-u{index}"
+        self.chunks = chunks
+        self.interval = chunk_s / speed
+        self.denoise = denoise
+        self.sent = {}          # seq -> send time
+        self.received = {}      # seq -> first new_transcript time
+        self.last = 0.0         # last blob sent or transcript received
+        self.dropped = 0
+        self.backpressure = 0
+        self.transcripts = 0
+        self.errors = 0
+
+    async def run(self, start, drain_s):
+        import socketio
+        sio = socketio.AsyncClient(reconnection=False)
+
+        @sio.on("new_transcript")
+        async def on_transcript(data):
+            if data.get("userId") == self.user_id and "seq" in data:
+                self.transcripts += 1
+                self.last = time.perf_counter()
+                self.received.setdefault(data["seq"], self.last)
+
+        @sio.on("ingest_backpressure")
+        async def on_backpressure(data):
+            self.backpressure += 1
+
+        await sio.connect(self.url, transports=["websocket"])
+        meta = {"roomId": self.room_id, "userId": self.user_id, "userName": self.user_id,
+                "filename": "chunk.webm", "doDenoise": self.denoise}
+        await sio.emit("join", {"roomId": self.room_id, "userId": self.user_id, "userName": self.user_id})
+        for i, chunk in enumerate(self.chunks):
+            # on a fixed schedule, so slow acks do not slow the sender down
+            await asyncio.sleep(max(0.0, start + i * self.interval - time.perf_counter()))
+            sent = self.last = time.perf_counter()
+            try:
+                ack = await sio.call("audio_blob", (meta, chunk), timeout=30)
+            except Exception:
+                self.errors += 1
+                continue
+            if ack and "seq" in ack:
+                self.sent[ack["seq"]] = sent
+            else:
+                self.dropped += 1
+        # wait for the transcripts still in flight, until none came for drain_s
+        # (a silent blob never gets one)
+        while (time.perf_counter() - self.last < drain_s
+               and any(seq not in self.received for seq in self.sent)):
+            await asyncio.sleep(0.1)
+        await sio.emit("leave", {"roomId": self.room_id, "userId": self.user_id})
+        await sio.disconnect()
+
+    def latencies(self):
+        return [(self.received[seq] - t) * 1000 for seq, t in self.sent.items() if seq in self.received]
+
+
+async def run_load(args, procs, url):
+    # a distinct synthetic voice per speaker in a room
+    chunks = [live_blobs(args.seconds, args.chunk_s, seed) for seed in range(args.speakers)]
+    speakers = [Speaker(url, f"room{r}", s, chunks[s], args.chunk_s, args.speed, args.denoise)
+                for r in range(args.rooms) for s in range(args.speakers)]
+    sampler = Sampler(procs)
+    sampling = asyncio.create_task(sampler.run())
+    await asyncio.sleep(0)
+    # stagger starts over one chunk so rooms are not in lockstep
+    start = time.perf_counter()
+    offsets = np.linspace(0, args.chunk_s / args.speed, len(speakers), endpoint=False)
+    await asyncio.gather(*(sp.run(start + offset, args.drain_s) for sp, offset in zip(speakers, offsets)))
+    # up to the last transcript, not the end of the drain wait
+    wall = max(sp.last for sp in speakers) - start
+    sampling.cancel()
+    await sampling
+
+    latencies = [ms for sp in speakers for ms in sp.latencies()]
+    sent = sum(len(sp.chunks) for sp in speakers)
+    accepted = sum(len(sp.sent) for sp in speakers)
+    answered = sum(len(sp.received) for sp in speakers)
+    audio_s = answered * args.chunk_s
+    return {
+        "wall_s": round(wall, 2),
+        "blobs": {"sent": sent, "accepted": accepted, "dropped": sum(sp.dropped for sp in speakers),
+                  "errors": sum(sp.errors for sp in speakers), "transcribed": answered,
+                  "no_transcript": accepted - answered},
+        "backpressure_events": sum(sp.backpressure for sp in speakers),
+        "latency_ms": percentiles(latencies),
+        "throughput": {"blobs_per_s": round(answered / wall, 2), "audio_s_per_s": round(audio_s / wall, 2),
+                       "transcripts_per_s": round(sum(sp.transcripts for sp in speakers) / wall, 2)},
+        "servers": sampler.results(wall),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--speakers", type=int, default=3, help="per room")
+    parser.add_argument("--seconds", type=float, default=60, help="audio each speaker sends")
+    parser.add_argument("--chunk-s", type=float, default=3.0, help="MediaRecorder timeslice")
+    parser.add_argument("--speed", type=float, default=1.0, help="send rate relative to real time")
+    parser.add_argument("--denoise", action="store_true")
+    parser.add_argument("--backend", choices=["stub", "env"], default="stub")
+    parser.add_argument("--stub-rtf", type=float, default=0.0,
+                        help="simulated inference seconds per audio second (stub backend)")
+    parser.add_argument("--workers", type=int, default=1, help="WHISPER_WORKERS of the transcription service")
+    parser.add_argument("--port", type=int, default=18000, help="transcription service; room server is +1")
+    parser.add_argument("--drain-s", type=float, default=15,
+                        help="stop waiting for outstanding transcripts after this long without one")
+    parser.add_argument("--json", help="write the results here as well")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load_rooms_")
+    env = dict(os.environ, WHISPER_WORKERS=str(args.workers),
+               TRANSCRIPT_CACHE_PATH=os.path.join(workdir, "cache.sqlite3"),
+               SEARCH_INDEX_PATH=os.path.join(workdir, "search.sqlite3"),
+               ROOM_SPILL_DIR=os.path.join(workdir, "rooms"),
+               ROOM_STORE_PATH=os.path.join(workdir, "rooms.sqlite3"),
+               FASTAPI_BASE=f"http://127.0.0.1:{args.port}")
+    if args.backend == "stub":
+        env.update(WHISPER_BACKEND="stub", WHISPER_MODEL="stub", WHISPER_STUB_RTF=str(args.stub_rtf))
+    env.pop("INFERENCE_URL", None)
+    log_path = os.path.join(workdir, "servers.log")
+    print(f"{args.rooms} rooms x {args.speakers} speakers, {args.seconds:g} s each in {args.chunk_s:g} s blobs "
+          f"at {args.speed:g}x, backend {env.get('WHISPER_BACKEND', 'openai-whisper')}; server log {log_path}")
+
+    with open(log_path, "wb") as log:
+        procs = {"transcription": start_server("room.transcription_service:app", args.port, env, log),
+                 "room": start_server("room.main:socket_app", args.port + 1, env, log)}
+        try:
+            async def run():
+                for name, proc in procs.items():
+                    await wait_ready(args.port + (name == "room"), proc)
+                return await run_load(args, procs, f"http://127.0.0.1:{args.port + 1}")
+            results = asyncio.run(run())
+        finally:
+            for proc in procs.values():
+                proc.terminate()
+            for proc in procs.values():
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+    blobs, lat, tput = results["blobs"], results["latency_ms"], results["throughput"]
+    print(f"\nblobs: {blobs['sent']} sent, {blobs['accepted']} accepted, {blobs['dropped']} dropped, "
+          f"{blobs['transcribed']} transcribed, {blobs['no_transcript']} without transcript; "
+          f"{results['backpressure_events']} backpressure events")
+    if lat["p50"] is not None:
+        print(f"latency ms: p50 {lat['p50']:.0f}  p95 {lat['p95']:.0f}  p99 {lat['p99']:.0f}  max {lat['max']:.0f}")
+    print(f"throughput: {tput['blobs_per_s']:.1f} blobs/s, {tput['audio_s_per_s']:.1f} audio s/s, "
+          f"{tput['transcripts_per_s']:.1f} transcripts/s over {results['wall_s']:.1f} s\n")
+    print(f"{'server':<14} {'RSS peak MB':>12} {'RSS mean MB':>12} {'CPU s':>8} {'CPU %':>7}")
+    for name, usage in results["servers"].items():
+        if usage["cpu_s"] is None:
+            print(f"{name:<14} {'n/a':>12}")
+            continue
+        print(f"{name:<14} {usage['rss_peak_mb']:12.0f} {usage['rss_mean_mb']:12.0f} {usage['cpu_s']:8.1f}"
+              f" {usage['cpu_percent']:7.0f}")
+
+    if args.json:
+        config = {k: v for k, v in vars(args).items() if k != "json"}
+        config["whisper_backend"] = env.get("WHISPER_BACKEND", "openai-whisper")
+        Path(args.json).write_text(json.dumps(dict(config=config, **results), indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,513 @@
+# decoding.py
+"""
+Audio decoding to 16 kHz mono float32, in process where possible.
+
+Whole uploads (decode_bytes):
+    pyav    libav via PyAV, demuxed and decoded in this process, then
+            resampled by the polyphase Resampler below
+    ffmpeg  one ffmpeg process reading stdin and writing f32le to stdout
+            (no temp files, no pydub re-encoding)
+
+Live streams (StreamDecoders): MediaRecorder with a timeslice sends the
+WebM header (EBML, Tracks) only in its first blob; later blobs are bare
+Cluster data. Each (room, user) stream keeps its decoder between blobs:
+    pyav    an incremental WebM demuxer hands Opus packets to one open
+            decoder, so the header is parsed once and decoder state runs
+            across blob boundaries
+    ffmpeg  a long-lived ffmpeg process per stream fed over its stdin pipe;
+            PCM is collected by a reader thread (output can trail the
+            input by a few hundred ms and arrives with the next blob)
+Blobs are decoded in their per-stream order (stream_seq); a blob that
+starts with an EBML header starts a new stream, and after a dropped blob
+the demuxer skips to the next Cluster.
+
+Config (env):
+    DECODER             auto (default: pyav if installed) / pyav / ffmpeg
+    DECODER_IDLE_S      close a live stream decoder after this long unused
+    DECODER_STREAMS     live stream decoders kept (LRU)
+    DECODER_ORDER_WAIT_S  how long a blob waits for an earlier one that is missing
+"""
+import asyncio
+import os
+import struct
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from math import gcd
+
+import numpy as np
+
+DECODER = os.getenv("DECODER", "auto")
+DECODER_IDLE_S = float(os.getenv("DECODER_IDLE_S", "300"))
+DECODER_STREAMS = int(os.getenv("DECODER_STREAMS", "512"))
+ORDER_WAIT_S = float(os.getenv("DECODER_ORDER_WAIT_S", "5"))
+FFMPEG_SETTLE_S = 0.02   # output quiet this long = ffmpeg has caught up with a blob
+FFMPEG_WAIT_S = 1.0
+
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+
+
+def backend():
+    if DECODER != "auto":
+        return DECODER
+    try:
+        import av  # noqa: F401
+        return "pyav"
+    except ImportError:
+        return "ffmpeg"
+
+
+# ------------------- resampling ------------------- #
+class Resampler:
+    """
+    Streaming polyphase resampler (Kaiser-windowed sinc, like
+    scipy.signal.resample_poly). process() may be called with any block
+    size; output is continuous across calls. flush() emits the tail.
+    """
+    def __init__(self, rate_in, rate_out=16000, half_len=10, beta=5.0):
+        g = gcd(int(rate_in), int(rate_out))
+        self.up, self.down = int(rate_out) // g, int(rate_in) // g
+        self.passthrough = self.up == self.down
+        if self.passthrough:
+            return
+        factor = max(self.up, self.down)
+        half = half_len * factor
+        t = np.arange(-half, half + 1)
+        h = np.sinc(t / factor) / factor * np.kaiser(len(t), beta) * self.up
+        h = np.concatenate([h, np.zeros(-len(h) % self.up)])
+        self.taps = len(h) // self.up
+        # phase p, tap j -> h[p + j * up], reversed so windows can be used as is
+        self.phases = h.reshape(self.taps, self.up).T[:, ::-1].astype(np.float32).copy()
+        self.delay = half    # centre of the filter, in upsampled samples
+        self.buf = np.zeros(self.taps - 1, dtype=np.float32)
+        self.buf_start = -(self.taps - 1)
+        self.next_out = 0
+        self.seen = 0
+
+    def process(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        if self.passthrough:
+            return x
+        self.seen += len(x)
+        self.buf = np.concatenate([self.buf, x])
+        total = self.buf_start + len(self.buf)
+        end = (total * self.up - 1 - self.delay) // self.down + 1
+        if end <= self.next_out:
+            return np.zeros(0, dtype=np.float32)
+        count = end - self.next_out
+        out = np.empty(count, dtype=np.float32)
+        # outputs up apart share a phase and step down input samples: one
+        # strided matrix-vector product per phase
+        for r in range(min(self.up, count)):
+            n = (self.next_out + r) * self.down + self.delay
+            base = n // self.up - self.buf_start - (self.taps - 1)
+            rows = len(range(r, count, self.up))
+            windows = np.lib.stride_tricks.as_strided(
+                self.buf[base:], shape=(rows, self.taps),
+                strides=(self.buf.strides[0] * self.down, self.buf.strides[0]),
+                writeable=False)
+            out[r::self.up] = windows @ self.phases[n % self.up]
+        self.next_out = end
+        keep = (end * self.down + self.delay) // self.up - self.buf_start - (self.taps - 1)
+        keep = min(max(keep, 0), len(self.buf))
+        self.buf = self.buf[keep:]
+        self.buf_start += keep
+        return out
+
+    def flush(self):
+        if self.passthrough:
+            return np.zeros(0, dtype=np.float32)
+        expected = -(-self.seen * self.up // self.down)
+        out = self.process(np.zeros(self.taps, dtype=np.float32))
+        self.seen -= self.taps
+        return out[:max(expected - (self.next_out - len(out)), 0)]
+
+
+def resample(x, rate_in, rate_out=16000):
+    r = Resampler(rate_in, rate_out)
+    return np.concatenate([r.process(x), r.flush()])
+
+
+def _mono(frame):
+    # PyAV AudioFrame -> float32 mono at the frame's own rate
+    arr = frame.to_ndarray()
+    if not frame.format.is_planar:
+        arr = arr.reshape(-1, len(frame.layout.channels)).T
+    if arr.dtype.kind in "iu":
+        arr = arr.astype(np.float32) / (float(np.iinfo(arr.dtype).max) + 1)
+    if arr.shape[0] > 1:
+        return arr.mean(axis=0, dtype=np.float32)
+    return arr[0].astype(np.float32, copy=False)
+
+
+# ------------------- whole uploads ------------------- #
+def _decode_pyav(source, rate):
+    import av
+    out, pending, size, resampler = [], [], 0, None
+    with av.open(source) as container:
+        for frame in container.decode(audio=0):
+            if resampler is None:
+                resampler = Resampler(frame.sample_rate, rate)
+            pending.append(_mono(frame))
+            size += frame.samples
+            if size >= frame.sample_rate:   # resample about a second at a time
+                out.append(resampler.process(np.concatenate(pending)))
+                pending, size = [], 0
+    if resampler is None:
+        return np.zeros(0, dtype=np.float32)
+    if pending:
+        out.append(resampler.process(np.concatenate(pending)))
+    out.append(resampler.flush())
+    return np.concatenate(out)
+
+
+def _decode_ffmpeg(source, rate, raw=None):
+    proc = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", source,
+         "-f", "f32le", "-ac", "1", "-ar", str(rate), "pipe:1"],
+        input=raw, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {proc.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(proc.stdout, dtype=np.float32).copy()
+
+
+def decode_bytes(raw, rate=16000):
+    """
+    Decode a complete audio file (any container libav/ffmpeg reads) to mono
+    float32 at rate.
+    """
+    if backend() == "pyav":
+        return _decode_pyav(BytesIO(raw), rate)
+    return _decode_ffmpeg("pipe:0", rate, raw)
+
+
+def decode_file(path, rate=16000):
+    # seekable, so also handles containers whose index is at the end (mp4/m4a)
+    if backend() == "pyav":
+        return _decode_pyav(path, rate)
+    return _decode_ffmpeg(path, rate)
+
+
+# ------------------- live WebM streams ------------------- #
+_SEGMENT, _CLUSTER, _TRACKS, _TRACK_ENTRY, _AUDIO, _BLOCK_GROUP = (
+    0x18538067, 0x1F43B675, 0x1654AE6B, 0xAE, 0xE1, 0xA0)
+_MASTERS = {_SEGMENT, _CLUSTER, _TRACKS, _TRACK_ENTRY, _AUDIO, _BLOCK_GROUP}
+_TRACK_NUMBER, _TRACK_TYPE, _CODEC_ID, _CODEC_PRIVATE, _SAMPLING, _CHANNELS = (
+    0xD7, 0x83, 0x86, 0x63A2, 0xB5, 0x9F)
+_SIMPLE_BLOCK, _BLOCK = 0xA3, 0xA1
+_CLUSTER_ID = _CLUSTER.to_bytes(4, "big")
+_WANTED = {_TRACK_NUMBER, _TRACK_TYPE, _CODEC_ID, _CODEC_PRIVATE, _SAMPLING, _CHANNELS, _SIMPLE_BLOCK, _BLOCK}
+
+
+def _vint(buf, pos, marker=False):
+    # EBML variable-length integer -> (value, next pos, length); value None if incomplete
+    if pos >= len(buf):
+        return None, pos, 0
+    first, length, mask = buf[pos], 1, 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("corrupt WebM stream (bad EBML length)")
+    if pos + length > len(buf):
+        return None, pos, 0
+    value = first if marker else first & (mask - 1)
+    for b in buf[pos + 1:pos + length]:
+        value = (value << 8) | b
+    return value, pos + length, length
+
+
+class WebmDemuxer:
+    """
+    Incremental WebM/Matroska demuxer for the audio track. feed() takes
+    bytes split anywhere and returns ("tracks", {number: info}) once the
+    first Cluster starts, then ("frame", bytes) per audio packet.
+    """
+    def __init__(self):
+        self.buf = bytearray()
+        self.skip = 0
+        self.syncing = False
+        self.tracks = {}
+        self._entry = None
+        self.audio_track = None
+        self.dropped_laced = 0
+
+    def feed(self, data):
+        if self.skip:
+            n = min(self.skip, len(data))
+            self.skip -= n
+            data = data[n:]
+        self.buf += data
+        if self.syncing:
+            at = self.buf.find(_CLUSTER_ID)
+            if at < 0:
+                del self.buf[:-3]
+                return []
+            del self.buf[:at]
+            self.syncing = False
+        buf, pos, events = self.buf, 0, []
+        while True:
+            eid, p, _ = _vint(buf, pos, marker=True)
+            if eid is None:
+                break
+            size, p, length = _vint(buf, p)
+            if size is None:
+                break
+            if eid in _MASTERS or size == (1 << (7 * length)) - 1:
+                # descend: children follow (sizes of live masters are often unknown)
+                if eid == _TRACK_ENTRY:
+                    self._entry = {}
+                elif eid == _CLUSTER and self.audio_track is None:
+                    audio = [n for n, t in self.tracks.items() if t.get("type", 2) == 2]
+                    if not audio:
+                        raise ValueError("WebM stream has no audio track")
+                    self.audio_track = audio[0]
+                    events.append(("tracks", self.tracks))
+                pos = p
+                continue
+            if p + size > len(buf):
+                if eid not in _WANTED:
+                    self.skip = p + size - len(buf)
+                    pos = len(buf)
+                break
+            if eid in _WANTED:
+                self._element(eid, bytes(buf[p:p + size]), events)
+            pos = p + size
+        del self.buf[:pos]
+        return events
+
+    def resync(self):
+        """
+        Bytes were lost (a dropped blob): skip ahead to the next Cluster.
+        """
+        if self.audio_track is not None:
+            self.buf.clear()
+            self.skip = 0
+            self.syncing = True
+
+    def _element(self, eid, payload, events):
+        if eid in (_SIMPLE_BLOCK, _BLOCK):
+            track, p, _ = _vint(payload, 0)
+            if track != self.audio_track:
+                return
+            flags = payload[p + 2]
+            if flags & 0x06:
+                self.dropped_laced += 1   # MediaRecorder does not lace audio
+                return
+            events.append(("frame", payload[p + 3:]))
+            return
+        entry = self._entry if self._entry is not None else {}
+        if eid == _TRACK_NUMBER:
+            entry["number"] = int.from_bytes(payload, "big")
+            self.tracks[entry["number"]] = entry
+        elif eid == _TRACK_TYPE:
+            entry["type"] = int.from_bytes(payload, "big")
+        elif eid == _CODEC_ID:
+            entry["codec"] = payload.decode("ascii", "replace").rstrip("\x00")
+        elif eid == _CODEC_PRIVATE:
+            entry["private"] = payload
+        elif eid == _SAMPLING:
+            entry["rate"] = struct.unpack(">f" if len(payload) == 4 else ">d", payload)[0]
+        elif eid == _CHANNELS:
+            entry["channels"] = int.from_bytes(payload, "big")
+
+
+_CODECS = {"A_OPUS": "opus", "A_VORBIS": "vorbis"}
+
+
+class _PyAVStream:
+    def __init__(self, rate):
+        self.rate = rate
+        self.demuxer = WebmDemuxer()
+        self.codec = None
+        self.resampler = None
+
+    def _open(self, tracks):
+        import av
+        info = tracks[self.demuxer.audio_track]
+        if info.get("codec") not in _CODECS:
+            raise ValueError(f"Unsupported live codec {info.get('codec')!r}")
+        self.codec = av.CodecContext.create(_CODECS[info["codec"]], "r")
+        if info.get("private"):
+            self.codec.extradata = info["private"]
+        # Opus always decodes at 48 kHz whatever the header says
+        self.codec.sample_rate = 48000 if info["codec"] == "A_OPUS" else int(info.get("rate", 48000))
+        self.codec.layout = "stereo" if info.get("channels", 1) == 2 else "mono"
+
+    def decode(self, chunk):
+        import av
+        frames = []
+        for kind, value in self.demuxer.feed(chunk):
+            if kind == "tracks":
+                self._open(value)
+                continue
+            for frame in self.codec.decode(av.Packet(value)):
+                if self.resampler is None:
+                    self.resampler = Resampler(frame.sample_rate, self.rate)
+                frames.append(_mono(frame))
+        if not frames:
+            return np.zeros(0, dtype=np.float32)
+        return self.resampler.process(np.concatenate(frames))
+
+    def resync(self):
+        self.demuxer.resync()
+
+    def close(self):
+        self.codec = None
+
+
+class _FFmpegStream:
+    def __init__(self, rate):
+        self.proc = subprocess.Popen(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-probesize", "4096", "-analyzeduration", "0",
+             "-f", "webm", "-i", "pipe:0", "-f", "f32le", "-ac", "1", "-ar", str(rate), "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0,
+        )
+        self.out = bytearray()
+        self.lock = threading.Lock()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        while True:
+            block = self.proc.stdout.read(16384)
+            if not block:
+                return
+            with self.lock:
+                self.out += block
+
+    def decode(self, chunk):
+        self.proc.stdin.write(chunk)
+        self.proc.stdin.flush()
+        # ffmpeg emits PCM as it demuxes; take what it has once output goes quiet
+        now = time.monotonic()
+        deadline, last, changed = now + FFMPEG_WAIT_S, -1, now
+        while now < deadline:
+            time.sleep(0.005)
+            now = time.monotonic()
+            with self.lock:
+                size = len(self.out)
+            if size != last:
+                last, changed = size, now
+            elif size > 0 and now - changed >= FFMPEG_SETTLE_S:
+                break
+        with self.lock:
+            n = len(self.out) // 4 * 4
+            data = bytes(self.out[:n])
+            del self.out[:n]
+        return np.frombuffer(data, dtype=np.float32).copy()
+
+    def resync(self):
+        pass   # ffmpeg's matroska demuxer skips to the next element by itself
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        self.proc.kill()
+
+
+class _Stream:
+    __slots__ = ("decoder", "next_seq", "recent", "last_used", "lock")
+
+    def __init__(self, decoder, seq):
+        self.decoder = decoder
+        self.next_seq = seq
+        self.recent = OrderedDict()   # seq -> PCM, so a retried blob is not fed twice
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class StreamDecoders:
+    """
+    Live stream decoders keyed by "room:user". seq is the blob's position in
+    its stream. decode() is blocking; call it from a worker thread, after
+    awaiting wait_for_turn() so blobs that arrive early go in order.
+    """
+    def __init__(self, rate=16000, idle_s=DECODER_IDLE_S, max_streams=DECODER_STREAMS, mode=None):
+        self.rate = rate
+        self.mode = mode or backend()
+        self.idle_s = idle_s
+        self.max_streams = max_streams
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+        self._swept = time.monotonic()
+        self.counts = {"chunks": 0, "decode_seconds": 0.0, "audio_seconds": 0.0, "reordered": 0, "gaps": 0}
+
+    def _new_decoder(self):
+        return _PyAVStream(self.rate) if self.mode == "pyav" else _FFmpegStream(self.rate)
+
+    def _stream(self, key, seq, raw):
+        if time.monotonic() - self._swept > 60:
+            self.close_idle()
+        with self._lock:
+            stream = self._streams.get(key)
+            if raw[:4] == EBML_MAGIC and (stream is None or seq not in stream.recent):
+                # a new recording (or the first blob we see): fresh decoder
+                if stream is not None:
+                    stream.decoder.close()
+                stream = self._streams[key] = _Stream(self._new_decoder(), seq)
+            elif stream is None:
+                raise ValueError("WebM continuation without a stream header")
+            self._streams.move_to_end(key)
+            stream.last_used = time.monotonic()
+            return stream
+
+    async def wait_for_turn(self, key, seq, raw):
+        """
+        Waits on the event loop, at most ORDER_WAIT_S, until the blobs before
+        seq have been decoded, so an early blob does not hold a worker thread.
+        """
+        stream = self._streams.get(key)
+        if stream is None or raw[:4] == EBML_MAGIC or seq <= stream.next_seq:
+            return
+        self.counts["reordered"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ORDER_WAIT_S
+        while stream.next_seq < seq and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+
+    def decode(self, key, seq, raw, gap=False):
+        """
+        gap: blobs before this one were dropped upstream, so the stream
+        has a hole just before it. A blob still ahead of the stream (its
+        predecessor never came) is decoded as after a gap.
+        """
+        stream = self._stream(key, seq, raw)
+        with stream.lock:
+            if seq > stream.next_seq:
+                gap = True
+            if seq in stream.recent:
+                return stream.recent[seq]   # a retried blob
+            if seq < stream.next_seq:
+                # the sender started numbering again (room server restarted)
+                gap = True
+            if gap and raw[:4] != EBML_MAGIC:
+                self.counts["gaps"] += 1
+                stream.decoder.resync()
+            start = time.perf_counter()
+            pcm = stream.decoder.decode(raw)
+            self.counts["chunks"] += 1
+            self.counts["decode_seconds"] += time.perf_counter() - start
+            self.counts["audio_seconds"] += len(pcm) / self.rate
+            stream.recent[seq] = pcm
+            while len(stream.recent) > 4:
+                stream.recent.popitem(last=False)
+            stream.next_seq = seq + 1
+            return pcm
+
+    def close_idle(self):
+        now = self._swept = time.monotonic()
+        with self._lock:
+            stale = [k for k, s in self._streams.items() if now - s.last_used > self.idle_s]
+            stale += list(self._streams)[:max(len(self._streams) - self.max_streams, 0)]
+            for key in set(stale):
+                self._streams.pop(key).decoder.close()
+
+    def stats(self):
+        chunks = self.counts["chunks"]
+        return {"backend": self.mode, "streams": len(self._streams), **self.counts,
+                "ms_per_chunk": 1000 * self.counts["decode_seconds"] / chunks if chunks else 0.0}
@@ -0,0 +1,214 @@
+# denoise.py
+"""
+Streaming spectral-gating noise reduction in float32.
+
+The signal is processed in blocks of DENOISE_BLOCK_FRAMES STFT frames
+(32 ms sqrt-Hann windows, 50% overlap, overlap-add) and written back into
+the input buffer, so memory stays at one block whatever the length.
+
+The noise profile (per-bin mean and spread in dB) comes from frames the VAD
+marked as non-speech. When there are too few of those (a clip that is all
+speech), the quietest frames are used instead, or, for a live speaker, the
+profile kept from their earlier chunks. A bin is passed when it is above
+mean + DENOISE_N_STD * std of the noise, with a soft 6 dB knee.
+
+    profile = estimate_profile(data, 16000, speech_regions)
+    denoise(data, 16000, profile)                 # in place
+
+    profile = profiles.get("room:user")           # per live speaker
+
+Config (env):
+    DENOISE_N_STD           threshold above the noise mean, in noise std
+    DENOISE_PROP_DECREASE   how much of the gated energy to remove (0-1)
+    DENOISE_BLOCK_FRAMES    STFT frames per block
+    DENOISE_PROFILES        live speaker profiles kept (LRU)
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from scipy.fft import irfft, rfft   # keeps float32 / complex64
+except ImportError:
+    from numpy.fft import irfft, rfft
+
+N_STD = float(os.getenv("DENOISE_N_STD", "1.5"))
+PROP_DECREASE = float(os.getenv("DENOISE_PROP_DECREASE", "1.0"))
+BLOCK_FRAMES = int(os.getenv("DENOISE_BLOCK_FRAMES", "256"))
+MAX_PROFILES = int(os.getenv("DENOISE_PROFILES", "1024"))
+
+FRAME_MS = 32
+SOFT_DB = 6.0
+MIN_NOISE_FRAMES = 8
+PROFILE_FRAMES = 600       # ~10 s of noise; older frames fade out of a live profile
+QUIET_FRACTION = 0.1
+
+
+def frame_size(rate):
+    return 1 << int(round(np.log2(rate * FRAME_MS / 1000)))
+
+
+def _window(n_fft):
+    # periodic sqrt-Hann: analysis * synthesis sums to 1 at 50% overlap
+    return np.sqrt(0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+
+
+def _db(spec):
+    return 20 * np.log10(np.abs(spec) + 1e-6)
+
+
+class NoiseProfile:
+    __slots__ = ("n_fft", "mean", "sq", "frames")
+
+    def __init__(self):
+        self.n_fft = None
+        self.mean = None    # per-bin mean of noise magnitude, dB
+        self.sq = None      # per-bin mean of its square
+        self.frames = 0
+
+    def update(self, db):
+        """
+        db: (frames, bins) noise magnitudes. Blends into the running profile.
+        """
+        if len(db) == 0:
+            return
+        mean, sq = db.mean(axis=0), (db * db).mean(axis=0)
+        if self.mean is None or self.mean.shape != mean.shape:
+            self.mean, self.sq, self.frames = mean, sq, len(db)
+            return
+        w = len(db) / (min(self.frames, PROFILE_FRAMES) + len(db))
+        self.mean += w * (mean - self.mean)
+        self.sq += w * (sq - self.sq)
+        self.frames += len(db)
+
+    def threshold(self, n_std=N_STD):
+        return self.mean + n_std * np.sqrt(np.maximum(self.sq - self.mean * self.mean, 0))
+
+
+def _frame_starts(n, hop):
+    return np.arange(0, max(n - 2 * hop, 0) + 1, hop)
+
+
+def estimate_profile(data, rate=16000, speech_regions=None, profile=None):
+    """
+    Updates (or creates) a NoiseProfile from the non-speech frames of data.
+    speech_regions: (start, end) seconds from the VAD; None means unknown.
+    """
+    profile = profile if profile is not None else NoiseProfile()
+    n_fft = frame_size(rate)
+    hop = n_fft // 2
+    if profile.n_fft != n_fft:
+        profile.__init__()
+        profile.n_fft = n_fft
+    starts = _frame_starts(len(data), hop)
+    if len(data) < n_fft:
+        return profile
+
+    picked = starts[:0]
+    if speech_regions is not None:
+        centres = (starts + hop) / rate
+        in_speech = np.zeros(len(starts), dtype=bool)
+        for s, e in speech_regions:
+            in_speech |= (centres >= s) & (centres < e)
+        picked = starts[~in_speech]
+    if len(picked) < MIN_NOISE_FRAMES:
+        if profile.mean is not None:
+            return profile   # all speech: keep what earlier chunks learnt
+        # no VAD help: the quietest frames are the best guess at the floor
+        halves = data[:len(starts) * hop + hop].reshape(-1, hop)
+        energy = np.einsum("ij,ij->i", halves, halves)
+        energy = energy[:-1] + energy[1:]
+        count = max(MIN_NOISE_FRAMES, int(len(starts) * QUIET_FRACTION))
+        picked = starts[np.sort(np.argpartition(energy, min(count, len(energy)) - 1)[:count])]
+
+    picked = picked[np.linspace(0, len(picked) - 1, min(len(picked), PROFILE_FRAMES)).astype(int)]
+    frames = data[picked[:, None] + np.arange(n_fft)] * _window(n_fft)
+    profile.update(_db(rfft(frames, axis=1)).astype(np.float32))
+    return profile
+
+
+def denoise(data, rate=16000, profile=None, n_std=N_STD, prop_decrease=PROP_DECREASE,
+            block_frames=BLOCK_FRAMES):
+    """
+    Spectral gate over data (float32, mono), written back into it.
+    Returns data.
+    """
+    if profile is None or profile.mean is None:
+        profile = estimate_profile(data, rate)
+    if profile.mean is None or len(data) == 0:
+        return data
+    n_fft = frame_size(rate)
+    hop = n_fft // 2
+    window = _window(n_fft)
+    threshold = profile.threshold(n_std)
+
+    n = len(data)
+    total_frames = (n - 1) // hop + 2      # frame j starts at (j - 1) * hop
+    carry = np.zeros(hop, dtype=np.float32)
+    prev_gain = None
+    for j0 in range(0, total_frames, block_frames):
+        count = min(block_frames, total_frames - j0)
+        first = (j0 - 1) * hop
+        # input for this block, zero-padded past either end
+        seg = np.zeros((count + 1) * hop, dtype=np.float32)
+        lo, hi = max(first, 0), min(first + len(seg), n)
+        seg[lo - first:hi - first] = data[lo:hi]
+        halves = seg.reshape(count + 1, hop)
+        frames = np.concatenate([halves[:-1], halves[1:]], axis=1)
+        frames *= window
+
+        spec = rfft(frames, axis=1)
+        gain = np.clip((_db(spec) - threshold) / SOFT_DB, 0, 1).astype(np.float32)
+        # light smoothing across neighbouring bins and the previous frame
+        gain[:, 1:-1] = (gain[:, :-2] + gain[:, 1:-1] + gain[:, 2:]) / 3
+        smoothed = gain.copy()
+        smoothed[1:] = 0.5 * (gain[1:] + gain[:-1])
+        if prev_gain is not None:
+            smoothed[0] = 0.5 * (gain[0] + prev_gain)
+        prev_gain = gain[-1]
+        spec *= 1 - prop_decrease * (1 - smoothed)
+
+        out = irfft(spec, n=n_fft, axis=1).astype(np.float32, copy=False)
+        out *= window
+        ola = np.zeros((count + 1) * hop, dtype=np.float32)
+        ola[:count * hop] += out[:, :hop].reshape(-1)
+        ola[hop:] += out[:, hop:].reshape(-1)
+        ola[:hop] += carry
+        carry = ola[count * hop:].copy()
+
+        # samples before the next block's first frame are final
+        lo, hi = max(first, 0), min(first + count * hop, n)
+        if hi > lo:
+            data[lo:hi] = ola[lo - first:hi - first]
+    lo = max((total_frames - 1) * hop, 0)
+    if lo < n:
+        data[lo:n] = carry[:n - lo]
+    return data
+
+
+class ProfileStore:
+    """
+    Noise profiles of live speakers across their successive audio chunks.
+    """
+    def __init__(self, max_profiles=MAX_PROFILES):
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is None:
+                profile = self._profiles[key] = NoiseProfile()
+                while len(self._profiles) > self.max_profiles:
+                    self._profiles.popitem(last=False)
+            self._profiles.move_to_end(key)
+            return profile
+
+    def stats(self):
+        return {"profiles": len(self._profiles)}
+
+
+profiles = ProfileStore()
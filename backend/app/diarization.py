@@ -0,0 +1,467 @@
+# diarization.py
+"""
+Incremental speaker diarization: one speaker embedding per speech window,
+clustered online against the speakers a session has already heard.
+
+    windows = diarizer.embed(processed, spans)       # embeddings, original time
+    turns = diarizer.assign("meeting-42", windows)   # [{"start", "end", "speaker"}]
+
+Speech is cut into DIARIZE_WINDOW_S windows every DIARIZE_HOP_S and each
+window is embedded once. Embeddings depend only on the audio, so callers
+cache them (transcript_cache "embeddings") and a repeated upload never
+reaches the model. Each window joins the session speaker whose centroid is
+most similar (cosine) when that is above DIARIZE_THRESHOLD, and starts a new
+speaker otherwise. Speakers are named பேச்சாளர் 1, 2, ... in the order the
+session first heard them and keep those names across chunks and requests;
+sessions are saved under DIARIZE_DIR so they also survive a restart.
+
+Embedders (DIARIZE_EMBEDDER), loaded from DIARIZE_MODEL_PATH only, on CPU:
+    pyannote      pyannote.audio embedding checkpoint (pytorch_model.bin)
+    speechbrain   SpeechBrain ECAPA-TDNN directory (hyperparams.yaml, *.ckpt)
+    mfcc          MFCC statistics, no model: coarse, for development/benchmarks
+    auto          speechbrain if the path has hyperparams.yaml, pyannote if a
+                  path is set, mfcc otherwise (default)
+
+Config (env):
+    DIARIZE_EMBEDDER, DIARIZE_MODEL_PATH
+    DIARIZE_WINDOW_S      embedding window length
+    DIARIZE_HOP_S         step between windows
+    DIARIZE_THRESHOLD     cosine similarity to join a speaker (embedder default)
+    DIARIZE_MAX_SPEAKERS  speakers per session
+    DIARIZE_BATCH         windows per model call
+    DIARIZE_SESSIONS      sessions kept in memory (LRU)
+    DIARIZE_DIR           where sessions are saved; empty to keep them in memory
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+EMBEDDER = os.getenv("DIARIZE_EMBEDDER", "auto")
+MODEL_PATH = os.getenv("DIARIZE_MODEL_PATH", "")
+WINDOW_S = float(os.getenv("DIARIZE_WINDOW_S", "1.5"))
+HOP_S = float(os.getenv("DIARIZE_HOP_S", "0.75"))
+THRESHOLD = os.getenv("DIARIZE_THRESHOLD")
+MAX_SPEAKERS = int(os.getenv("DIARIZE_MAX_SPEAKERS", "20"))
+BATCH = int(os.getenv("DIARIZE_BATCH", "32"))
+MAX_SESSIONS = int(os.getenv("DIARIZE_SESSIONS", "256"))
+SESSION_DIR = os.getenv("DIARIZE_DIR", "/tmp/tamil_transcribe/speakers")
+
+SAMPLE_RATE = 16000
+MIN_WINDOW_S = 0.5      # shorter speech is left to merge()'s neighbours
+SEEN_KEYS = 1024        # audio a session has learnt from, to not count it twice
+
+
+def speaker_name(index):
+    return f"பேச்சாளர் {index + 1}"
+
+
+class MFCCEmbedder:
+    """
+    Mean liftered MFCCs (c1..c19) of the window's louder frames plus its
+    median pitch. Needs no model and runs ~1000x real time, but only tells
+    clearly different voices apart; use a neural embedder for real meetings.
+    """
+    name = "mfcc"
+    threshold = 0.7
+    PITCH_WEIGHT = 3.0      # per octave, against a unit-length MFCC part
+
+    def __init__(self, rate=SAMPLE_RATE, n_mels=40, n_ceps=20):
+        self.rate = rate
+        self.frame, self.hop, self.n_fft = int(0.025 * rate), int(0.010 * rate), 512
+        self.window = np.hamming(self.frame).astype(np.float32)
+        # triangular mel filters over the rfft bins
+        mel = np.linspace(0, 2595 * np.log10(1 + rate / 2 / 700), n_mels + 2)
+        bins = np.floor((self.n_fft + 1) * 700 * (10 ** (mel / 2595) - 1) / rate).astype(int)
+        fbank = np.zeros((n_mels, self.n_fft // 2 + 1), dtype=np.float32)
+        for m in range(1, n_mels + 1):
+            lo, mid, hi = bins[m - 1], bins[m], bins[m + 1]
+            fbank[m - 1, lo:mid] = (np.arange(lo, mid) - lo) / max(mid - lo, 1)
+            fbank[m - 1, mid:hi] = (hi - np.arange(mid, hi)) / max(hi - mid, 1)
+        self.fbank = fbank.T
+        # DCT-II without c0 (loudness), liftered so higher coefficients count
+        k, n = np.arange(1, n_ceps)[:, None], np.arange(n_mels)[None, :]
+        lifter = 1 + (n_ceps / 2) * np.sin(np.pi * np.arange(1, n_ceps) / n_ceps)
+        self.dct = (np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * lifter[:, None]).T.astype(np.float32)
+        # pitch search range, as autocorrelation lags: 50-400 Hz
+        self.lags = (rate // 400, rate // 50)
+
+    def __call__(self, batch):
+        frames = np.lib.stride_tricks.sliding_window_view(batch, self.frame, axis=1)[:, ::self.hop]
+        power = (np.abs(np.fft.rfft(frames * self.window, n=self.n_fft, axis=2)) ** 2).astype(np.float32)
+        mel = power @ self.fbank
+        # frames within 30 dB of the loudest carry the voice; the rest is pause
+        energy = 10 * np.log10(mel.sum(axis=2) + 1e-10)
+        loud = energy > energy.max(axis=1, keepdims=True) - 30
+        weight = loud / np.maximum(loud.sum(axis=1, keepdims=True), 1)
+        ceps = np.einsum("bf,bfc->bc", weight, np.log(mel + 1e-8) @ self.dct)
+        ceps -= ceps.mean(axis=1, keepdims=True)
+        ceps /= np.maximum(np.linalg.norm(ceps, axis=1, keepdims=True), 1e-12)
+
+        lo, hi = self.lags
+        acf = np.fft.irfft(power, n=self.n_fft, axis=2)
+        lag = lo + np.argmax(acf[..., lo:hi], axis=2)
+        voiced = loud & (np.take_along_axis(acf, lag[..., None], 2)[..., 0] > 0.3 * acf[..., 0])
+        octaves = np.log2(self.rate / lag / 160)
+        pitch = np.array([np.median(o[v]) if v.any() else 0.0 for o, v in zip(octaves, voiced)])
+        return np.concatenate([ceps, self.PITCH_WEIGHT * pitch[:, None]], axis=1)
+
+
+class PyannoteEmbedder:
+    name = "pyannote"
+    threshold = 0.5
+
+    def __init__(self, path):
+        import torch
+        from pyannote.audio import Model
+        self.torch = torch
+        self.name = embedder_name("pyannote", path)
+        self.model = Model.from_pretrained(path, map_location=torch.device("cpu"))
+        self.model.eval()
+
+    def __call__(self, batch):
+        with self.torch.inference_mode():
+            return self.model(self.torch.from_numpy(batch).unsqueeze(1)).numpy()
+
+
+class SpeechBrainEmbedder:
+    name = "speechbrain"
+    threshold = 0.5
+
+    def __init__(self, path):
+        import torch
+        try:
+            from speechbrain.inference.speaker import EncoderClassifier
+        except ImportError:
+            from speechbrain.pretrained import EncoderClassifier
+        self.torch = torch
+        self.name = embedder_name("speechbrain", path)
+        self.model = EncoderClassifier.from_hparams(source=path, savedir=path, run_opts={"device": "cpu"})
+
+    def __call__(self, batch):
+        with self.torch.inference_mode():
+            return self.model.encode_batch(self.torch.from_numpy(batch)).squeeze(1).numpy()
+
+
+def embedder_kind(kind=EMBEDDER, path=MODEL_PATH):
+    if kind != "auto":
+        return kind
+    if not path:
+        return "mfcc"
+    return "speechbrain" if os.path.exists(os.path.join(path, "hyperparams.yaml")) else "pyannote"
+
+
+def embedder_name(kind=EMBEDDER, path=MODEL_PATH):
+    # embeddings from different models never mix in a cache or a session
+    kind = embedder_kind(kind, path)
+    return kind if kind == "mfcc" else f"{kind}@{os.path.basename(os.path.normpath(path))}"
+
+
+def open_embedder(kind=EMBEDDER, path=MODEL_PATH):
+    kind = embedder_kind(kind, path)
+    if kind == "mfcc":
+        return MFCCEmbedder()
+    if not path:
+        raise RuntimeError(f"DIARIZE_MODEL_PATH is required for the {kind} embedder")
+    if kind == "pyannote":
+        return PyannoteEmbedder(path)
+    if kind == "speechbrain":
+        return SpeechBrainEmbedder(path)
+    raise ValueError(f"Unknown DIARIZE_EMBEDDER {kind!r}")
+
+
+class Windows:
+    """
+    Embedded speech windows. starts/ends are the stretch of original time
+    each window speaks for (window centres split the overlaps), so
+    consecutive windows tile every speech region.
+    """
+    __slots__ = ("starts", "ends", "vectors")
+
+    def __init__(self, starts, ends, vectors):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def shifted(self, offset):
+        return Windows(self.starts + offset, self.ends + offset, self.vectors)
+
+    def select(self, mask):
+        return Windows(self.starts[mask], self.ends[mask], self.vectors[mask])
+
+
+def _regions(data, spans, rate):
+    """
+    (start, end, shift) speech regions of data in seconds; shift maps them to
+    original time. spans is extract_speech's map, or None when data is
+    untrimmed and the VAD is asked here.
+    """
+    if spans:
+        return [(pos, pos + duration, orig - pos) for pos, orig, duration in spans]
+    from transcribe_utils import detect_speech
+    return [(s, e, 0.0) for s, e in detect_speech(data, rate)]
+
+
+def _cut(start, end, window_s, hop_s):
+    # window starts covering [start, end), the last one flush with the end
+    if end - start <= window_s:
+        return np.array([start])
+    starts = np.arange(start, end - window_s, hop_s)
+    return np.append(starts, end - window_s)
+
+
+class SpeakerSession:
+    """
+    Speakers heard so far: the sum of their window embeddings (unit vectors)
+    and the window count. Row i is speaker_name(i).
+    """
+    def __init__(self, session_id=None, embedder=None):
+        self.id = session_id
+        self.embedder = embedder
+        self.sums = None
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.seen = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def speakers(self):
+        return len(self.counts)
+
+    def assign(self, vectors, threshold, max_speakers=MAX_SPEAKERS, learn=True):
+        """
+        Speaker index per vector, in order, growing the session as it goes.
+        A window unlike every speaker is held back and only starts a new one
+        when the next window agrees with it; a lone outlier goes to its
+        nearest speaker instead. learn=False only matches (audio the session
+        has learnt from already).
+        """
+        labels = np.empty(len(vectors), dtype=np.int64)
+        if len(vectors) == 0:
+            return labels
+        if self.sums is None or self.sums.shape[1] != vectors.shape[1]:
+            self.sums = np.zeros((0, vectors.shape[1]), dtype=np.float64)
+            self.counts = np.zeros(0, dtype=np.int64)
+        centroids = self.sums / np.maximum(np.linalg.norm(self.sums, axis=1, keepdims=True), 1e-12)
+        pending = None
+        for i, v in enumerate(vectors):
+            if len(centroids) == 0:
+                centroids = self._add(v)
+                labels[i] = 0
+                continue
+            sims = centroids @ v
+            best = int(np.argmax(sims))
+            labels[i] = best
+            if sims[best] < threshold and len(centroids) < max_speakers and learn:
+                if pending is None or float(vectors[pending] @ v) < threshold:
+                    pending = i
+                    continue
+                centroids = self._add(vectors[pending] + v, 2)
+                labels[pending] = labels[i] = len(centroids) - 1
+            elif learn:
+                self.sums[best] += v
+                self.counts[best] += 1
+                centroids[best] = self.sums[best] / max(np.linalg.norm(self.sums[best]), 1e-12)
+            pending = None
+        return labels
+
+    def _add(self, total, count=1):
+        self.sums = np.vstack([self.sums, total[None, :]])
+        self.counts = np.append(self.counts, count)
+        return self.sums / np.maximum(np.linalg.norm(self.sums, axis=1, keepdims=True), 1e-12)
+
+    def remember(self, key):
+        """
+        True the first time key is seen by this session.
+        """
+        if key is None:
+            return True
+        if key in self.seen:
+            self.seen.move_to_end(key)
+            return False
+        self.seen[key] = None
+        while len(self.seen) > SEEN_KEYS:
+            self.seen.popitem(last=False)
+        return True
+
+    def save(self, path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, embedder=np.array(self.embedder or ""), counts=self.counts,
+                     sums=self.sums if self.sums is not None else np.zeros((0, 0)),
+                     seen=np.array(list(self.seen), dtype=str))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, session_id, embedder):
+        with np.load(path) as saved:
+            if str(saved["embedder"]) != embedder:
+                return None   # other model: its embeddings do not compare
+            session = cls(session_id, embedder)
+            session.counts = saved["counts"]
+            session.sums = saved["sums"] if len(session.counts) else None
+            session.seen.update((str(k), None) for k in saved["seen"])
+        return session
+
+
+class SessionStore:
+    """
+    SpeakerSessions by session id: LRU in memory, saved to directory.
+    """
+    def __init__(self, directory=SESSION_DIR, max_sessions=MAX_SESSIONS):
+        self.directory = directory
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, hashlib.sha1(session_id.encode("utf-8")).hexdigest() + ".npz")
+
+    def get(self, session_id, embedder):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and session.embedder != embedder:
+                session = None
+            if session is None:
+                if self.directory and os.path.exists(self._path(session_id)):
+                    try:
+                        session = SpeakerSession.load(self._path(session_id), session_id, embedder)
+                    except Exception as e:
+                        print(f"Could not load speaker session {session_id}:", e)
+                session = session or SpeakerSession(session_id, embedder)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def save(self, session):
+        if self.directory and session.id is not None:
+            session.save(self._path(session.id))
+
+    def stats(self):
+        return {"sessions": len(self._sessions),
+                "speakers": sum(s.speakers for s in list(self._sessions.values()))}
+
+
+class Diarizer:
+    def __init__(self, embedder=None, window_s=WINDOW_S, hop_s=HOP_S, threshold=THRESHOLD,
+                 sessions=None, rate=SAMPLE_RATE):
+        self._embedder = embedder
+        self._load_lock = threading.Lock()
+        self.window_s, self.hop_s, self.rate = window_s, hop_s, rate
+        self._threshold = float(threshold) if threshold is not None else None
+        self.sessions = sessions if sessions is not None else SessionStore()
+        self.counters = {"windows": 0, "audio_seconds": 0.0, "embed_seconds": 0.0}
+
+    @property
+    def embedder(self):
+        # loaded on first use so importing this module stays cheap
+        if self._embedder is None:
+            with self._load_lock:
+                if self._embedder is None:
+                    self._embedder = open_embedder()
+        return self._embedder
+
+    @property
+    def name(self):
+        # known before the model loads, so cache keys cost nothing
+        kind = self._embedder.name if self._embedder is not None else embedder_name()
+        return f"{kind}:w={self.window_s:g}:h={self.hop_s:g}"
+
+    @property
+    def threshold(self):
+        return self._threshold if self._threshold is not None else self.embedder.threshold
+
+    def cache_key(self, audio_key):
+        return None if audio_key is None else f"{audio_key}:embedder={self.name}"
+
+    def embed(self, data, spans=None):
+        """
+        Windows of data (16 kHz float32, VAD-trimmed when spans is given)
+        with their embeddings, timed in the original audio.
+        """
+        started = time.perf_counter()
+        width = int(self.window_s * self.rate)
+        pieces, starts, ends = [], [], []
+        for r_start, r_end, shift in _regions(data, spans, self.rate):
+            if r_end - r_start < MIN_WINDOW_S:
+                continue
+            w_starts = _cut(r_start, r_end, self.window_s, self.hop_s)
+            centres = np.minimum(w_starts + self.window_s / 2, (r_start + r_end) / 2)
+            bounds = np.concatenate([[r_start], (centres[1:] + centres[:-1]) / 2, [r_end]])
+            starts.extend(bounds[:-1] + shift)
+            ends.extend(bounds[1:] + shift)
+            for s in w_starts:
+                piece = data[int(s * self.rate):int(s * self.rate) + width]
+                # short regions are looped to a full window
+                pieces.append(piece if len(piece) == width else np.resize(piece, width))
+        vectors = []
+        for i in range(0, len(pieces), BATCH):
+            vectors.append(np.asarray(self.embedder(np.stack(pieces[i:i + BATCH])), dtype=np.float32))
+        vectors = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        self.counters["windows"] += len(pieces)
+        self.counters["audio_seconds"] += len(data) / self.rate
+        self.counters["embed_seconds"] += time.perf_counter() - started
+        return Windows(starts, ends, vectors)
+
+    def session(self, session_id):
+        # None: a one-off session, kept by the caller only
+        if session_id is None:
+            return SpeakerSession(None, self.name)
+        return self.sessions.get(session_id, self.name)
+
+    def assign(self, session, windows, key=None):
+        """
+        Speaker turns for windows within session (a SpeakerSession or its id).
+        key identifies the audio; a session learns from each key only once.
+        """
+        if not isinstance(session, SpeakerSession):
+            session = self.session(session)
+        with session.lock:
+            learn = session.remember(key)
+            labels = session.assign(windows.vectors, self.threshold, learn=learn)
+            if learn and len(windows):
+                self.sessions.save(session)
+        return turns(windows, _smooth(labels))
+
+    def stats(self):
+        stats = dict(self.counters, **self.sessions.stats())
+        if self.counters["embed_seconds"]:
+            stats["x_realtime"] = self.counters["audio_seconds"] / self.counters["embed_seconds"]
+        return stats
+
+
+def _smooth(labels):
+    # a single window between two of the same speaker is that speaker
+    labels = labels.copy()
+    if len(labels) > 2:
+        flip = (labels[:-2] == labels[2:]) & (labels[1:-1] != labels[:-2])
+        labels[1:-1][flip] = labels[:-2][flip]
+    return labels
+
+
+def turns(windows, labels):
+    """
+    Consecutive windows of one speaker joined into {"start", "end", "speaker"}.
+    """
+    out = []
+    for start, end, label in zip(windows.starts, windows.ends, labels):
+        speaker = speaker_name(int(label))
+        if out and out[-1]["speaker"] == speaker and start - out[-1]["end"] < 1e-6:
+            out[-1]["end"] = float(end)
+        else:
+            out.append({"start": float(start), "end": float(end), "speaker": speaker})
+    return out
+
+
+diarizer = Diarizer()
@@ -0,0 +1,334 @@
+# exports.py
+"""
+Transcript exports written straight to a byte stream.
+
+    for block in export_stream(segments, "docx"):
+        ...   # bytes, ~64 KB at a time
+
+DOCX is produced without python-docx: the fixed package parts are built once
+at import, and word/document.xml is written paragraph by paragraph into a
+zip stream, so memory stays flat and nothing touches disk. The document
+looks like the one build_docx_from_segments used to make (a Heading 1 title,
+then per segment a bold "speaker [start - end]" line and the text).
+
+LiveDocx is the same document kept per live room: each segment's paragraph
+is deflated as it arrives, and snapshot() wraps the compressed body with the
+precompressed fixed parts, so a download does no rendering or compression.
+
+txt, srt, vtt and jsonl are written from the same segment iterator.
+streaming_response() wraps export_stream for the FastAPI export routes.
+"""
+import json
+import re
+import struct
+import time
+import zipfile
+import zlib
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+BLOCK_BYTES = 64 * 1024
+
+EXPORT_FORMATS = {
+    # format -> (media type, file extension)
+    "docx": ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "docx"),
+    "txt": ("text/plain; charset=utf-8", "txt"),
+    "srt": ("application/x-subrip; charset=utf-8", "srt"),
+    "vtt": ("text/vtt; charset=utf-8", "vtt"),
+    "jsonl": ("application/x-ndjson; charset=utf-8", "jsonl"),
+}
+
+DEFAULT_TITLE = "தமிழ் உரை (Transcription)"
+DEFAULT_SPEAKER = "பேச்சாளர்"
+
+_W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+).encode("utf-8")
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+).encode("utf-8")
+
+_DOCUMENT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+).encode("utf-8")
+
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<w:styles xmlns:w="{_W}">'
+    '<w:docDefaults><w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="Calibri" w:hAnsi="Calibri" w:cs="Latha"/><w:sz w:val="22"/><w:szCs w:val="22"/>'
+    '</w:rPr></w:rPrDefault></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/>'
+    '<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>'
+    '<w:pPr><w:keepNext/><w:spacing w:before="480" w:after="120"/><w:outlineLvl w:val="0"/></w:pPr>'
+    '<w:rPr><w:b/><w:bCs/><w:color w:val="365F91"/><w:sz w:val="28"/><w:szCs w:val="28"/></w:rPr>'
+    '</w:style>'
+    '</w:styles>'
+).encode("utf-8")
+
+_DOCUMENT_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<w:document xmlns:w="{_W}"><w:body>'
+)
+_DOCUMENT_TAIL = (
+    '<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" w:header="720" w:footer="720" w:gutter="0"/>'
+    '</w:sectPr></w:body></w:document>'
+)
+
+# characters XML 1.0 does not allow
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def _xml_text(text):
+    return escape(_INVALID_XML.sub("", text))
+
+
+def _run(text, bold=False, breaks=0):
+    props = "<w:rPr><w:b/><w:bCs/></w:rPr>" if bold else ""
+    return f'<w:r>{props}<w:t xml:space="preserve">{_xml_text(text)}</w:t>{"<w:br/>" * breaks}</w:r>'
+
+
+def heading_xml(text):
+    return f'<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr>{_run(text)}</w:p>'
+
+
+def paragraph_xml(text):
+    return f"<w:p>{_run(text)}</w:p>"
+
+
+def segment_header(seg, include_timestamps=True):
+    header = f"{seg.get('speaker', DEFAULT_SPEAKER)} "
+    if include_timestamps:
+        header += f"[{seg.get('start', 0):.2f}s - {seg.get('end', 0):.2f}s]"
+    return header
+
+
+def segment_xml(seg, include_timestamps=True):
+    # bold header line, then the text and a blank line, as python-docx runs with "\n" produced
+    return (f"<w:p>{_run(segment_header(seg, include_timestamps), bold=True, breaks=1)}"
+            f"{_run(seg.get('text', ''), breaks=2)}</w:p>")
+
+
+class _Sink:
+    """
+    Write-only file object for zipfile; the generator drains it between writes.
+    """
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        out = b"".join(self.parts)
+        self.parts, self.size = [], 0
+        return out
+
+
+def docx_stream(paragraphs, block_bytes=BLOCK_BYTES):
+    """
+    paragraphs: iterable of <w:p> XML strings. Yields the .docx bytes.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        zf.writestr("word/_rels/document.xml.rels", _DOCUMENT_RELS)
+        zf.writestr("word/styles.xml", _STYLES)
+        with zf.open("word/document.xml", "w", force_zip64=True) as doc:
+            doc.write(_DOCUMENT_HEAD.encode("utf-8"))
+            pending = []
+            size = 0
+            for p in paragraphs:
+                pending.append(p)
+                size += len(p)
+                if size >= block_bytes:
+                    doc.write("".join(pending).encode("utf-8"))
+                    pending, size = [], 0
+                    if sink.size >= block_bytes:
+                        yield sink.drain()
+            pending.append(_DOCUMENT_TAIL)
+            doc.write("".join(pending).encode("utf-8"))
+    yield sink.drain()
+
+
+def docx_from_segments(segments, title=DEFAULT_TITLE, include_timestamps=True):
+    def paragraphs():
+        yield heading_xml(title)
+        for seg in segments:
+            yield segment_xml(seg, include_timestamps)
+    return docx_stream(paragraphs())
+
+
+def docx_from_text(text, title="Document"):
+    def paragraphs():
+        yield heading_xml(title)
+        for line in text.split("\n"):
+            yield paragraph_xml(line)
+    return docx_stream(paragraphs())
+
+
+_Member = namedtuple("_Member", "name data crc size")
+
+
+def _deflated(name, raw):
+    deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return _Member(name.encode("ascii"), deflate.compress(raw) + deflate.flush(), zlib.crc32(raw), len(raw))
+
+
+_FIXED_MEMBERS = [
+    _deflated("[Content_Types].xml", _CONTENT_TYPES),
+    _deflated("_rels/.rels", _ROOT_RELS),
+    _deflated("word/_rels/document.xml.rels", _DOCUMENT_RELS),
+    _deflated("word/styles.xml", _STYLES),
+]
+
+
+def _zip_parts(members):
+    # stored sizes are 32-bit; a live transcript stays far below 4 GB
+    parts, central, offset = [], [], 0
+    for m in members:
+        local = struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, 0, 8, 0, 0x21,
+                            m.crc, len(m.data), m.size, len(m.name), 0) + m.name
+        central.append(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, 20, 20, 0, 8, 0, 0x21,
+                                   m.crc, len(m.data), m.size, len(m.name), 0, 0, 0, 0, 0, offset) + m.name)
+        parts += [local, m.data]
+        offset += len(local) + len(m.data)
+    directory = b"".join(central)
+    end = struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(members), len(members), len(directory), offset, 0)
+    return parts + [directory + end]
+
+
+class LiveDocx:
+    """
+    A transcript .docx that grows one segment at a time.
+    snapshot() returns the file as a list of byte strings.
+    """
+    def __init__(self, title=DEFAULT_TITLE, include_timestamps=True):
+        self.include_timestamps = include_timestamps
+        self.segments = 0
+        self.updated = time.monotonic()
+        self._deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+        self._body = bytearray()
+        self._crc = 0
+        self._size = 0
+        self._feed(_DOCUMENT_HEAD + heading_xml(title))
+
+    def _feed(self, xml):
+        data = xml.encode("utf-8")
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._body += self._deflate.compress(data)
+
+    def append(self, seg):
+        self._feed(segment_xml(seg, self.include_timestamps))
+        self.segments += 1
+        self.updated = time.monotonic()
+
+    def snapshot(self):
+        # finish a copy of the compressor so the live one keeps appending
+        tail = _DOCUMENT_TAIL.encode("utf-8")
+        finish = self._deflate.copy()
+        body = bytes(self._body) + finish.compress(tail) + finish.flush()
+        document = _Member(b"word/document.xml", body, zlib.crc32(tail, self._crc), self._size + len(tail))
+        return _zip_parts(_FIXED_MEMBERS + [document])
+
+
+def _timestamp(seconds, sep):
+    ms = int(round(max(seconds, 0.0) * 1000))
+    h, rest = divmod(ms, 3600_000)
+    m, rest = divmod(rest, 60_000)
+    s, ms = divmod(rest, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}{sep}{ms:03d}"
+
+
+def _vtt_text(text):
+    # cue text is HTML-like: a bare "<" or "&" would start a tag or an entity
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _lines(segments, fmt, include_timestamps=True):
+    if fmt == "vtt":
+        yield "WEBVTT\n\n"
+    for i, seg in enumerate(segments, 1):
+        speaker = seg.get("speaker", DEFAULT_SPEAKER)
+        text = seg.get("text", "").strip()
+        start, end = seg.get("start", 0.0), seg.get("end", 0.0)
+        if fmt == "txt":
+            yield f"{segment_header(seg, include_timestamps)}\n{text}\n\n"
+        elif fmt == "srt":
+            yield f"{i}\n{_timestamp(start, ',')} --> {_timestamp(end, ',')}\n{speaker}: {text}\n\n"
+        elif fmt == "vtt":
+            yield f"{_timestamp(start, '.')} --> {_timestamp(end, '.')}\n<v {_vtt_text(speaker)}>{_vtt_text(text)}\n\n"
+        elif fmt == "jsonl":
+            yield json.dumps({"speaker": speaker, "start": start, "end": end, "text": text},
+                             ensure_ascii=False) + "\n"
+
+
+def text_stream(segments, fmt, include_timestamps=True, block_bytes=BLOCK_BYTES):
+    pending, size = [], 0
+    for line in _lines(segments, fmt, include_timestamps):
+        pending.append(line)
+        size += len(line)
+        if size >= block_bytes:
+            yield "".join(pending).encode("utf-8")
+            pending, size = [], 0
+    if pending:
+        yield "".join(pending).encode("utf-8")
+
+
+def export_stream(segments, fmt="docx", title=DEFAULT_TITLE, include_timestamps=True):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; choose from {sorted(EXPORT_FORMATS)}")
+    if fmt == "docx":
+        return docx_from_segments(segments, title, include_timestamps)
+    return text_stream(segments, fmt, include_timestamps)
+
+
+def streaming_response(segments, fmt, filename="tamil_transcription"):
+    """
+    The export as a FastAPI StreamingResponse; an unknown fmt is a 400.
+    """
+    from fastapi import HTTPException
+    from fastapi.responses import StreamingResponse
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format; choose from {sorted(EXPORT_FORMATS)}")
+    media_type, ext = EXPORT_FORMATS[fmt]
+    return StreamingResponse(export_stream(segments, fmt), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}.{ext}"'})
+
+
+def write_export(segments, path, fmt="docx", **kwargs):
+    with open(path, "wb") as f:
+        for block in export_stream(segments, fmt, **kwargs):
+            f.write(block)
+    return path
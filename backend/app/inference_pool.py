@@ -0,0 +1,283 @@
+# inference_pool.py
+"""
+Whisper inference off the event loop.
+
+Jobs run on a pool of worker processes, each loading WHISPER_MODEL once
+with the WHISPER_BACKEND engine (see whisper_backends.py).
+The number of jobs in flight (running + waiting) is bounded; when the pool
+is full `transcribe` raises PoolSaturated right away so the endpoint can
+answer 503 instead of piling work up. Every job also has a timeout.
+Waiting jobs start in priority order (jobs.PRIORITIES): live-room clips and
+windows are "live" and go ahead of "batch" uploads and jobs.
+
+With INFERENCE_URL set, no model is loaded here: jobs are sent to the
+inference service at that URL (inference_service.py), so several services
+can share one copy of the model. `python app.py` runs things this way.
+
+Config (env):
+    INFERENCE_URL        e.g. http://127.0.0.1:8002; unset = run the pool in this process
+    WHISPER_WORKERS      worker processes (0 = one background thread in this process)
+    WHISPER_MAX_QUEUE    jobs allowed to wait on top of the running ones
+    WHISPER_JOB_TIMEOUT  seconds before a caller gives up on a job
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from jobs import PRIORITIES
+from whisper_backends import BACKEND, backend_id, load_backend
+
+MODEL_NAME = os.getenv("WHISPER_MODEL", "medium")
+WORKERS = int(os.getenv("WHISPER_WORKERS", "1"))
+MAX_QUEUE = int(os.getenv("WHISPER_MAX_QUEUE", "8"))
+JOB_TIMEOUT = float(os.getenv("WHISPER_JOB_TIMEOUT", "300"))
+INFERENCE_URL = os.getenv("INFERENCE_URL", "").rstrip("/")
+# part of the transcript cache key next to MODEL_NAME
+ENGINE = backend_id(BACKEND)
+
+
+class PoolSaturated(Exception):
+    """Raised when WORKERS + MAX_QUEUE jobs are already in flight."""
+
+
+class JobTimeout(Exception):
+    """Raised when a job does not finish within JOB_TIMEOUT seconds."""
+
+
+_executor = None
+_in_flight = 0
+_running = 0        # jobs holding one of the max(WORKERS, 1) worker slots
+_waiting = []       # heap of (priority, seq, future) for a free slot
+_order = itertools.count()
+_ready = False      # every local worker has loaded its model
+_session = None     # aiohttp session to INFERENCE_URL
+
+# set inside each worker by _init_worker
+_worker_backend = None
+_model_load_seconds = None
+
+
+def _init_worker(backend_name, model_name):
+    global _worker_backend, _model_load_seconds
+    start = time.perf_counter()
+    _worker_backend = load_backend(backend_name, model_name)
+    _model_load_seconds = time.perf_counter() - start
+
+
+def _transcribe_job(audio, options):
+    start = time.process_time()
+    result = _worker_backend.transcribe(audio, **options)
+    # CPU spent by the worker, used to price the work VAD lets us skip
+    result["cpu_seconds"] = time.process_time() - start
+    return result
+
+
+def _decode_batch_job(audios, options):
+    start = time.process_time()
+    results = _worker_backend.decode_batch(audios, **options)
+    cpu = time.process_time() - start
+    for r in results:
+        r["cpu_seconds"] = cpu / len(results)
+    return results
+
+
+def _ping():
+    return _model_load_seconds
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        if WORKERS > 0:
+            # spawn: forking a process that already holds torch state is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(BACKEND, MODEL_NAME),
+            )
+        else:
+            _executor = ThreadPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(BACKEND, MODEL_NAME))
+    return _executor
+
+
+def capacity():
+    return max(WORKERS, 1) + MAX_QUEUE
+
+
+def stats():
+    if INFERENCE_URL:
+        return {"remote": INFERENCE_URL}
+    return {"backend": BACKEND, "workers": WORKERS, "in_flight": _in_flight, "waiting": len(_waiting),
+            "capacity": capacity()}
+
+
+metrics.Gauge("transcriber_inference_in_flight", "Inference jobs running or queued", fn=lambda: _in_flight)
+metrics.Gauge("transcriber_inference_capacity", "Inference jobs allowed in flight", fn=capacity)
+
+
+async def _acquire(priority):
+    # a worker slot; when none is free, wait behind higher-priority and older jobs
+    global _running
+    if _running < max(WORKERS, 1) and not _waiting:
+        _running += 1
+        return
+    future = asyncio.get_running_loop().create_future()
+    heapq.heappush(_waiting, (PRIORITIES.get(priority, PRIORITIES["batch"]), next(_order), future))
+    try:
+        await future
+    except asyncio.CancelledError:
+        if future.done() and not future.cancelled():
+            _release()      # the slot was handed over just as we gave up
+        raise
+
+
+def _release():
+    # hand the slot to the next waiter still interested, else free it
+    global _running
+    while _waiting:
+        _, _, future = heapq.heappop(_waiting)
+        if not future.done():
+            future.set_result(None)
+            return
+    _running -= 1
+
+
+def _job_done(_future):
+    global _in_flight
+    _in_flight -= 1
+    _release()
+
+
+async def submit(fn, *args, timeout=None, priority="batch"):
+    """
+    Run fn(*args) on the pool with backpressure, priority and a timeout.
+    A job that times out keeps its slot until the worker actually finishes,
+    so the in-flight count always reflects real load.
+    """
+    global _in_flight
+    if _in_flight >= capacity():
+        raise PoolSaturated(f"{_in_flight} inference jobs in flight")
+    timeout = timeout or JOB_TIMEOUT
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    _in_flight += 1
+    try:
+        await asyncio.wait_for(_acquire(priority), timeout)
+    except BaseException as e:
+        _in_flight -= 1
+        if isinstance(e, asyncio.TimeoutError):
+            raise JobTimeout(f"inference job waited more than {timeout:g}s for a worker")
+        raise
+    future = get_executor().submit(fn, *args)
+    # done callbacks may fire on the executor's thread; hop back to the loop
+    future.add_done_callback(lambda f: loop.call_soon_threadsafe(_job_done, f))
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - loop.time(), 0.001))
+    except asyncio.TimeoutError:
+        future.cancel()
+        raise JobTimeout(f"inference job exceeded {timeout:.0f}s")
+
+
+def _get_session():
+    global _session
+    if _session is None or _session.closed:
+        import aiohttp
+        _session = aiohttp.ClientSession()
+    return _session
+
+
+async def _remote(route, body, params, timeout=None):
+    """
+    POST float32 PCM to the inference service. Its 503/504 answers come back
+    as PoolSaturated/JobTimeout, so callers behave the same either way.
+    """
+    import aiohttp
+    timeout = timeout or JOB_TIMEOUT
+    try:
+        async with _get_session().post(f"{INFERENCE_URL}{route}", data=body, params=params,
+                                       timeout=aiohttp.ClientTimeout(total=timeout + 5)) as resp:
+            if resp.status == 503:
+                raise PoolSaturated(await resp.text())
+            if resp.status == 504:
+                raise JobTimeout(await resp.text())
+            resp.raise_for_status()
+            return await resp.json()
+    except asyncio.TimeoutError:
+        raise JobTimeout(f"inference service did not answer within {timeout:.0f}s")
+
+
+def _pcm_bytes(audio):
+    return np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+
+
+async def transcribe(audio, timeout=None, priority="batch", **options):
+    """
+    audio: WAV path or 16 kHz float32 array. Returns the whisper result dict.
+    """
+    if INFERENCE_URL:
+        params = {"options": json.dumps(options), "timeout": str(timeout or JOB_TIMEOUT), "priority": priority}
+        if isinstance(audio, str):
+            # same host: the service reads the file itself
+            return await _remote("/infer/transcribe", b"", dict(params, path=audio), timeout)
+        return await _remote("/infer/transcribe", _pcm_bytes(audio), params, timeout)
+    return await submit(_transcribe_job, audio, options, timeout=timeout, priority=priority)
+
+
+async def transcribe_batch(audios, timeout=None, priority="batch", **options):
+    """
+    audios: list of 16 kHz float32 arrays, each at most 30 s long.
+    Runs as a single pool job; returns one result dict per array.
+    """
+    if INFERENCE_URL:
+        params = {"options": json.dumps(options), "timeout": str(timeout or JOB_TIMEOUT), "priority": priority,
+                  "lengths": ",".join(str(len(a)) for a in audios)}
+        return await _remote("/infer/batch", b"".join(_pcm_bytes(a) for a in audios), params, timeout)
+    return await submit(_decode_batch_job, audios, options, timeout=timeout, priority=priority)
+
+
+async def warm_up():
+    # start every worker (and load its model) before the first request arrives
+    global _ready
+    if INFERENCE_URL:
+        return
+    loads = await asyncio.gather(*(submit(_ping, timeout=JOB_TIMEOUT) for _ in range(max(WORKERS, 1))))
+    for worker, seconds in enumerate(loads):
+        if seconds is not None:
+            metrics.MODEL_LOAD_SECONDS.set(seconds, worker=worker)
+    _ready = True
+
+
+async def ready():
+    """
+    True once a model is loaded and can take jobs: the local workers have
+    warmed up, or the inference service at INFERENCE_URL reports ready.
+    """
+    if not INFERENCE_URL:
+        return _ready
+    import aiohttp
+    try:
+        async with _get_session().get(f"{INFERENCE_URL}/ready",
+                                      timeout=aiohttp.ClientTimeout(total=2)) as resp:
+            return resp.status == 200
+    except Exception:
+        return False
+
+
+def shutdown():
+    global _executor, _session, _ready
+    _ready = False
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if _session is not None:
+        asyncio.get_running_loop().create_task(_session.close())
+        _session = None
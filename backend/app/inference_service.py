@@ -0,0 +1,114 @@
+# inference_service.py
+"""
+Hosts the Whisper model once for every other service.
+
+main.py and room/transcription_service.py started with INFERENCE_URL pointing
+here send their jobs over HTTP instead of loading their own copy of the model
+(see inference_pool.py). Audio travels as raw little-endian float32 PCM at
+16 kHz; the answer is the usual whisper result dict.
+
+    POST /infer/transcribe?options={...}            body: one clip
+    POST /infer/transcribe?options={...}&path=...   no body, file on this host
+                                                    (only under UPLOAD_DIR)
+    POST /infer/batch?options={...}&lengths=n1,n2   body: clips back to back
+
+Both take &priority=live|batch (see inference_pool.py).
+    GET  /ready                                     200 once the model is loaded
+
+Run it without INFERENCE_URL set (app.py does this on 127.0.0.1:8002).
+"""
+import asyncio
+import json
+import os
+from typing import Optional
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+import inference_pool
+import metrics
+from jobs import PRIORITIES
+
+SAMPLE_RATE = 16000
+# the other services' temp files; path= may not point anywhere else
+UPLOAD_DIR = os.path.realpath("/tmp/tamil_transcribe")
+
+app = FastAPI(title="Whisper inference")
+metrics.install(app)
+
+
+@app.on_event("startup")
+async def start_inference_pool():
+    if inference_pool.INFERENCE_URL:
+        raise RuntimeError("INFERENCE_URL must not be set for the inference service itself")
+    asyncio.create_task(inference_pool.warm_up())
+
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    inference_pool.shutdown()
+
+
+def _priority(priority):
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {list(PRIORITIES)}")
+    return priority
+
+
+async def _run(coro):
+    try:
+        return await coro
+    except inference_pool.PoolSaturated:
+        raise HTTPException(status_code=503, detail="Transcription queue is full, retry later",
+                            headers={"Retry-After": "5"})
+    except inference_pool.JobTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+
+def _upload_path(path):
+    # no URLs or files outside the upload dir reach whisper/ffmpeg
+    resolved = os.path.realpath(path)
+    if os.path.commonpath([resolved, UPLOAD_DIR]) != UPLOAD_DIR or not os.path.isfile(resolved):
+        raise HTTPException(status_code=400, detail="path must be an uploaded file")
+    return resolved
+
+
+@app.post("/infer/transcribe")
+async def infer_transcribe(request: Request, options: str = "{}", timeout: Optional[float] = None,
+                           path: Optional[str] = None, priority: str = "batch"):
+    if path:
+        audio = _upload_path(path)
+    else:
+        audio = np.frombuffer(await request.body(), dtype=np.float32).copy()
+        metrics.AUDIO_SECONDS.inc(len(audio) / SAMPLE_RATE)
+    with metrics.span("whisper", len(audio) / SAMPLE_RATE if path is None else None):
+        return await _run(inference_pool.transcribe(audio, timeout=timeout, priority=_priority(priority),
+                                                    **json.loads(options)))
+
+
+@app.post("/infer/batch")
+async def infer_batch(request: Request, lengths: str, options: str = "{}", timeout: Optional[float] = None,
+                      priority: str = "batch"):
+    pcm = np.frombuffer(await request.body(), dtype=np.float32)
+    sizes = [int(n) for n in lengths.split(",") if n]
+    if sum(sizes) != len(pcm):
+        raise HTTPException(status_code=400, detail="lengths do not match the body")
+    audios = np.split(pcm.copy(), np.cumsum(sizes)[:-1])
+    seconds = len(pcm) / SAMPLE_RATE
+    metrics.AUDIO_SECONDS.inc(seconds)
+    with metrics.span("whisper_batch", seconds):
+        return await _run(inference_pool.transcribe_batch(audios, timeout=timeout, priority=_priority(priority),
+                                                          **json.loads(options)))
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    if await inference_pool.ready():
+        return {"status": "ready", **inference_pool.stats()}
+    return JSONResponse({"status": "loading"}, status_code=503)
@@ -0,0 +1,182 @@
+# ingest.py
+"""
+Per-room work queue for audio blobs in the room server.
+
+Every room has its own FIFO of blobs, numbered in arrival (capture) order.
+A fixed set of workers takes blobs from rooms round-robin, so one busy room
+cannot starve the others, and at most ROOM_CONCURRENCY blobs of a room are
+transcribed at once. Results may finish out of order; they are handed to
+`deliver` strictly in sequence order. When a room already has ROOM_MAX_QUEUED
+blobs waiting, `submit` refuses the blob and the caller tells the client.
+
+    ingest = RoomIngest(process, deliver)
+    seq = ingest.submit(room_id, item)     # None when the room's queue is full
+    ingest.evict_idle(idle_s)              # forget rooms drained for idle_s
+
+process(room_id, item) -> result   (async, the slow part)
+deliver(room_id, seq, item, result) (async, called in seq order; result is
+                                     None when process raised)
+
+Config (env):
+    INGEST_WORKERS     blobs in flight across all rooms
+    ROOM_CONCURRENCY   blobs in flight per room
+    ROOM_MAX_QUEUED    blobs waiting per room before new ones are dropped
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "8"))
+ROOM_CONCURRENCY = int(os.getenv("ROOM_CONCURRENCY", "2"))
+ROOM_MAX_QUEUED = int(os.getenv("ROOM_MAX_QUEUED", "32"))
+
+
+class _RoomQueue:
+    __slots__ = ("pending", "in_flight", "next_seq", "next_deliver", "done", "delivering", "last_active")
+
+    def __init__(self):
+        self.pending = deque()     # (seq, item) not started yet
+        self.in_flight = 0
+        self.next_seq = 0
+        self.next_deliver = 0
+        self.done = {}             # seq -> (item, result) finished early, waiting for its turn
+        self.delivering = False
+        self.last_active = time.monotonic()
+
+
+class RoomIngest:
+    def __init__(self, process, deliver, workers=INGEST_WORKERS,
+                 per_room=ROOM_CONCURRENCY, max_queued=ROOM_MAX_QUEUED):
+        self.process = process
+        self.deliver = deliver
+        self.workers = workers
+        self.per_room = per_room
+        self.max_queued = max_queued
+        self.rooms = {}
+        self._turns = deque()      # rooms with runnable work, in round-robin order
+        self._wakeup = None
+        self._tasks = []
+        self.dropped = 0
+        self.evicted = 0
+
+    def _start(self):
+        self._wakeup = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def queued(self, room_id):
+        room = self.rooms.get(room_id)
+        return len(room.pending) if room else 0
+
+    def _runnable(self, room_id):
+        room = self.rooms.get(room_id)
+        return room is not None and room.pending and room.in_flight < self.per_room
+
+    def submit(self, room_id, item):
+        """
+        Queue item for room_id; returns its sequence number, or None if the
+        room already has max_queued items waiting.
+        """
+        if not self._tasks:
+            self._start()
+        room = self.rooms.setdefault(room_id, _RoomQueue())
+        room.last_active = time.monotonic()
+        if len(room.pending) >= self.max_queued:
+            self.dropped += 1
+            return None
+        seq = room.next_seq
+        room.next_seq += 1
+        room.pending.append((seq, item))
+        if room_id not in self._turns:
+            self._turns.append(room_id)
+        asyncio.get_running_loop().create_task(self._notify())
+        return seq
+
+    async def _notify(self):
+        async with self._wakeup:
+            self._wakeup.notify()
+
+    def _next(self):
+        # first room in turn order that may start another item; it goes to the back
+        for _ in range(len(self._turns)):
+            room_id = self._turns.popleft()
+            if not self._runnable(room_id):
+                continue
+            room = self.rooms[room_id]
+            seq, item = room.pending.popleft()
+            room.in_flight += 1
+            if room.pending:
+                self._turns.append(room_id)
+            return room_id, seq, item
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                job = self._next()
+                while job is None:
+                    await self._wakeup.wait()
+                    job = self._next()
+            room_id, seq, item = job
+            try:
+                result = await self.process(room_id, item)
+            except Exception as e:
+                print(f"Ingest for room {room_id} failed:", e)
+                result = None
+            room = self.rooms[room_id]
+            room.in_flight -= 1
+            room.done[seq] = (item, result)
+            # the room may have been capped at per_room; give it its turn back
+            if room.pending and room_id not in self._turns:
+                self._turns.append(room_id)
+            async with self._wakeup:
+                self._wakeup.notify()
+            await self._deliver_ready(room_id, room)
+
+    async def _deliver_ready(self, room_id, room):
+        # one deliverer per room at a time keeps emissions in seq order
+        if room.delivering:
+            return
+        room.delivering = True
+        try:
+            while room.next_deliver in room.done:
+                item, result = room.done.pop(room.next_deliver)
+                seq = room.next_deliver
+                room.next_deliver += 1
+                try:
+                    await self.deliver(room_id, seq, item, result)
+                except Exception as e:
+                    print(f"Delivering seq {seq} in room {room_id} failed:", e)
+        finally:
+            room.delivering = False
+            room.last_active = time.monotonic()
+
+    def evict_idle(self, idle_s):
+        """
+        Forgets rooms with nothing waiting, in flight or undelivered for
+        idle_s seconds and returns their ids. A room that comes back starts
+        again at seq 0.
+        """
+        now = time.monotonic()
+        idle = [room_id for room_id, room in self.rooms.items()
+                if not (room.pending or room.in_flight or room.done or room.delivering)
+                and now - room.last_active >= idle_s]
+        for room_id in idle:
+            del self.rooms[room_id]
+        self.evicted += len(idle)
+        return idle
+
+    def stats(self):
+        return {
+            "rooms": len(self.rooms),
+            "queued": sum(len(r.pending) for r in self.rooms.values()),
+            "in_flight": sum(r.in_flight for r in self.rooms.values()),
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+        }
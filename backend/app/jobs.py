@@ -0,0 +1,184 @@
+# jobs.py
+"""
+Asynchronous transcription jobs.
+
+POST /api/jobs stores the upload and returns a job id at once. Jobs wait in a
+priority queue ("live" before "batch") and JOB_WORKERS of them run at a time;
+their Whisper calls keep the priority in the inference pool, where live-room
+clips from the transcription service also run as "live", and wait while the
+pool is saturated instead of failing. Each job tracks its pipeline stages, collects segments as they
+are produced, and pushes events to subscribers (the SSE endpoint). Finished
+jobs are written to JOB_DIR so results can still be fetched after they drop
+out of memory.
+
+Config (env):
+    JOB_WORKERS     jobs running concurrently
+    JOB_MAX_QUEUED  jobs allowed to wait before POST /api/jobs answers 503
+    JOB_KEEP        finished jobs kept in memory
+    JOB_DIR         where finished jobs are stored
+"""
+import asyncio
+import itertools
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+JOB_KEEP = int(os.getenv("JOB_KEEP", "200"))
+JOB_DIR = os.getenv("JOB_DIR", "/tmp/tamil_transcribe/jobs")
+
+STAGES = ("decode", "denoise", "transcribe", "diarize", "merge")
+PRIORITIES = {"live": 0, "batch": 1}
+
+
+class QueueFull(Exception):
+    """Raised when JOB_MAX_QUEUED jobs are already waiting."""
+
+
+class NullReport:
+    """
+    Progress sink used when a pipeline runs outside a job.
+    """
+    def stage(self, name, status, progress=None):
+        pass
+
+    def segments(self, segments):
+        pass
+
+
+class Job:
+    def __init__(self, kind, priority, params):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.priority = priority
+        self.params = params
+        self.status = "queued"
+        self.stages = {name: {"status": "pending", "progress": 0.0} for name in STAGES}
+        self.partial_segments = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._subscribers = []
+
+    # progress reporting, called by the pipeline
+    def stage(self, name, status, progress=None):
+        entry = self.stages[name]
+        entry["status"] = status
+        if progress is not None:
+            entry["progress"] = progress
+        elif status in ("done", "cached", "skipped"):
+            entry["progress"] = 1.0
+        self._publish("stage", {"stage": name, **entry})
+
+    def segments(self, segments):
+        for seg in segments:
+            self.partial_segments.append(seg)
+            self._publish("segment", seg)
+
+    def subscribe(self):
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def _publish(self, event, data):
+        for queue in self._subscribers:
+            queue.put_nowait((event, data))
+
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def to_dict(self, include_segments=True):
+        out = {
+            "id": self.id,
+            "kind": self.kind,
+            "priority": self.priority,
+            "status": self.status,
+            "stages": self.stages,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+        if include_segments:
+            out["segments"] = self.result if self.result is not None else self.partial_segments
+        return out
+
+
+class JobScheduler:
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED, keep=JOB_KEEP, job_dir=JOB_DIR):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.keep = keep
+        self.job_dir = Path(job_dir)
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        self.jobs = OrderedDict()
+        self._queue = None
+        self._seq = itertools.count()
+        self._tasks = []
+
+    def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def submit(self, run, kind="transcribe", priority="batch", params=None):
+        """
+        run: async callable taking the Job (used as the progress report) and
+        returning the final segments.
+        """
+        if self._queue.qsize() >= self.max_queued:
+            raise QueueFull(f"{self._queue.qsize()} jobs waiting")
+        job = Job(kind, priority, params or {})
+        self.jobs[job.id] = job
+        self._queue.put_nowait((PRIORITIES.get(priority, 1), next(self._seq), job, run))
+        return job
+
+    def queued(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get(self, job_id):
+        """
+        Job object while in memory, else the stored dict, else None.
+        """
+        if job_id in self.jobs:
+            return self.jobs[job_id]
+        path = self.job_dir / f"{Path(job_id).name}.json"
+        if path.exists():
+            return json.loads(path.read_text(encoding="utf-8"))
+        return None
+
+    async def _worker(self):
+        while True:
+            _, _, job, run = await self._queue.get()
+            job.status = "running"
+            job._publish("status", {"status": job.status})
+            try:
+                job.result = await run(job)
+                job.status = "done"
+            except Exception as e:
+                print(f"Job {job.id} failed:", e)
+                job.error = str(e)
+                job.status = "failed"
+            job.finished_at = time.time()
+            job._publish("done", job.to_dict())
+            self._store(job)
+
+    def _store(self, job):
+        path = self.job_dir / f"{job.id}.json"
+        path.write_text(json.dumps(job.to_dict(), ensure_ascii=False), encoding="utf-8")
+        # keep only the most recent finished jobs in memory
+        finished = [j for j in self.jobs.values() if j.finished()]
+        for old in finished[:max(0, len(finished) - self.keep)]:
+            del self.jobs[old.id]
@@ -0,0 +1,239 @@
+# longform.py
+"""
+Long-recording mode for /api/transcribe_text.
+
+The upload is decoded by a streaming ffmpeg process into 16 kHz PCM blocks,
+cut into ~LONGFORM_CHUNK_S chunks at the quietest point near each boundary
+(with LONGFORM_OVERLAP_S of overlap), and the chunks are transcribed in
+parallel on the inference pool. Only a few chunks are alive at any time, so
+memory stays flat however long the recording is. Segments are shifted back to
+absolute time and de-duplicated in the overlaps: each overlap is split at its
+midpoint and a segment is kept by the chunk its midpoint falls in.
+
+With diarization, each chunk's speech windows are embedded alongside its
+Whisper job and clustered in chunk order into one speaker session, so a
+speaker keeps their label from the first chunk to the last.
+"""
+import asyncio
+import os
+import subprocess
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+import inference_pool
+import metrics
+from diarization import diarizer
+from transcribe_utils import process_array, remap_segments, compact_segment
+
+SAMPLE_RATE = 16000
+CHUNK_S = float(os.getenv("LONGFORM_CHUNK_S", "60"))
+OVERLAP_S = float(os.getenv("LONGFORM_OVERLAP_S", "2"))
+SEARCH_S = float(os.getenv("LONGFORM_SEARCH_S", "5"))
+PARALLEL = int(os.getenv("LONGFORM_PARALLEL", str(max(inference_pool.WORKERS, 1))))
+
+
+def iter_pcm_blocks(path: str, sr: int = SAMPLE_RATE, block_s: float = 1.0):
+    """
+    Decode any ffmpeg-readable file to mono float32 blocks without loading it whole.
+    """
+    proc = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+         "-f", "s16le", "-ac", "1", "-ar", str(sr), "-"],
+        stdout=subprocess.PIPE,
+    )
+    block_bytes = int(block_s * sr) * 2
+    try:
+        while True:
+            raw = proc.stdout.read(block_bytes)
+            if not raw:
+                break
+            yield np.frombuffer(raw[:len(raw) - len(raw) % 2], dtype=np.int16).astype(np.float32) / 32768.0
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+
+def quietest_point(data: np.ndarray, lo: int, hi: int, frame: int = 480) -> int:
+    # centre of the lowest-energy 30 ms frame in data[lo:hi]
+    n = (hi - lo) // frame
+    if n <= 0:
+        return hi
+    energy = np.square(data[lo:lo + n * frame].reshape(n, frame)).mean(axis=1)
+    return lo + int(np.argmin(energy)) * frame + frame // 2
+
+
+def iter_chunks(blocks, sr: int = SAMPLE_RATE, chunk_s: float = CHUNK_S,
+                overlap_s: float = OVERLAP_S, search_s: float = SEARCH_S):
+    """
+    Yields (offset_seconds, chunk) with consecutive chunks overlapping by overlap_s.
+    """
+    chunk_len, overlap, search = int(chunk_s * sr), int(overlap_s * sr), int(search_s * sr)
+    buf = np.zeros(0, dtype=np.float32)
+    offset = 0
+    first = True
+    for block in blocks:
+        buf = np.concatenate([buf, block])
+        while len(buf) >= chunk_len:
+            cut = quietest_point(buf, max(chunk_len - search, overlap + 1), chunk_len)
+            yield offset / sr, buf[:cut]
+            first = False
+            start = cut - overlap
+            buf = buf[start:].copy()
+            offset += start
+    # the tail is only new audio if it goes beyond the overlap already transcribed
+    if len(buf) > (0 if first else overlap):
+        yield offset / sr, buf
+
+
+def stitch(chunks, overlap_s: float = OVERLAP_S):
+    """
+    chunks: [(offset, segments in absolute time)] in order. Each overlap is split
+    at its midpoint; a segment belongs to the chunk its midpoint falls in.
+    """
+    out = []
+    for i, (offset, segments) in enumerate(chunks):
+        lo = offset + overlap_s / 2 if i > 0 else float("-inf")
+        hi = chunks[i + 1][0] + overlap_s / 2 if i + 1 < len(chunks) else float("inf")
+        out.extend(_owned(segments, lo, hi))
+    return out
+
+
+def _owned(segments, lo, hi):
+    # the segments whose midpoint falls in [lo, hi)
+    return [seg for seg in segments if lo <= (seg["start"] + seg["end"]) / 2 < hi]
+
+
+async def _transcribe_chunk(offset, chunk, language, do_denoise, vad, diarize=False, words=False,
+                            priority="batch", max_wait=None):
+    """
+    Returns (offset, segments, windows): windows are the chunk's embedded
+    speech windows in absolute time when diarize, else None.
+    Raises PoolSaturated once the pool has stayed full for max_wait seconds.
+    """
+    seconds = len(chunk) / SAMPLE_RATE
+    metrics.AUDIO_SECONDS.inc(seconds)
+    with metrics.span("denoise", seconds):
+        processed, spans = await run_in_threadpool(process_array, chunk, SAMPLE_RATE,
+                                                   do_denoise=do_denoise, vad=vad)
+    if processed is None:
+        return offset, [], None
+    windows = None
+    if diarize:
+        # embeddings do not depend on the session, so chunks embed in parallel
+        try:
+            with metrics.span("diarize", seconds):
+                windows = (await run_in_threadpool(diarizer.embed, processed, spans)).shifted(offset)
+        except Exception as e:
+            print("Diarization failed for chunk at", offset, e)
+    loop = asyncio.get_running_loop()
+    deadline = None
+    with metrics.span("whisper", seconds):
+        while True:
+            try:
+                result = await inference_pool.transcribe(processed, language=language, word_timestamps=words,
+                                                         priority=priority)
+                break
+            except inference_pool.PoolSaturated:
+                # other requests hold the pool; wait instead of failing a long file halfway
+                if max_wait is not None:
+                    deadline = deadline or loop.time() + max_wait
+                    if loop.time() >= deadline:
+                        raise
+                await asyncio.sleep(0.5)
+    segments = remap_segments(result.get("segments", []), spans)
+    return offset, [compact_segment(seg, offset, words) for seg in segments], windows
+
+
+def probe_duration(path: str):
+    # container duration in seconds via ffprobe, or None if unknown
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, timeout=30,
+        ).stdout.strip()
+        return float(out)
+    except Exception:
+        return None
+
+
+async def transcribe_long(path, language="ta", do_denoise=True, vad=True, on_chunk=None,
+                          turns=None, session_id=None, words=False, priority="batch", max_wait=None):
+    """
+    Transcribe a file of any length; returns segments in absolute time.
+    on_chunk(stable_segments, seconds_done) is awaited each time the next chunk
+    (in order) completes. stable_segments are final: the chunk that owns them
+    and its successor's overlap are both known; it is one list that grows
+    from call to call. The returned list reuses the same segment dicts.
+    turns: a list to diarize into; speaker turns of each chunk are appended
+    as it completes, named within session_id (see diarization.py).
+    words=True keeps Whisper's word timestamps on each segment.
+    priority: inference priority of the chunks (see inference_pool.py).
+    max_wait: seconds a chunk waits out a full pool before PoolSaturated is
+    raised; None waits as long as it takes.
+    """
+    diarize = turns is not None
+    session = diarizer.session(session_id) if diarize else None
+    covered = 0.0
+    gen = iter_chunks(iter_pcm_blocks(path))
+    slots = asyncio.Semaphore(PARALLEL)
+    order = asyncio.Queue()
+    tasks = []
+
+    async def run(offset, chunk):
+        try:
+            return await _transcribe_chunk(offset, chunk, language, do_denoise, vad, diarize, words, priority,
+                                           max_wait)
+        finally:
+            slots.release()
+
+    async def produce():
+        try:
+            while True:
+                await slots.acquire()
+                item = await run_in_threadpool(next, gen, None)
+                if item is None:
+                    slots.release()
+                    break
+                offset, chunk = item
+                task = asyncio.create_task(run(offset, chunk))
+                tasks.append(task)
+                await order.put((task, offset + len(chunk) / SAMPLE_RATE))
+        finally:
+            await order.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        # a chunk's segments are final once the next chunk's offset closes its range
+        stable = []
+        last = None     # (lo, segments) of the newest chunk
+        while True:
+            item = await order.get()
+            if item is None:
+                break
+            task, chunk_end = item
+            offset, segments, windows = await task
+            lo = offset + OVERLAP_S / 2
+            if last is None:
+                # nothing comes before the first chunk
+                stable.extend(_owned(segments, float("-inf"), lo))
+            else:
+                stable.extend(_owned(last[1], last[0], lo))
+            last = (lo, segments)
+            if windows is not None:
+                # the overlap was diarized with the previous chunk already
+                fresh = windows.select((windows.starts + windows.ends) / 2 >= covered)
+                turns.extend(await run_in_threadpool(diarizer.assign, session, fresh))
+            covered = chunk_end
+            if on_chunk is not None:
+                await on_chunk(stable, chunk_end)
+        await producer
+        if last is not None:
+            stable.extend(_owned(last[1], last[0], float("inf")))
+        return stable
+    finally:
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+        gen.close()
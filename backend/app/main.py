@@ -1,20 +1,29 @@
 import os
 import uuid
+import asyncio
+import json
 from pathlib import Path
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
 from fastapi import Body
-import whisper
-from transcribe_utils import ensure_dir, normalize_to_wav, reduce_noise
-from docx_utils import build_docx_from_segments
-import requests
-import openai
-from io import BytesIO
-from docx import Document
+from fastapi.concurrency import run_in_threadpool
+import inference_pool
+import metrics
+import longform
+from jobs import JobScheduler, Job, NullReport, QueueFull, PRIORITIES
+from transcribe_utils import (ensure_dir, prepare_audio, decode_to_array, process_array,
+                              remap_segments, compact_segment, record_inference_cost, VAD_STATS)
+from transcript_cache import open_cache, audio_digest, stage_keys
+from decoding import decode_file
+from exports import docx_from_text, streaming_response
+from merge_utils import merge
+from diarization import diarizer
+import search_index
+from translation import Translator
+from summarizer import Summarizer, open_client, transcript_lines
 from fastapi.responses import StreamingResponse
-from deep_translator import GoogleTranslator
 
 
 
@@ -24,23 +33,40 @@ from deep_translator import GoogleTranslator
 GROQ_API_URL = "https://api.groq.com/v1"  # example endpoint
 GROQ_API_KEY = "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"
 
-client = openai.OpenAI(
-    api_key=GROQ_API_KEY,
-    base_url="https://api.groq.com/openai/v1"
-)
+# openai, deep_translator and docx are imported on first use so the
+# service starts (and answers /health) without paying for them
+_llm_client = None
+
+def get_llm_client():
+    global _llm_client
+    if _llm_client is None:
+        import openai
+        _llm_client = openai.AsyncOpenAI(
+            api_key=GROQ_API_KEY,
+            base_url="https://api.groq.com/openai/v1"
+        )
+    return _llm_client
 
-# Optional pyannote imports
-USE_PYANNOTE = True
-try:
-    from pyannote.audio import Pipeline
-    _pyannote_pipeline = None
-except Exception:
-    USE_PYANNOTE = False
-    _pyannote_pipeline = None
+# map-reduce summaries with memoisation; LLM_BACKEND=stub for an offline client
+summarizer = Summarizer(open_client(get_llm_client))
 
 UPLOAD_DIR = "/tmp/tamil_transcribe"
 ensure_dir(UPLOAD_DIR)
 
+# Decode uploads straight into memory; set IN_MEMORY_DECODE=0 to use temp files
+IN_MEMORY_DECODE = os.getenv("IN_MEMORY_DECODE", "1") != "0"
+# Drop silence before denoise/Whisper; set VAD_ENABLED=0 to transcribe everything
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") != "0"
+# Keep Whisper's word timestamps (returned per segment and used by /api/search)
+WORD_TIMESTAMPS = os.getenv("WORD_TIMESTAMPS", "1") != "0"
+SAMPLE_RATE = 16000
+
+# Whisper segments, speaker embeddings and processed audio, keyed by PCM hash
+cache = open_cache()
+
+# every finished transcript, searchable at /api/search (shared with the room server)
+transcript_index = search_index.open_index()
+
 app = FastAPI(title="Tamil Audio→Docx Transcriber")
 app.add_middleware(
     CORSMiddleware,
@@ -50,66 +76,236 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-# Load Whisper model (env var WHISPER_MODEL)
-MODEL_NAME = os.getenv("WHISPER_MODEL", "medium")
-model = whisper.load_model(MODEL_NAME)
-
-def get_pyannote_pipeline():
-    global _pyannote_pipeline
-    if not USE_PYANNOTE:
-        return None
-    if _pyannote_pipeline is None:
-        hf_token = os.getenv("HUGGINGFACE_TOKEN")
-        if not hf_token:
-            raise RuntimeError("HUGGINGFACE_TOKEN required for pyannote diarization.")
-        _pyannote_pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization", use_auth_token=hf_token)
-    return _pyannote_pipeline
-
-def run_whisper(wav_path, language="ta"):
-    # returns whisper result dict (with 'segments')
-    result = model.transcribe(wav_path, language=language)
-    return result
-
-def run_pyannote(wav_path):
-    pipeline = get_pyannote_pipeline()
-    if pipeline is None:
-        return None
-    diar = pipeline(wav_path)
-    diar_list = []
-    for turn, _, speaker in diar.itertracks(yield_label=True):
-        diar_list.append({"start": float(turn.start), "end": float(turn.end), "speaker": str(speaker)})
-    return diar_list
-
-def merge(whisper_segments, diarization_list=None):
+# Whisper runs in inference_pool workers (env var WHISPER_MODEL, WHISPER_BACKEND, WHISPER_WORKERS)
+MODEL_NAME = inference_pool.MODEL_NAME
+
+# Background transcription jobs (POST /api/jobs)
+scheduler = JobScheduler()
+
+# English -> target translation for non-Tamil requests (TRANSLATE_ENGINE=google|nllb)
+translator = Translator()
+
+# /metrics, stage timing and Server-Timing
+metrics.install(app)
+metrics.Gauge("transcriber_jobs_queued", "Jobs waiting in the job scheduler", fn=scheduler.queued)
+metrics.StatsGauge("transcriber_vad", "VAD stage counters", lambda: VAD_STATS)
+metrics.StatsGauge("transcriber_cache", "Transcript cache counters", cache.stats)
+metrics.StatsGauge("transcriber_translate", "Translation cache and request counters", translator.stats)
+metrics.StatsGauge("transcriber_diarize", "Speaker embedding and session counters", diarizer.stats)
+metrics.StatsGauge("transcriber_search", "Transcript search index counters", transcript_index.stats)
+search_index.install(app, transcript_index)
+
+@app.on_event("startup")
+async def start_inference_pool():
+    asyncio.create_task(inference_pool.warm_up())
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_inference_pool():
+    await scheduler.stop()
+    await translator.close()
+    inference_pool.shutdown()
+
+async def run_whisper(audio, language="ta", priority=None):
+    # audio: WAV path or 16 kHz float32 array; returns whisper result dict (with 'segments')
+    # priority: set for queued jobs, which wait for the pool instead of answering 503
+    while True:
+        try:
+            return await inference_pool.transcribe(audio, language=language, word_timestamps=WORD_TIMESTAMPS,
+                                                   priority=priority or "batch")
+        except inference_pool.PoolSaturated:
+            if priority is None:
+                raise HTTPException(status_code=503, detail="Transcription queue is full, retry later",
+                                    headers={"Retry-After": "5"})
+            await asyncio.sleep(0.5)
+        except inference_pool.JobTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
+
+async def translate_segments(segments, language):
+    # batched, cached and concurrent (see translation.py); latency also goes to Server-Timing
+    with metrics.span("translate"):
+        stats = await translator.translate_segments(segments, language)
+    print(f"Translated {stats['segments']} segments to {language} in {stats['seconds']:.2f}s "
+          f"({stats['engine']}, {stats['requests']} requests, {stats['cache_hits']} cached)")
+    return stats
+
+async def save_upload(audio, path):
+    # stream the upload to disk in 1 MB blocks instead of reading it whole
+    with open(path, "wb") as f:
+        while True:
+            block = await audio.read(1 << 20)
+            if not block:
+                break
+            metrics.BYTES_PROCESSED.inc(len(block))
+            f.write(block)
+    return path
+
+async def transcribe_long_file(raw_path, language, do_denoise, do_diarize, report=None, session_id=None,
+                               priority=None):
     """
-    Merge whisper segments with diarization list (if present) and produce a list of
-    dictionaries: {speaker, start, end, text} with Tamil speaker names.
+    Long-form mode: the file is decoded incrementally and transcribed chunk by
+    chunk in parallel (see longform.py), diarized chunk by chunk alongside.
+    priority: the job's, for queued jobs; a direct request waits for a full
+    pool at most WHISPER_JOB_TIMEOUT per chunk, then answers 503.
     """
-    merged = []
-    speaker_map = {}
-    for seg in whisper_segments:
-        s_start = seg.get("start", 0.0)
-        s_end = seg.get("end", 0.0)
-        text = seg.get("text", "").strip()
-        label = None
-        if diarization_list:
-            # find diarization entry with max overlap
-            overlaps = []
-            for d in diarization_list:
-                overlap = max(0.0, min(s_end, d["end"]) - max(s_start, d["start"]))
-                if overlap > 0:
-                    overlaps.append((overlap, d["speaker"]))
-            if overlaps:
-                overlaps.sort(reverse=True)
-                label = overlaps[0][1]
-        if label is None:
-            # fallback heuristic: bucket by 30s windows
-            bucket = int(s_start // 30) + 1
-            label = f"Speaker_{bucket}"
-        if label not in speaker_map:
-            speaker_map[label] = f"பேச்சாளர் {len(speaker_map)+1}"
-        tamil_label = speaker_map[label]
-        merged.append({"speaker": tamil_label, "start": s_start, "end": s_end, "text": text})
+    report = report or NullReport()
+    whisper_lang = "ta" if language.lower() == "ta" else "en"
+    duration = await run_in_threadpool(longform.probe_duration, raw_path)
+    emitted = 0
+
+    async def on_chunk(stable, seconds_done):
+        nonlocal emitted
+        fresh = stable[emitted:]
+        if whisper_lang != language.lower():
+            await translate_segments(fresh, language)
+        emitted = len(stable)
+        report.segments(fresh)
+        progress = min(1.0, seconds_done / duration) if duration else None
+        for stage in ("decode", "denoise", "transcribe") + (("diarize",) if do_diarize else ()):
+            report.stage(stage, "running", progress)
+
+    turns = [] if do_diarize else None
+    try:
+        with metrics.span("longform", duration):
+            segments = await longform.transcribe_long(
+                raw_path, whisper_lang, do_denoise, VAD_ENABLED, on_chunk=on_chunk, turns=turns,
+                session_id=session_id, words=WORD_TIMESTAMPS and whisper_lang == language.lower(),
+                priority=priority or "batch", max_wait=None if priority else inference_pool.JOB_TIMEOUT)
+    except inference_pool.PoolSaturated:
+        raise HTTPException(status_code=503, detail="Transcription queue is full, retry later",
+                            headers={"Retry-After": "5"})
+    except inference_pool.JobTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    if whisper_lang != language.lower():
+        await translate_segments(segments[emitted:], language)
+    report.segments(segments[emitted:])
+    for stage in ("decode", "denoise", "transcribe"):
+        report.stage(stage, "done")
+
+    report.stage("diarize", "done" if do_diarize else "skipped")
+
+    report.stage("merge", "running")
+    with metrics.span("merge"):
+        merged = merge(segments, turns, relabel=False)
+    report.stage("merge", "done")
+    return merged
+
+async def transcribe_bytes(raw, raw_ext, uid, language, do_denoise, do_diarize, report=None, session_id=None,
+                           priority=None):
+    """
+    Whole-upload pipeline: decode, VAD/denoise, Whisper (+ translation),
+    diarization and merge, with every stage cached by PCM hash.
+    Speakers are named within session_id (see diarization.py).
+    Returns merged segments; report receives per-stage progress.
+    priority: the job's, for queued jobs (see run_whisper).
+    """
+    report = report or NullReport()
+
+    # Decode once; the PCM hash addresses every cached stage of this request
+    report.stage("decode", "running")
+    metrics.BYTES_PROCESSED.inc(len(raw))
+    data = None
+    if IN_MEMORY_DECODE:
+        try:
+            with metrics.span("decode"):
+                data = await run_in_threadpool(decode_to_array, raw, raw_ext, SAMPLE_RATE)
+            metrics.AUDIO_SECONDS.inc(len(data) / SAMPLE_RATE)
+        except Exception as e:
+            print("In-memory decode failed, falling back to temp files:", e)
+    report.stage("decode", "done")
+    audio_seconds = len(data) / SAMPLE_RATE if data is not None else None
+    pcm_hash = audio_digest(data) if data is not None else None
+    keys = stage_keys(pcm_hash, MODEL_NAME, language.lower(), VAD_ENABLED, do_denoise, inference_pool.ENGINE,
+                      WORD_TIMESTAMPS)
+
+    # cache calls are SQLite reads and writes that can wait on another process; keep them off the loop
+    segments = await run_in_threadpool(cache.get_json, "whisper", keys["whisper"])
+    embeddings_key = diarizer.cache_key(keys["diarization"]) if do_diarize else None
+    windows = await run_in_threadpool(cache.get_embeddings, embeddings_key) if do_diarize else None
+
+    processed = spans = None
+    if segments is None or (do_diarize and windows is None):
+        report.stage("denoise", "running")
+        if data is None:
+            # temp-file fallback: array decode failed or is disabled (not cached)
+            with metrics.span("decode_file"):
+                processed, spans = await run_in_threadpool(prepare_audio, raw, raw_ext, uid, UPLOAD_DIR,
+                                                           do_denoise=do_denoise, in_memory=False,
+                                                           target_sr=SAMPLE_RATE)
+            report.stage("denoise", "done")
+        else:
+            hit = await run_in_threadpool(cache.get_audio, keys["audio"])
+            if hit is None:
+                # drop silence and optionally denoise
+                with metrics.span("denoise", audio_seconds):
+                    processed, spans = await run_in_threadpool(process_array, data, SAMPLE_RATE,
+                                                               do_denoise=do_denoise, vad=VAD_ENABLED)
+                await run_in_threadpool(cache.put_audio, keys["audio"], processed, spans)
+                report.stage("denoise", "done")
+            else:
+                processed, spans = hit
+                report.stage("denoise", "cached")
+        if processed is None:
+            # VAD found no speech: skip Whisper and diarization entirely
+            for stage in ("transcribe", "diarize", "merge"):
+                report.stage(stage, "skipped")
+            return []
+    else:
+        report.stage("denoise", "cached")
+
+    # the temp-file fallback's WAV, removed once Whisper and diarization are done with it
+    temp_wav = processed if isinstance(processed, str) else None
+    try:
+        # Transcription
+        if segments is None:
+            report.stage("transcribe", "running")
+            whisper_lang = "ta" if language.lower() == "ta" else "en"
+            with metrics.span("whisper", audio_seconds):
+                # Tamil: direct Whisper transcription; other languages: English first
+                whisper_result = await run_whisper(processed, language=whisper_lang, priority=priority)
+            segments = whisper_result.get("segments", [])
+            if whisper_lang != language.lower():
+                # Translate the segments to the target language
+                await translate_segments(segments, language)
+
+            if not isinstance(processed, str):
+                record_inference_cost(whisper_result.get("cpu_seconds"), len(processed) / SAMPLE_RATE)
+            remap_segments(segments, spans)
+            # translated text no longer lines up with Whisper's words
+            segments = [compact_segment(seg, words=whisper_lang == language.lower()) for seg in segments]
+            await run_in_threadpool(cache.put_json, "whisper", keys["whisper"], segments)
+            report.stage("transcribe", "done")
+        else:
+            report.stage("transcribe", "cached")
+        report.segments(segments)
+
+        # Speaker diarization (optional): embeddings are cached, naming is per session
+        diarization_list = None
+        if not do_diarize:
+            report.stage("diarize", "skipped")
+        else:
+            report.stage("diarize", "cached" if windows is not None else "running")
+            try:
+                if windows is None:
+                    if isinstance(processed, str):
+                        processed = await run_in_threadpool(decode_file, processed)
+                    with metrics.span("diarize", audio_seconds):
+                        windows = await run_in_threadpool(diarizer.embed, processed, spans)
+                    await run_in_threadpool(cache.put_embeddings, embeddings_key, windows)
+                    report.stage("diarize", "done")
+                diarization_list = await run_in_threadpool(diarizer.assign, session_id, windows,
+                                                           embeddings_key or uid)
+            except Exception as e:
+                print("Diarization failed:", e)
+                report.stage("diarize", "done")
+    finally:
+        if temp_wav is not None:
+            Path(temp_wav).unlink(missing_ok=True)
+
+    report.stage("merge", "running")
+    with metrics.span("merge"):
+        merged = merge(segments, diarization_list, relabel=False)
+    report.stage("merge", "done")
     return merged
 
 
@@ -122,63 +318,149 @@ async def transcribe_text(
     audio: UploadFile = File(...),
     language: Optional[str] = Form("ta"),  # target language
     do_denoise: Optional[bool] = Form(True),
-    do_diarize: Optional[bool] = Form(False)
+    do_diarize: Optional[bool] = Form(False),
+    long_form: Optional[bool] = Form(False),
+    session_id: Optional[str] = Form(None)
 ):
     """
     Returns structured JSON segments (speaker, start, end, text) for in-browser editing.
     - If language="ta", uses Whisper directly.
     - Else, transcribes in English and translates to target language.
+    - long_form=true: chunked, parallel pipeline for multi-hour recordings.
+    - session_id: uploads sharing it keep the same speaker labels and are
+      searched together (/api/search?session=...).
     """
     uid = str(uuid.uuid4())
     raw_ext = Path(audio.filename).suffix or ".webm"
-    raw_path = f"{UPLOAD_DIR}/{uid}_raw{raw_ext}"
-    
-    # Save uploaded audio
-    with open(raw_path, "wb") as f:
-        f.write(await audio.read())
-
-    # Convert to WAV
-    wav_path = f"{UPLOAD_DIR}/{uid}.wav"
-    normalize_to_wav(raw_path, wav_path, target_sr=16000)
 
-    processed = wav_path
-    if do_denoise:
-        denoised = f"{UPLOAD_DIR}/{uid}_denoised.wav"
+    if long_form:
+        raw_path = await save_upload(audio, f"{UPLOAD_DIR}/{uid}_raw{raw_ext}")
         try:
-            reduce_noise(wav_path, denoised)
-            processed = denoised
-        except Exception:
-            processed = wav_path
-
-    # Transcription
-    if language.lower() == "ta":
-        # Tamil: direct Whisper transcription
-        whisper_result = run_whisper(processed, language="ta")
-        segments = whisper_result.get("segments", [])
+            merged = await transcribe_long_file(raw_path, language, do_denoise, do_diarize,
+                                                session_id=session_id)
+        finally:
+            Path(raw_path).unlink(missing_ok=True)
+        print(f"Long-form transcription completed: {len(merged)} segments.")
     else:
-        # Other languages: transcribe in English first
-        whisper_result = run_whisper(processed, language="en")
-        segments = whisper_result.get("segments", [])
-
-        # Translate each segment to target language
-        translator = GoogleTranslator(source='auto', target=language)
-        for seg in segments:
-            if seg.get("text"):
-                seg["text"] = translator.translate(seg["text"])
-
-    # Speaker diarization (optional)
-    diarization_list = None
-    if do_diarize:
+        merged = await transcribe_bytes(await audio.read(), raw_ext, uid, language, do_denoise, do_diarize,
+                                        session_id=session_id)
+        print(f"Transcription completed: {len(merged)} segments.")
+    await run_in_threadpool(transcript_index.add, "upload", session_id or uid, merged, uid)
+    return JSONResponse({"segments": merged, "transcript_id": uid})
+
+
+@app.post("/api/jobs")
+async def create_job(
+    audio: UploadFile = File(...),
+    language: Optional[str] = Form("ta"),
+    do_denoise: Optional[bool] = Form(True),
+    do_diarize: Optional[bool] = Form(False),
+    long_form: Optional[bool] = Form(False),
+    priority: Optional[str] = Form("batch"),  # "live" jobs run before "batch" ones
+    session_id: Optional[str] = Form(None)
+):
+    """
+    Queue a transcription and return its id right away.
+    Poll GET /api/jobs/{id} or follow GET /api/jobs/{id}/events (SSE).
+    """
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {list(PRIORITIES)}")
+    uid = str(uuid.uuid4())
+    raw_ext = Path(audio.filename).suffix or ".webm"
+    raw_path = await save_upload(audio, f"{UPLOAD_DIR}/{uid}_raw{raw_ext}")
+
+    async def run(job):
         try:
-            diarization_list = run_pyannote(processed)
-        except Exception:
-            diarization_list = None
+            if long_form:
+                merged = await transcribe_long_file(raw_path, language, do_denoise, do_diarize, report=job,
+                                                    session_id=session_id, priority=priority)
+            else:
+                raw = await run_in_threadpool(Path(raw_path).read_bytes)
+                merged = await transcribe_bytes(raw, raw_ext, uid, language, do_denoise, do_diarize, report=job,
+                                                session_id=session_id, priority=priority)
+        finally:
+            Path(raw_path).unlink(missing_ok=True)
+        await run_in_threadpool(transcript_index.add, "job", session_id or job.id, merged, job.id)
+        return merged
+
+    params = {"filename": audio.filename, "language": language, "do_denoise": do_denoise,
+              "do_diarize": do_diarize, "long_form": long_form, "session_id": session_id}
+    try:
+        job = scheduler.submit(run, priority=priority, params=params)
+    except QueueFull:
+        Path(raw_path).unlink(missing_ok=True)
+        raise HTTPException(status_code=503, detail="Job queue is full, retry later",
+                            headers={"Retry-After": "30"})
+    return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status})
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict() if isinstance(job, Job) else job
 
-    merged = merge(segments, diarization_list)
-    print(f"Transcription completed: {len(merged)} segments.")
-    return JSONResponse({"segments": merged})
 
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events: a snapshot, then stage / segment events as they happen,
+    and a final "done" event carrying the merged result.
+    """
+    job = scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def stream():
+        if not isinstance(job, Job) or job.finished():
+            snapshot = job.to_dict() if isinstance(job, Job) else job
+            yield sse("done", snapshot)
+            return
+        queue = job.subscribe()
+        try:
+            yield sse("snapshot", job.to_dict())
+            while True:
+                event, data = await queue.get()
+                yield sse(event, data)
+                if event == "done":
+                    break
+        finally:
+            job.unsubscribe(queue)
 
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    # 503 until a Whisper model (here or at INFERENCE_URL) can take jobs
+    if await inference_pool.ready():
+        return {"status": "ready", "inference": inference_pool.stats()}
+    return JSONResponse({"status": "loading"}, status_code=503)
+
+@app.get("/api/vad_stats")
+async def vad_stats():
+    return VAD_STATS
+
+
+@app.get("/api/translation_stats")
+async def translation_stats():
+    return translator.stats()
+
+
+@app.get("/api/cache_stats")
+async def cache_stats():
+    return cache.stats()
 
 
 @app.post("/api/make_docx")
@@ -189,92 +471,50 @@ async def make_docx(segments: dict = None):
     """
     if not segments or "segments" not in segments:
         raise HTTPException(status_code=400, detail="Missing 'segments' in request body")
-    uid = str(uuid.uuid4())
-    doc_path = f"{UPLOAD_DIR}/{uid}.docx"
-    build_docx_from_segments(segments["segments"], doc_path, include_timestamps=True)
-    return FileResponse(doc_path, media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                        filename="tamil_transcription.docx")
-    
+    return streaming_response(segments["segments"], "docx")
 
 
-def call_groq_model(prompt: str, model: str = "llama-3.3-70b-versatile") -> str:
+@app.post("/api/export/{fmt}")
+async def export_transcript(fmt: str, segments: dict = None):
     """
-    Calls Groq OpenAI-compatible API with a prompt.
-    Returns the generated Tamil text.
+    Same body as /api/make_docx; fmt is docx, txt, srt, vtt or jsonl.
     """
-    try:
-        response = client.responses.create(
-            model=model,
-            input=prompt
-        )
-        # Extract output text
-        if hasattr(response, "output_text") and response.output_text:
-            return response.output_text
-        else:
-            # Fallback: get first text chunk
-            return response.output[0].content[0].text
-    except Exception as e:
-        print("Groq API error:", str(e))
-        return f"Error calling Groq API: {str(e)}"
+    if not segments or "segments" not in segments:
+        raise HTTPException(status_code=400, detail="Missing 'segments' in request body")
+    return streaming_response(segments["segments"], fmt)
+    
+
+
+def llm_lines(segments, language, allow_empty=False):
+    default_speaker = "பேச்சாளர் ?" if language == "ta" else "Speaker ?"
+    lines = transcript_lines(segments, default_speaker)
+    if not lines and not allow_empty:
+        raise HTTPException(status_code=400, detail="No valid segments with text found")
+    return lines
 
 
-def call_groq_model(prompt: str, model: str = "llama-3.3-70b-versatile") -> str:
+async def run_llm_task(task, segments, language="ta", allow_empty=False):
     """
-    Calls Groq OpenAI-compatible API using chat completion endpoint.
-    Returns Tamil text output.
+    Map-reduce LLM call shared by the summary/minutes endpoints (see summarizer.py).
+    Errors come back as text, as the endpoints have always returned them.
+    allow_empty: the DOCX downloads still make a document from an empty transcript.
     """
+    lines = llm_lines(segments, language, allow_empty)
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1024
-        )
-        # Extract output text
-        return response.choices[0].message.content
+        with metrics.span("llm"):
+            return await summarizer.run(task, lines, language)
     except Exception as e:
         print("Groq API error:", str(e))
         return f"Error calling Groq API: {str(e)}"
 
 
-
-from fastapi import Body, HTTPException, FastAPI
-
 @app.post("/api/min_meet")
 async def generate_meeting_notes(segments: dict = Body(...)):
     if not segments or "segments" not in segments:
         raise HTTPException(status_code=400, detail="Missing 'segments'")
     
     language = segments.get("language", "ta")  # default Tamil
-
-    # Build valid segments with speaker and text
-    valid_segments = []
-    for s in segments["segments"]:
-        speaker = s.get("speaker", "பேச்சாளர் ?") if language == "ta" else s.get("speaker", "Speaker ?")
-        text = s.get("text", "").strip()
-        if text:
-            valid_segments.append(f"{speaker}: {text}")
-    
-    if not valid_segments:
-        raise HTTPException(status_code=400, detail="No valid segments with text found")
-    
-    full_text = "\n".join(valid_segments)
-    
-    # Prepare prompt for MoM generation
-    if language == "ta":
-        prompt = (
-            f"இந்த உரையை முழுமையான கூட்ட நொடிகள் (Minutes of Meeting) வடிவில் உருவாக்கவும். "
-            f"இதில் முக்கியமான விவாதங்கள், முடிவுகள், செயல்பாடுகள் (action items) ஆகியவற்றை "
-            f"சுருக்கமாக குறிப்பிடவும்:\n{full_text}"
-        )
-    else:
-        prompt = (
-            f"Generate a detailed Minutes of Meeting report from the following text. "
-            f"Include key discussions, decisions made, and action items:\n{full_text}"
-        )
-    
-    # Call your model (Groq or any LLM) to generate the report
-    mom_report = call_groq_model(prompt)
+    mom_report = await run_llm_task("minutes", segments["segments"], language)
     print(mom_report)
     
     return {"minutes_of_meeting": mom_report}
@@ -286,56 +526,64 @@ async def generate_summary(segments: dict = Body(...)):
         raise HTTPException(status_code=400, detail="Missing 'segments'")
     
     language = segments.get("language", "ta")  # default Tamil
-
-    valid_segments = []
-    for s in segments["segments"]:
-        speaker = s.get("speaker", "பேச்சாளர் ?") if language == "ta" else s.get("speaker", "Speaker ?")
-        text = s.get("text", "").strip()
-        if text:
-            valid_segments.append(f"{speaker}: {text}")
-    
-    if not valid_segments:
-        raise HTTPException(status_code=400, detail="No valid segments with text found")
-    
-    full_text = "\n".join(valid_segments)
-    
-    if language == "ta":
-        prompt = f"இந்த உரையை தமிழில் சுருக்கமாக விவரிக்கவும்:\n{full_text}"
-    else:
-        prompt = f"Summarize the following text in English:\n{full_text}"
-    
-    summary = call_groq_model(prompt)
+    summary = await run_llm_task("summary", segments["segments"], language)
     return {"summary": summary}
 
 
-def build_docx_from_text(text: str, title: str = "Document") -> BytesIO:
-    doc = Document()
-    doc.add_heading(title, level=1)
-    for line in text.split("\n"):
-        doc.add_paragraph(line)
-    f = BytesIO()
-    doc.save(f)
-    f.seek(0)
-    return f
+def stream_llm_task(task, segments, language, result_key):
+    """
+    Server-sent events: "token" events with text deltas as the model writes
+    them, then "done" carrying the same body the non-streaming endpoint returns.
+    """
+    lines = llm_lines(segments, language)
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def stream():
+        parts = []
+        try:
+            with metrics.span("llm"):
+                async for delta in summarizer.stream(task, lines, language):
+                    parts.append(delta)
+                    yield sse("token", {"text": delta})
+            yield sse("done", {result_key: "".join(parts)})
+        except Exception as e:
+            print("Groq API error:", str(e))
+            yield sse("error", {result_key: f"Error calling Groq API: {str(e)}"})
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/api/min_meet/stream")
+async def stream_meeting_notes(segments: dict = Body(...)):
+    if not segments or "segments" not in segments:
+        raise HTTPException(status_code=400, detail="Missing 'segments'")
+    return stream_llm_task("minutes", segments["segments"], segments.get("language", "ta"), "minutes_of_meeting")
+
+
+@app.post("/api/summary/stream")
+async def stream_summary(segments: dict = Body(...)):
+    if not segments or "segments" not in segments:
+        raise HTTPException(status_code=400, detail="Missing 'segments'")
+    return stream_llm_task("summary", segments["segments"], segments.get("language", "ta"), "summary")
+
+
+@app.get("/api/llm_stats")
+async def llm_stats():
+    return summarizer.stats()
+
 
 @app.post("/api/download_notes_docx")
 async def download_notes_docx(segments: dict = Body(...)):
     if not segments or "segments" not in segments:
         raise HTTPException(status_code=400, detail="Missing 'segments'")
     
-    valid_segments = []
-    for s in segments["segments"]:
-        speaker = s.get("speaker", "பேச்சாளர் ?")
-        text = s.get("text", "").strip()
-        if text:
-            valid_segments.append(f"{speaker}: {text}")
-    full_text = "\n".join(valid_segments)
-
     # Generate meeting notes via Groq
-    prompt = f"இந்த உரையை தமிழில் சுருக்கமாகக் குறிப்புகள் (bullet points) வடிவில் உருவாக்கவும்:\n{full_text}"
-    notes = call_groq_model(prompt)
+    notes = await run_llm_task("notes", segments["segments"], "ta", allow_empty=True)
 
-    docx_file = build_docx_from_text(notes, title="Meeting Notes")
+    docx_file = docx_from_text(notes, title="Meeting Notes")
     return StreamingResponse(docx_file,
                              media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
                              headers={"Content-Disposition": "attachment; filename=meeting_notes.docx"})
@@ -346,19 +594,10 @@ async def download_summary_docx(segments: dict = Body(...)):
     if not segments or "segments" not in segments:
         raise HTTPException(status_code=400, detail="Missing 'segments'")
     
-    valid_segments = []
-    for s in segments["segments"]:
-        speaker = s.get("speaker", "பேச்சாளர் ?")
-        text = s.get("text", "").strip()
-        if text:
-            valid_segments.append(f"{speaker}: {text}")
-    full_text = "\n".join(valid_segments)
-
-    # Generate summary via Groq
-    prompt = f"இந்த உரையை தமிழில் சுருக்கமாக விவரிக்கவும்:\n{full_text}"
-    summary = call_groq_model(prompt)
-
-    docx_file = build_docx_from_text(summary, title="Summary")
+    # Generate summary via Groq (shared with /api/summary for the same transcript)
+    summary = await run_llm_task("summary", segments["segments"], "ta", allow_empty=True)
+
+    docx_file = docx_from_text(summary, title="Summary")
     return StreamingResponse(docx_file,
                              media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
                              headers={"Content-Disposition": "attachment; filename=summary.docx"})
\ No newline at end of file
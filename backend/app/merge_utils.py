@@ -0,0 +1,104 @@
+# merge_utils.py
+import heapq
+
+import numpy as np
+
+
+def _max_overlap_speakers(seg_starts, seg_ends, diarization_list):
+    """
+    For every segment, the diarization speaker with the largest overlap (ties go
+    to the greater speaker label, as the old sort(reverse=True) did), or None.
+
+    A sweep over the segments in start order: turns that started before the
+    segment wait in a heap keyed by their end and leave it once they end, so
+    the heap holds exactly the earlier turns still running; turns starting
+    inside the segment are a contiguous range of the start-sorted turns.
+    Every candidate pair therefore overlaps, and the work is
+    O((S + D) log D + K) for K overlapping pairs.
+    """
+    n = len(seg_starts)
+    labels = [None] * n
+    if n == 0 or not diarization_list:
+        return labels
+
+    d_starts = np.array([d["start"] for d in diarization_list], dtype=np.float64)
+    d_ends = np.array([d["end"] for d in diarization_list], dtype=np.float64)
+    names, codes = np.unique([str(d["speaker"]) for d in diarization_list], return_inverse=True)
+    order = np.argsort(d_starts, kind="stable")
+    d_starts, d_ends, codes = d_starts[order], d_ends[order], codes[order]
+
+    # turns [before, inside) start within the segment; [0, before) started earlier
+    before = np.searchsorted(d_starts, seg_starts, side="left")
+    inside = np.searchsorted(d_starts, seg_ends, side="left")
+    ends = d_ends.tolist()
+    running = []               # (end, turn) of turns started before the current segment
+    added = 0
+    seg_parts, turn_parts = [], []
+    for i in np.argsort(seg_starts, kind="stable").tolist():
+        while added < before[i]:
+            heapq.heappush(running, (ends[added], added))
+            added += 1
+        while running and running[0][0] <= seg_starts[i]:
+            heapq.heappop(running)
+        if running:
+            turn_parts.append(np.fromiter((t for _, t in running), dtype=np.int64, count=len(running)))
+            seg_parts.append(np.full(len(running), i, dtype=np.int64))
+        if inside[i] > before[i]:
+            turn_parts.append(np.arange(before[i], inside[i], dtype=np.int64))
+            seg_parts.append(np.full(inside[i] - before[i], i, dtype=np.int64))
+    if not turn_parts:
+        return labels
+
+    seg_idx, turn_idx = np.concatenate(seg_parts), np.concatenate(turn_parts)
+    overlap = (np.minimum(seg_ends[seg_idx], d_ends[turn_idx])
+               - np.maximum(seg_starts[seg_idx], d_starts[turn_idx]))
+    positive = overlap > 0
+    seg_idx, overlap, code = seg_idx[positive], overlap[positive], codes[turn_idx[positive]]
+    if len(seg_idx) == 0:
+        return labels
+
+    # best pair per segment = last after sorting by (segment, overlap, speaker)
+    by_best = np.lexsort((code, overlap, seg_idx))
+    seg_sorted = seg_idx[by_best]
+    last = np.flatnonzero(np.append(seg_sorted[1:] != seg_sorted[:-1], True))
+    for i, c in zip(seg_sorted[last], code[by_best][last]):
+        labels[i] = str(names[c])
+    return labels
+
+
+def _merged(seg, speaker, start, end):
+    out = {"speaker": speaker, "start": start, "end": end, "text": seg.get("text", "").strip()}
+    if seg.get("words"):
+        out["words"] = seg["words"]
+    return out
+
+
+def merge(whisper_segments, diarization_list=None, relabel=True):
+    """
+    Merge whisper segments with diarization list (if present) and produce a list of
+    dictionaries: {speaker, start, end, text} with Tamil speaker names.
+    relabel=False keeps the diarization's own speaker names (stable within a
+    session, see diarization.py); a segment no turn overlaps takes the
+    speaker of the one before it.
+    """
+    starts = [seg.get("start", 0.0) for seg in whisper_segments]
+    ends = [seg.get("end", 0.0) for seg in whisper_segments]
+    labels = _max_overlap_speakers(np.array(starts, dtype=np.float64),
+                                   np.array(ends, dtype=np.float64), diarization_list)
+    merged = []
+    speaker_map = {}
+    if not relabel and diarization_list:
+        previous = str(min(diarization_list, key=lambda d: d["start"])["speaker"])
+        for seg, s_start, s_end, label in zip(whisper_segments, starts, ends, labels):
+            previous = label or previous
+            merged.append(_merged(seg, previous, s_start, s_end))
+        return merged
+    for seg, s_start, s_end, label in zip(whisper_segments, starts, ends, labels):
+        if label is None:
+            # fallback heuristic: bucket by 30s windows
+            bucket = int(s_start // 30) + 1
+            label = f"Speaker_{bucket}"
+        if label not in speaker_map:
+            speaker_map[label] = f"பேச்சாளர் {len(speaker_map)+1}"
+        merged.append(_merged(seg, speaker_map[label], s_start, s_end))
+    return merged
@@ -0,0 +1,213 @@
+# metrics.py
+"""
+Stage timing and a Prometheus text-format /metrics endpoint.
+
+    with metrics.span("whisper", audio_seconds=dur):
+        ...
+
+records the stage's wall time, its real-time factor (seconds per audio
+second) and, inside an HTTP request, adds it to that request's
+Server-Timing header. The header is sent when SERVER_TIMING=1 or the
+request has ?timing=1.
+
+`install(app)` adds the middleware and the /metrics route to a FastAPI app.
+StatsGauge stats (some are database counts) are read in a worker thread and
+reused for METRICS_STATS_TTL_S seconds.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+STATS_TTL_S = float(os.getenv("METRICS_STATS_TTL_S", "15"))
+
+_REGISTRY = []
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def _label_value(value):
+    # the exposition format escapes backslash, double quote and newline
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{_label_value(v)}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name, self.help = name, help
+        self.values = {}
+        _REGISTRY.append(self)
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, help, fn=None):
+        super().__init__(name, help)
+        self.fn = fn   # optional callable read at scrape time
+
+    def set(self, value, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def samples(self):
+        if self.fn is not None:
+            yield self.name, (), self.fn()
+        else:
+            yield from super().samples()
+
+
+class StatsGauge:
+    """
+    Exposes a stats dict read at scrape time: {"a": 1, "b": {"x": 2}} becomes
+    name{stat="a"} 1 and name{stat="b",kind="x"} 2. Non-numeric values are skipped.
+    fn is called by refresh(), at most once per ttl seconds.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, ttl=STATS_TTL_S):
+        self.name, self.help, self.fn = name, help, fn
+        self.ttl = ttl
+        self.stats = {}
+        self._read_at = None
+        _REGISTRY.append(self)
+
+    def refresh(self):
+        now = time.monotonic()
+        if self._read_at is not None and now - self._read_at < self.ttl:
+            return
+        try:
+            self.stats = self.fn()
+        except Exception as e:
+            print(f"Reading {self.name} stats failed:", e)
+        self._read_at = now
+
+    def samples(self):
+        for key, value in self.stats.items():
+            if isinstance(value, dict):
+                for label, v in value.items():
+                    yield self.name, (("stat", key), ("kind", label)), v
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield self.name, (("stat", key),), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets):
+        self.name, self.help = name, help
+        self.buckets = sorted(buckets)
+        self.series = {}   # labels -> [bucket counts..., sum, count]
+        _REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        row = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def samples(self):
+        for key, row in self.series.items():
+            for bound, count in zip(self.buckets, row):
+                yield f"{self.name}_bucket", key + (("le", repr(float(bound))),), count
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), row[-1]
+            yield f"{self.name}_sum", key, row[-2]
+            yield f"{self.name}_count", key, row[-1]
+
+
+STAGE_SECONDS = Histogram(
+    "transcriber_stage_seconds", "Wall time per pipeline stage",
+    [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300])
+STAGE_RTF = Histogram(
+    "transcriber_stage_realtime_factor", "Stage seconds per second of audio",
+    [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10])
+AUDIO_SECONDS = Counter("transcriber_audio_seconds_total", "Seconds of decoded audio processed")
+BYTES_PROCESSED = Counter("transcriber_upload_bytes_total", "Bytes of uploaded audio received")
+REQUESTS = Counter("transcriber_http_requests_total", "HTTP requests by path and status")
+LLM_TTFT = Histogram(
+    "transcriber_llm_time_to_first_token_seconds", "Seconds until the first streamed LLM token",
+    [0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30])
+LLM_TOKENS_PER_SECOND = Histogram(
+    "transcriber_llm_tokens_per_second", "LLM generation rate after the first token",
+    [5, 10, 25, 50, 100, 200, 400, 800])
+MODEL_LOAD_SECONDS = Gauge("transcriber_model_load_seconds", "Whisper model load time per worker")
+
+
+def refresh_stats():
+    for metric in _REGISTRY:
+        if isinstance(metric, StatsGauge):
+            metric.refresh()
+
+
+def render():
+    lines = []
+    for metric in _REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def span(stage, audio_seconds=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if audio_seconds:
+            STAGE_RTF.observe(elapsed / audio_seconds, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def server_timing_header(timings):
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings)
+
+
+def install(app):
+    @app.middleware("http")
+    async def timing_middleware(request, call_next):
+        timings = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            _request_timings.reset(token)
+        route = request.scope.get("route")
+        REQUESTS.inc(path=getattr(route, "path", "unmatched"), status=response.status_code)
+        if SERVER_TIMING or request.query_params.get("timing") == "1":
+            timings.append(("total", time.perf_counter() - start))
+            response.headers["Server-Timing"] = server_timing_header(timings)
+            response.headers["Timing-Allow-Origin"] = "*"
+        return response
+
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        await run_in_threadpool(refresh_stats)
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
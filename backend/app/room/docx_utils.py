@@ -1,17 +1,8 @@
-from docx import Document
+from exports import write_export, DEFAULT_TITLE
 
-def build_docx_from_segments(segments, doc_path, title="தமிழ் உரை (Transcription)", include_timestamps=True):
+def build_docx_from_segments(segments, doc_path, title=DEFAULT_TITLE, include_timestamps=True):
     """
     segments: list of {speaker, start, end, text}
+    Written by the streaming exporter (exports.py); endpoints stream it instead.
     """
-    doc = Document()
-    doc.add_heading(title, level=1)
-    for seg in segments:
-        header = f"{seg.get('speaker','பேச்சாளர்')} "
-        if include_timestamps:
-            header += f"[{seg.get('start',0):.2f}s - {seg.get('end',0):.2f}s]"
-        p = doc.add_paragraph()
-        p.add_run(header + "\n").bold = True
-        p.add_run(seg.get('text','') + "\n\n")
-    doc.save(doc_path)
-    return doc_path
+    return write_export(segments, doc_path, "docx", title=title, include_timestamps=include_timestamps)
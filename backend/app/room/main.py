@@ -1,25 +1,102 @@
 # server/main.py
 import os
-import uuid
+import time
+import asyncio
 import aiohttp
 import socketio
+import numpy as np
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse, FileResponse
-from pathlib import Path
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import Dict, Any
-from datetime import datetime
-
-UPLOAD_DIR = Path(__file__).parent / "tmp"
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+from streaming import OnlineTranscriber
+from service_client import ServiceClient, CircuitOpen
+from ingest import RoomIngest
+from room_store import open_store, ROOM_IDLE_S
+from exports import EXPORT_FORMATS, LiveDocx
+import search_index
 
 FASTAPI_BASE = os.getenv("FASTAPI_BASE", "http://localhost:8000")  # transcription server
+# e.g. redis://localhost:6379/0 so several room-server processes can serve the same room
+ROOM_MQ_URL = os.getenv("ROOM_MQ_URL")
+
+# pooled keep-alive connections, retries and a circuit breaker (see service_client.py)
+service = ServiceClient(FASTAPI_BASE)
+
+def client_manager():
+    # emits go through the message queue and reach clients connected to any process
+    if not ROOM_MQ_URL:
+        return None
+    if ROOM_MQ_URL.startswith("amqp"):
+        return socketio.AsyncAioPikaManager(ROOM_MQ_URL)
+    return socketio.AsyncRedisManager(ROOM_MQ_URL)
 
 app = FastAPI()
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
+sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*", client_manager=client_manager())
 socket_app = socketio.ASGIApp(sio, other_asgi_app=app)
 
-# in-memory storage
-rooms: Dict[str, Dict[str, Any]] = {}
+# speakers, participants and segments (ROOM_STORE=memory|sqlite, see room_store.py)
+store = open_store()
+
+async def stored(method, *args, **kwargs):
+    # store calls do file I/O or wait out another process's SQLite lock; keep them off the event loop
+    return await run_in_threadpool(method, *args, **kwargs)
+
+# rendered transcript document per room, appended to as segments arrive
+documents: Dict[str, LiveDocx] = {}
+
+# rooms are searchable as they go (GET /api/search?source=room&session=<roomId>)
+transcript_index = search_index.open_index()
+search_index.install(app, transcript_index)
+
+async def add_segment(roomId, speakerLabel, userId, userName, start, end, text, seq=None, words=None):
+    s = await stored(store.append_segment, roomId, speakerLabel, userId, userName, start, end, text, seq=seq)
+    if roomId not in documents:
+        documents[roomId] = LiveDocx()
+    documents[roomId].append(s)
+    transcript_index.add_later("room", roomId, [dict(s, words=words)] if words else [s])
+    return s
+
+async def room_document(roomId):
+    # rebuilt from the store only if this process missed segments
+    # (room evicted and reloaded, or other workers sharing a SQLite store)
+    doc = documents.get(roomId)
+    if doc is None or doc.segments != await stored(store.segment_count, roomId):
+        doc = LiveDocx()
+        for s in await stored(store.segments, roomId):
+            doc.append(s)
+        documents[roomId] = doc
+    return doc
+
+async def evict_idle_rooms():
+    while True:
+        await asyncio.sleep(60)
+        try:
+            await stored(store.evict_idle)
+            for roomId in ingest.evict_idle(ROOM_IDLE_S):
+                congested.discard(roomId)
+            now = time.monotonic()
+            for roomId in [r for r, doc in documents.items() if now - doc.updated > ROOM_IDLE_S]:
+                del documents[roomId]
+        except Exception as e:
+            print("Room eviction failed:", e)
+
+@app.on_event("startup")
+async def start_room_store():
+    app.state.evictor = asyncio.create_task(evict_idle_rooms())
+
+@app.on_event("shutdown")
+async def stop_ingest():
+    app.state.evictor.cancel()
+    await ingest.stop()
+    await service.close()
+
+# live streams: (roomId, userId) -> {"asr": OnlineTranscriber, "busy": bool, "sid": owner, ...}
+streams: Dict[tuple, Dict[str, Any]] = {}
+# audio_blob position per (roomId, userId): {"seq": next stream_seq, "gap": dropped since last}
+blob_streams: Dict[tuple, Dict[str, Any]] = {}
+# sid -> {(roomId, userId)} it joined or sent audio to, left on disconnect
+memberships: Dict[str, set] = {}
 
 # ------------------- SOCKET.IO ------------------- #
 @sio.event
@@ -29,26 +106,22 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     print("socket disconnected", sid)
+    # a closed tab never sends "final" or "leave"; commit what its streams still hold and leave for it
+    for roomId, userId in [key for key, stream in streams.items() if stream["sid"] == sid]:
+        await finish_stream(roomId, userId)
+    for roomId, userId in memberships.pop(sid, ()):
+        await leave_room(roomId, userId)
 
 @sio.on("join")
 async def handle_join(sid, data):
     roomId, userId, userName = data["roomId"], data["userId"], data["userName"]
     await sio.enter_room(sid, roomId)
+    memberships.setdefault(sid, set()).add((roomId, userId))
 
-    if roomId not in rooms:
-        rooms[roomId] = {"segments": [], "speakersMap": {}, "participants": {}}
-
-    rooms[roomId]["participants"][userId] = {
-        "userId": userId,
-        "userName": userName,
-        "joinedAt": datetime.utcnow().isoformat(),
-    }
-
-    if userId not in rooms[roomId]["speakersMap"]:
-        idx = len(rooms[roomId]["speakersMap"]) + 1
-        rooms[roomId]["speakersMap"][userId] = f"Speaker {idx}"
+    participants = await stored(store.add_participant, roomId, userId, userName)
+    await stored(store.speaker_label, roomId, userId)
 
-    await sio.emit("participants", rooms[roomId]["participants"], room=roomId)
+    await sio.emit("participants", participants, room=roomId)
     await sio.emit(
         "participant_joined",
         {"userId": userId, "userName": userName},
@@ -60,111 +133,272 @@ async def handle_join(sid, data):
 async def handle_leave(sid, data):
     roomId, userId = data["roomId"], data["userId"]
     await sio.leave_room(sid, roomId)
+    memberships.get(sid, set()).discard((roomId, userId))
+    await leave_room(roomId, userId)
 
-    if roomId in rooms and userId in rooms[roomId]["participants"]:
-        del rooms[roomId]["participants"][userId]
-        await sio.emit("participants", rooms[roomId]["participants"], room=roomId)
+async def leave_room(roomId, userId):
+    await finish_stream(roomId, userId)
+    blob_streams.pop((roomId, userId), None)
+
+    participants = await stored(store.remove_participant, roomId, userId)
+    if participants is not None:
+        await sio.emit("participants", participants, room=roomId)
         await sio.emit("participant_left", {"userId": userId}, room=roomId)
 
 @sio.on("audio_blob")
 async def handle_audio_blob(sid, metadata, arrayBuffer):
+    """
+    Queues the blob on its room (see ingest.py); transcripts come back as
+    new_transcript events in capture order, tagged with the blob's seq.
+    When the room's queue is full the blob is dropped and the sender gets
+    an ingest_backpressure event.
+    Acknowledged with {"seq": n} (or {"dropped": true}) for clients that ask.
+    """
     try:
         roomId, userId, userName = (
             metadata["roomId"],
             metadata["userId"],
             metadata["userName"],
         )
-        filename = metadata["filename"]
-        doDenoise = metadata.get("doDenoise", False)
-
-        # save tmp file
-        if roomId not in rooms:
-            rooms[roomId] = {"segments": [], "speakersMap": {}, "participants": {}}
-        if userId not in rooms[roomId]["speakersMap"]:
-            idx = len(rooms[roomId]["speakersMap"]) + 1
-            rooms[roomId]["speakersMap"][userId] = f"Speaker {idx}"
-
-        speakerLabel = rooms[roomId]["speakersMap"][userId]
-
-        uid = str(uuid.uuid4())
-        tmp_path = UPLOAD_DIR / f"{uid}_{filename}"
-        with open(tmp_path, "wb") as f:
-            f.write(arrayBuffer)
-
-        # send to transcription service
-        async with aiohttp.ClientSession() as session:
-            with open(tmp_path, "rb") as f:
-                form = aiohttp.FormData()
-                form.add_field("audio", f, filename=filename)
-                form.add_field("do_denoise", str(doDenoise).lower())
-                form.add_field("do_diarize", "false")
-
-                async with session.post(
-                    f"{FASTAPI_BASE}/api/transcribe_text", data=form, timeout=120
-                ) as resp:
-                    if resp.status != 200:
-                        print("Transcribe error:", await resp.text())
-                        return
-                    data = await resp.json(content_type=None)
-
-        returnedSegments = data.get("segments", [])
-        for seg in returnedSegments:
-            s = {
-                "speaker": speakerLabel,
+
+        # the user's blobs form one WebM stream; the transcription service
+        # decodes them in this order and resyncs after a dropped one
+        position = blob_streams.setdefault((roomId, userId), {"seq": 0, "gap": False})
+        memberships.setdefault(sid, set()).add((roomId, userId))
+        item = {
+            "sid": sid,
+            "userId": userId,
+            "userName": userName,
+            "filename": metadata["filename"],
+            "doDenoise": metadata.get("doDenoise", False),
+            "audio": arrayBuffer,
+            "streamSeq": position["seq"],
+            "streamGap": position["gap"],
+        }
+        seq = ingest.submit(roomId, item)
+        queued = ingest.queued(roomId)
+
+        # register the speaker; only after submit, so blobs queue in arrival order
+        await stored(store.speaker_label, roomId, userId)
+        if seq is None:
+            position["gap"] = True
+            await sio.emit(
+                "ingest_backpressure",
+                {"roomId": roomId, "dropped": True, "queued": queued, "limit": ingest.max_queued},
+                to=sid,
+            )
+            congested.add(roomId)
+            return {"dropped": True}
+        position["seq"] += 1
+        position["gap"] = False
+        if queued >= ingest.max_queued // 2 and roomId not in congested:
+            # half full: ask clients to slow down before anything is dropped
+            await sio.emit(
+                "ingest_backpressure",
+                {"roomId": roomId, "dropped": False, "queued": queued, "limit": ingest.max_queued},
+                room=roomId,
+            )
+            congested.add(roomId)
+        return {"seq": seq}
+    except Exception as e:
+        print("Error handling audio_blob:", e)
+
+async def transcribe_blob(roomId, item):
+    # send to transcription service straight from memory
+    def make_form():
+        form = aiohttp.FormData()
+        form.add_field("audio", item["audio"], filename=item["filename"])
+        form.add_field("do_denoise", str(item["doDenoise"]).lower())
+        form.add_field("do_diarize", "false")
+        form.add_field("stream_key", f"{roomId}:{item['userId']}")
+        form.add_field("stream_seq", str(item["streamSeq"]))
+        form.add_field("stream_gap", str(item["streamGap"]).lower())
+        return form
+
+    try:
+        resp = await service.request("POST", "/api/transcribe_text", data=make_form, timeout=120)
+    except CircuitOpen as e:
+        print("Transcription service unavailable, dropping audio_blob:", e)
+        return []
+    async with resp:
+        if resp.status != 200:
+            print("Transcribe error:", await resp.text())
+            return []
+        data = await resp.json(content_type=None)
+    return data.get("segments", [])
+
+async def emit_blob_segments(roomId, seq, item, returnedSegments):
+    # called by ingest in capture order
+    userId, userName = item["userId"], item["userName"]
+    speakerLabel = await stored(store.speaker_label, roomId, userId)
+    for seg in returnedSegments or []:
+        s = await add_segment(
+            roomId, speakerLabel, userId, userName,
+            seg.get("start", 0), seg.get("end", 0), seg.get("text", seg.get("whisper_text", "")), seq=seq,
+            words=seg.get("words"),
+        )
+        await sio.emit(
+            "new_transcript",
+            {
                 "userId": userId,
                 "userName": userName,
-                "start": seg.get("start", 0),
-                "end": seg.get("end", 0),
-                "text": seg.get("text", seg.get("whisper_text", "")),
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-            rooms[roomId]["segments"].append(s)
+                "speakerLabel": speakerLabel,
+                "text": s["text"],
+                "start": s["start"],
+                "end": s["end"],
+                "timestamp": s["timestamp"],
+                "seq": seq,
+            },
+            room=roomId,
+        )
+    if roomId in congested and ingest.queued(roomId) <= ingest.max_queued // 4:
+        congested.discard(roomId)
+        await sio.emit(
+            "ingest_backpressure",
+            {"roomId": roomId, "dropped": False, "queued": ingest.queued(roomId), "limit": ingest.max_queued,
+             "resume": True},
+            room=roomId,
+        )
+
+ingest = RoomIngest(transcribe_blob, emit_blob_segments)
+congested = set()   # rooms told to slow down and not yet told to resume
+
+# ------------------- STREAMING ------------------- #
+async def transcribe_window(audio, prompt):
+    # one LocalAgreement pass over a speaker's rolling buffer
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+    def make_form():
+        form = aiohttp.FormData()
+        form.add_field("audio", pcm.tobytes(), filename="window.pcm")
+        form.add_field("prompt", prompt)
+        return form
+
+    try:
+        resp = await service.request("POST", "/api/transcribe_window", data=make_form, timeout=60)
+    except CircuitOpen as e:
+        print("Stream transcribe skipped:", e)
+        return []
+    async with resp:
+        if resp.status != 200:
+            print("Stream transcribe error:", await resp.text())
+            return []
+        data = await resp.json(content_type=None)
+    return data.get("words", [])
+
+async def emit_words(roomId, userId, userName, words):
+    # committed words from one pass become one transcript segment
+    text = "".join(w["word"] for w in words).strip()
+    if not text:
+        return
+    speakerLabel = await stored(store.speaker_label, roomId, userId)
+    s = await add_segment(roomId, speakerLabel, userId, userName, words[0]["start"], words[-1]["end"], text,
+                    words=words)
+    await sio.emit(
+        "new_transcript",
+        {
+            "userId": userId,
+            "userName": userName,
+            "speakerLabel": speakerLabel,
+            "text": s["text"],
+            "start": s["start"],
+            "end": s["end"],
+            "timestamp": s["timestamp"],
+            "final": True,
+        },
+        room=roomId,
+    )
+
+async def run_stream(roomId, userId, stream):
+    try:
+        while stream["asr"].ready():
+            committed, tentative = await stream["asr"].process()
+            await emit_words(roomId, userId, stream["userName"], committed)
+            speakerLabel = await stored(store.speaker_label, roomId, userId)
             await sio.emit(
-                "new_transcript",
+                "partial_transcript",
                 {
                     "userId": userId,
-                    "userName": userName,
+                    "userName": stream["userName"],
                     "speakerLabel": speakerLabel,
-                    "text": s["text"],
-                    "start": s["start"],
-                    "end": s["end"],
-                    "timestamp": s["timestamp"],
+                    "text": "".join(w["word"] for w in tentative).strip(),
                 },
                 room=roomId,
             )
+    except Exception as e:
+        print("Error processing audio_stream:", e)
+    finally:
+        stream["busy"] = False
 
-        tmp_path.unlink(missing_ok=True)
-
+async def finish_stream(roomId, userId):
+    stream = streams.pop((roomId, userId), None)
+    if stream is None:
+        return
+    try:
+        if stream.get("task") is not None:
+            await stream["task"]
+        tail = await stream["asr"].finish()
+        await emit_words(roomId, userId, stream["userName"], tail)
     except Exception as e:
-        print("Error handling audio_blob:", e)
+        print("Error finishing audio_stream:", e)
+
+@sio.on("audio_stream")
+async def handle_audio_stream(sid, metadata, chunk):
+    """
+    Continuous capture: chunk is raw 16 kHz mono PCM16. Emits partial_transcript
+    for the tentative tail and new_transcript (final=True) as words stabilise.
+    Send {"final": true} in metadata when the speaker stops.
+    """
+    roomId, userId, userName = metadata["roomId"], metadata["userId"], metadata["userName"]
+    key = (roomId, userId)
+    if key not in streams:
+        streams[key] = {"asr": OnlineTranscriber(transcribe_window), "busy": False, "task": None, "userName": userName}
+    stream = streams[key]
+    stream["sid"] = sid
+    if chunk:
+        pcm = np.frombuffer(chunk, dtype=np.int16).astype(np.float32) / 32768.0
+        stream["asr"].insert_audio(pcm)
+
+    if metadata.get("final"):
+        await finish_stream(roomId, userId)
+    elif not stream["busy"] and stream["asr"].ready():
+        # one pass at a time per speaker; audio arriving meanwhile is picked up by the loop
+        stream["busy"] = True
+        stream["task"] = asyncio.create_task(run_stream(roomId, userId, stream))
+    # last, so chunks reach the transcriber in arrival order
+    await stored(store.speaker_label, roomId, userId)
 
 # ------------------- HTTP ------------------- #
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/api/ingest_stats")
+async def ingest_stats():
+    return {**ingest.stats(), "service": service.stats(), "store": await stored(store.stats)}
+
+@app.get("/ready")
+async def ready():
+    # ready when the transcription service behind us is
+    try:
+        resp = await service.request("GET", "/ready", timeout=2, retries=0)
+        async with resp:
+            if resp.status == 200:
+                return {"status": "ready", "service": service.stats()}
+    except Exception:
+        pass
+    return JSONResponse({"status": "loading", "service": service.stats()}, status_code=503)
+
 @app.get("/rooms/{roomId}/download")
 async def download_docx(roomId: str):
-    if roomId not in rooms or not rooms[roomId]["segments"]:
+    if not await stored(store.has_segments, roomId):
         return JSONResponse(status_code=404, content={"error": "No segments for this room"})
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{FASTAPI_BASE}/api/make_docx",
-                json={"segments": rooms[roomId]["segments"]},
-                timeout=120,
-            ) as resp:
-                if resp.status != 200:
-                    print("make_docx error:", await resp.text())
-                    return JSONResponse(status_code=500, content={"error": "Failed to build DOCX"})
-                file_bytes = await resp.read()
-
-        tmp_file = UPLOAD_DIR / f"{roomId}_conversation.docx"
-        with open(tmp_file, "wb") as f:
-            f.write(file_bytes)
-
-        return FileResponse(
-            tmp_file,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            filename="room_conversation.docx",
-        )
-    except Exception as e:
-        print("make_docx failed:", e)
-        return JSONResponse(status_code=500, content={"error": "Failed to build DOCX"})
+    # assembled from the room's cached, already compressed paragraphs; no call to the
+    # transcription service and no re-rendering of earlier segments
+    parts = (await room_document(roomId)).snapshot()
+    headers = {
+        "Content-Disposition": 'attachment; filename="room_conversation.docx"',
+        "Content-Length": str(sum(len(p) for p in parts)),
+    }
+    return StreamingResponse(iter(parts), media_type=EXPORT_FORMATS["docx"][0], headers=headers)
@@ -1,32 +1,249 @@
 import os
 from pathlib import Path
-from pydub import AudioSegment
 import soundfile as sf
 import numpy as np
-import noisereduce as nr
+import decoding
+import denoise
 
 def ensure_dir(path):
     Path(path).mkdir(parents=True, exist_ok=True)
 
 def normalize_to_wav(in_path: str, out_path: str, target_sr: int = 16000):
     """
-    Convert audio file to mono WAV at target_sr using pydub.
+    Convert audio file to mono 16-bit WAV at target_sr (see decoding.py).
     """
-    audio = AudioSegment.from_file(in_path)
-    audio = audio.set_frame_rate(target_sr).set_channels(1)
-    audio.export(out_path, format="wav")
+    sf.write(out_path, decoding.decode_file(in_path, target_sr), target_sr, subtype="PCM_16")
     return out_path
 
 def reduce_noise(wav_path: str, out_path: str):
     """
-    Basic noise reduction using noisereduce.
+    Spectral-gate noise reduction of a WAV file (see denoise.py), in float32.
     """
-    data, rate = sf.read(wav_path)
+    data, rate = sf.read(wav_path, dtype="float32")
     if len(data.shape) > 1:
         data = np.mean(data, axis=1)
-    # use first 0.5s as noise profile (if long enough)
-    sample_len = int(0.5 * rate)
-    noise = data[:sample_len] if len(data) > sample_len else data[:int(0.1*rate)]
-    reduced = nr.reduce_noise(y=data, sr=rate, y_noise=noise, verbose=False)
-    sf.write(out_path, reduced, rate)
+    reduce_noise_array(data, rate)
+    sf.write(out_path, data, rate)
     return out_path
+
+def decode_to_array(raw: bytes, fmt: str = None, target_sr: int = 16000) -> np.ndarray:
+    """
+    Decode uploaded audio bytes to a mono float32 array at target_sr without
+    touching disk (in-process libav when PyAV is installed, else one ffmpeg
+    pipe). The container is probed, so fmt is only a hint and unused.
+    """
+    return decoding.decode_bytes(raw, target_sr)
+
+def reduce_noise_array(data: np.ndarray, rate: int = 16000, regions=None, profile=None) -> np.ndarray:
+    """
+    Denoise a float32 buffer in place. The noise profile is learnt from the
+    non-speech regions (VAD output, seconds); profile: a live speaker's
+    denoise.NoiseProfile to update and reuse across chunks.
+    """
+    if regions is None:
+        regions = detect_speech(data, rate)
+    profile = denoise.estimate_profile(data, rate, regions, profile)
+    denoise.denoise(data, rate, profile)
+    return data
+
+# Counters for the VAD stage. cpu_seconds_saved is an estimate: dropped audio
+# seconds times the measured Whisper CPU cost per audio second.
+VAD_STATS = {
+    "chunks_total": 0,
+    "chunks_skipped": 0,
+    "audio_seconds_total": 0.0,
+    "audio_seconds_dropped": 0.0,
+    "cpu_seconds_per_audio_second": 0.0,
+    "cpu_seconds_saved": 0.0,
+}
+
+def detect_speech(data: np.ndarray, rate: int = 16000, frame_ms: int = 30,
+                  min_speech_ms: int = 250, min_silence_ms: int = 300, pad_ms: int = 150):
+    """
+    Energy + spectral-flatness VAD. Returns a list of (start, end) speech
+    regions in seconds. Fully vectorised over 30 ms frames.
+    """
+    frame = int(rate * frame_ms / 1000)
+    n = len(data) // frame
+    if n == 0:
+        return []
+    frames = data[:n * frame].reshape(n, frame)
+    window = np.hanning(frame).astype(np.float32)
+    energy_db = np.empty(n, dtype=np.float32)
+    flatness = np.empty(n, dtype=np.float32)
+    # ~30 s of frames at a time keeps the FFT scratch small on long files
+    for i in range(0, n, 1024):
+        block = frames[i:i + 1024]
+        energy_db[i:i + 1024] = 10 * np.log10(np.einsum("ij,ij->i", block, block) / frame + 1e-10)
+        # speech is harmonic (low flatness); hiss and hum are flat
+        spec = np.abs(np.fft.rfft(block * window, axis=1)) + 1e-10
+        flatness[i:i + 1024] = np.exp(np.mean(np.log(spec), axis=1)) / np.mean(spec, axis=1)
+    # adaptive threshold above the noise floor, kept within sane dBFS bounds
+    threshold = np.clip(np.percentile(energy_db, 10) + 10, -55, -35)
+    speech = (energy_db > threshold) & (flatness < 0.5)
+
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], speech.astype(np.int8), [0]])))
+    starts, ends = edges[0::2], edges[1::2]
+    if len(starts) == 0:
+        return []
+    # bridge short pauses, then drop blips
+    new_run = np.concatenate([[True], (starts[1:] - ends[:-1]) * frame_ms > min_silence_ms])
+    first = np.flatnonzero(new_run)
+    starts = starts[first]
+    ends = np.maximum.reduceat(ends, first)
+    long_enough = (ends - starts) * frame_ms >= min_speech_ms
+    starts, ends = starts[long_enough], ends[long_enough]
+
+    total = len(data) / rate
+    pad = pad_ms / 1000
+    return [(max(0.0, float(s) * frame_ms / 1000 - pad), min(total, float(e) * frame_ms / 1000 + pad))
+            for s, e in zip(starts, ends)]
+
+def extract_speech(data: np.ndarray, regions, rate: int = 16000, gap_s: float = 0.2):
+    """
+    Concatenate the speech regions (with a short silence between them).
+    Returns (audio, spans) where spans is a list of (concat_start, orig_start, duration)
+    used by remap_segments to map Whisper times back to the original offsets.
+    """
+    gap = np.zeros(int(gap_s * rate), dtype=np.float32)
+    pieces, spans = [], []
+    pos = 0.0
+    for start, end in regions:
+        piece = data[int(start * rate):int(end * rate)]
+        spans.append((pos, start, len(piece) / rate))
+        pieces.extend([piece, gap])
+        pos += len(piece) / rate + gap_s
+    return np.concatenate(pieces[:-1]), spans
+
+def remap_time(t: float, spans) -> float:
+    i = max(0, int(np.searchsorted([s[0] for s in spans], t, side="right")) - 1)
+    concat_start, orig_start, duration = spans[i]
+    return orig_start + min(max(t - concat_start, 0.0), duration)
+
+def remap_segments(segments, spans):
+    """
+    Shift Whisper segment (and word) times from the speech-only buffer back
+    to offsets in the original upload. No-op when spans is None.
+    """
+    if not spans:
+        return segments
+    for seg in segments:
+        seg["start"] = remap_time(seg.get("start", 0.0), spans)
+        seg["end"] = remap_time(seg.get("end", 0.0), spans)
+        for w in seg.get("words", []):
+            w["start"] = remap_time(w["start"], spans)
+            w["end"] = remap_time(w["end"], spans)
+    return segments
+
+def compact_segment(seg, offset: float = 0.0, words: bool = True):
+    """
+    {"start", "end", "text"[, "words"]} of a Whisper segment, shifted by
+    offset seconds; words keep only word/start/end (search indexes them).
+    """
+    out = {"start": seg.get("start", 0.0) + offset, "end": seg.get("end", 0.0) + offset, "text": seg.get("text", "")}
+    if words and seg.get("words"):
+        out["words"] = [{"word": w["word"], "start": w["start"] + offset, "end": w["end"] + offset}
+                        for w in seg["words"]]
+    return out
+
+def apply_vad(data: np.ndarray, rate: int = 16000, keep_ratio: float = 0.9, regions=None):
+    """
+    Run the VAD stage (regions: detect_speech output, if already computed).
+    Returns (audio, spans):
+    - (None, None) when the chunk has no speech (skip all heavy work),
+    - (data, None) when nearly all of it is speech (nothing worth cutting),
+    - (speech_only_audio, spans) otherwise.
+    """
+    total = len(data) / rate
+    if regions is None:
+        regions = detect_speech(data, rate)
+    speech = sum(e - s for s, e in regions)
+    VAD_STATS["chunks_total"] += 1
+    VAD_STATS["audio_seconds_total"] += total
+    if not regions:
+        VAD_STATS["chunks_skipped"] += 1
+        _record_dropped(total)
+        return None, None
+    if speech >= keep_ratio * total:
+        return data, None
+    _record_dropped(total - speech)
+    return extract_speech(data, regions, rate)
+
+def _record_dropped(seconds: float):
+    VAD_STATS["audio_seconds_dropped"] += seconds
+    VAD_STATS["cpu_seconds_saved"] += seconds * VAD_STATS["cpu_seconds_per_audio_second"]
+
+def record_inference_cost(cpu_seconds: float, audio_seconds: float):
+    # running average of Whisper CPU cost, used to price the audio VAD drops
+    if audio_seconds <= 0 or cpu_seconds is None:
+        return
+    rate = cpu_seconds / audio_seconds
+    prev = VAD_STATS["cpu_seconds_per_audio_second"]
+    VAD_STATS["cpu_seconds_per_audio_second"] = rate if prev == 0 else 0.9 * prev + 0.1 * rate
+
+def process_array(data: np.ndarray, rate: int = 16000, do_denoise: bool = True, vad: bool = False,
+                  noise_key: str = None):
+    """
+    VAD + denoise stage on a decoded buffer. Returns (audio, spans) like
+    prepare_audio; audio is None when VAD found no speech.
+    noise_key: live speaker whose noise profile carries across chunks.
+    """
+    spans, regions = None, None
+    original = data
+    if vad or do_denoise:
+        regions = detect_speech(data, rate)
+    if vad:
+        data, spans = apply_vad(data, rate, regions=regions)
+        if data is None:
+            return None, None
+    if do_denoise:
+        try:
+            # profile from the untrimmed audio's pauses, gate applied to what Whisper gets
+            profile = denoise.profiles.get(noise_key) if noise_key else None
+            profile = denoise.estimate_profile(original, rate, regions, profile)
+            denoise.denoise(data, rate, profile)
+        except Exception as e:
+            print("Denoise failed, using audio as is:", e)
+    return data, spans
+
+def prepare_audio(raw: bytes, raw_ext: str, uid: str, upload_dir: str,
+                  do_denoise: bool = True, in_memory: bool = True, target_sr: int = 16000,
+                  vad: bool = False):
+    """
+    Turn an uploaded file into something Whisper can consume.
+    Returns (processed, spans): processed is a 16 kHz float32 array (in-memory
+    path), a WAV path (file path), or None when VAD found no speech; spans maps
+    VAD-trimmed audio back to original offsets (see remap_segments).
+    The file path is used when in_memory is off or in-memory decoding fails,
+    and skips VAD; the caller removes the returned WAV when done with it.
+    """
+    if in_memory:
+        try:
+            data = decode_to_array(raw, fmt=raw_ext, target_sr=target_sr)
+        except Exception as e:
+            print("In-memory decode failed, falling back to temp files:", e)
+        else:
+            return process_array(data, target_sr, do_denoise=do_denoise, vad=vad)
+
+    raw_path = f"{upload_dir}/{uid}_raw{raw_ext}"
+    wav_path = f"{upload_dir}/{uid}.wav"
+    denoised = f"{upload_dir}/{uid}_denoised.wav"
+    processed = None
+    try:
+        with open(raw_path, "wb") as f:
+            f.write(raw)
+        normalize_to_wav(raw_path, wav_path, target_sr=target_sr)
+
+        processed = wav_path
+        if do_denoise:
+            try:
+                reduce_noise(wav_path, denoised)
+                processed = denoised
+            except Exception:
+                processed = wav_path
+        return processed, None
+    finally:
+        # only the file handed back outlives the call
+        for path in (raw_path, wav_path, denoised):
+            if path != processed:
+                Path(path).unlink(missing_ok=True)
@@ -1,18 +1,35 @@
 # transcription_service.py
 import os
 import uuid
+import asyncio
 from pathlib import Path
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
-import whisper
-from transcribe_utils import ensure_dir, normalize_to_wav, reduce_noise
-from docx_utils import build_docx_from_segments
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+import inference_pool
+import metrics
+import denoise
+from batching import batcher
+from transcribe_utils import (ensure_dir, prepare_audio, decode_to_array, process_array,
+                              remap_segments, record_inference_cost, VAD_STATS)
+from decoding import StreamDecoders
+from transcript_cache import open_cache, audio_digest, stage_keys
+from exports import streaming_response
 
 UPLOAD_DIR = "/tmp/tamil_transcribe"
 ensure_dir(UPLOAD_DIR)
 
+# Decode uploads straight into memory; set IN_MEMORY_DECODE=0 to use temp files
+IN_MEMORY_DECODE = os.getenv("IN_MEMORY_DECODE", "1") != "0"
+# Drop silence before denoise/Whisper; set VAD_ENABLED=0 to transcribe everything
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") != "0"
+
+# Whisper segments and processed audio, keyed by PCM hash
+cache = open_cache()
+
 app = FastAPI(title="Tamil Audio→Docx Transcriber")
 app.add_middleware(
     CORSMiddleware,
@@ -22,36 +39,110 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-# Load Whisper model
-MODEL_NAME = os.getenv("WHISPER_MODEL", "medium")
-model = whisper.load_model(MODEL_NAME)
+# Whisper runs in inference_pool workers (env var WHISPER_MODEL, WHISPER_BACKEND, WHISPER_WORKERS)
+MODEL_NAME = inference_pool.MODEL_NAME
+
+# /metrics, stage timing and Server-Timing
+metrics.install(app)
+metrics.StatsGauge("transcriber_vad", "VAD stage counters", lambda: VAD_STATS)
+metrics.StatsGauge("transcriber_cache", "Transcript cache counters", cache.stats)
+metrics.StatsGauge("transcriber_denoise", "Live speaker noise profiles", denoise.profiles.stats)
+metrics.StatsGauge("transcriber_decode", "Live stream decoders", lambda: decoders.stats())
+
+# live speakers' WebM streams, continued across audio_blob chunks
+decoders = StreamDecoders()
+
+@app.on_event("startup")
+async def start_inference_pool():
+    asyncio.create_task(inference_pool.warm_up())
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    inference_pool.shutdown()
 
 @app.post("/api/transcribe_text")
 async def transcribe_text(
     audio: UploadFile = File(...),
     do_denoise: Optional[bool] = Form(True),
-    do_diarize: Optional[bool] = Form(False)
+    do_diarize: Optional[bool] = Form(False),
+    stream_key: Optional[str] = Form(None),
+    stream_seq: Optional[int] = Form(None),
+    stream_gap: Optional[bool] = Form(False)
 ):
+    # stream_key: "room:user" of a live speaker. Their blobs continue one WebM
+    # stream (decoded in stream_seq order) and share a noise profile.
     uid = str(uuid.uuid4())
     raw_ext = Path(audio.filename).suffix or ".webm"
-    raw_path = f"{UPLOAD_DIR}/{uid}_raw{raw_ext}"
-    with open(raw_path, "wb") as f:
-        f.write(await audio.read())
+    raw = await audio.read()
+    metrics.BYTES_PROCESSED.inc(len(raw))
 
-    wav_path = f"{UPLOAD_DIR}/{uid}.wav"
-    normalize_to_wav(raw_path, wav_path, target_sr=16000)
-
-    processed = wav_path
-    if do_denoise:
-        denoised = f"{UPLOAD_DIR}/{uid}_denoised.wav"
+    # retried blobs hash to the same PCM and are answered from the cache
+    data = None
+    if stream_key and stream_seq is not None:
+        try:
+            await decoders.wait_for_turn(stream_key, stream_seq, raw)
+            with metrics.span("decode"):
+                data = await run_in_threadpool(decoders.decode, stream_key, stream_seq, raw, stream_gap)
+            metrics.AUDIO_SECONDS.inc(len(data) / 16000)
+        except Exception as e:
+            # a header-less blob cannot be decoded on its own either
+            print("Stream decode failed:", e)
+            return JSONResponse({"segments": []})
+    elif IN_MEMORY_DECODE:
         try:
-            reduce_noise(wav_path, denoised)
-            processed = denoised
-        except Exception:
-            processed = wav_path
+            with metrics.span("decode"):
+                data = await run_in_threadpool(decode_to_array, raw, raw_ext)
+            metrics.AUDIO_SECONDS.inc(len(data) / 16000)
+        except Exception as e:
+            print("In-memory decode failed, falling back to temp files:", e)
+    audio_seconds = len(data) / 16000 if data is not None else None
+    keys = stage_keys(audio_digest(data) if data is not None else None, MODEL_NAME, "ta", VAD_ENABLED, do_denoise,
+                      inference_pool.ENGINE)
+    if stream_key and do_denoise:
+        # denoised against the speaker's running noise profile, which the key does not capture
+        keys["audio"] = None
 
-    result = model.transcribe(processed, language="ta")
-    segments = result.get("segments", [])
+    # cache calls are SQLite reads and writes that can wait on another process; keep them off the loop
+    segments = await run_in_threadpool(cache.get_json, "whisper", keys["whisper"])
+    if segments is None:
+        if data is None:
+            with metrics.span("decode_file"):
+                processed, spans = await run_in_threadpool(prepare_audio, raw, raw_ext, uid, UPLOAD_DIR,
+                                                           do_denoise=do_denoise, in_memory=False)
+        else:
+            hit = await run_in_threadpool(cache.get_audio, keys["audio"])
+            if hit is None:
+                with metrics.span("denoise", audio_seconds):
+                    processed, spans = await run_in_threadpool(process_array, data,
+                                                               do_denoise=do_denoise, vad=VAD_ENABLED,
+                                                               noise_key=stream_key)
+                await run_in_threadpool(cache.put_audio, keys["audio"], processed, spans)
+            else:
+                processed, spans = hit
+        if processed is None:
+            # silent live-room segment: nothing to transcribe
+            return JSONResponse({"segments": []})
+
+        try:
+            # short live-room clips from concurrent speakers share one batched pass
+            with metrics.span("whisper", audio_seconds):
+                result = await batcher.transcribe(processed, language="ta")
+        except inference_pool.PoolSaturated:
+            raise HTTPException(status_code=503, detail="Transcription queue is full, retry later",
+                                headers={"Retry-After": "5"})
+        except inference_pool.JobTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        finally:
+            if isinstance(processed, str):
+                # the temp-file fallback's WAV
+                Path(processed).unlink(missing_ok=True)
+        segments = result.get("segments", [])
+        if not isinstance(processed, str):
+            record_inference_cost(result.get("cpu_seconds"), len(processed) / 16000)
+        remap_segments(segments, spans)
+        segments = [{"start": seg.get("start", 0), "end": seg.get("end", 0), "text": seg.get("text", "")}
+                    for seg in segments]
+        await run_in_threadpool(cache.put_json, "whisper", keys["whisper"], segments)
 
     # simple speaker merge
     merged = []
@@ -64,11 +155,60 @@ async def transcribe_text(
         })
     return JSONResponse({"segments": merged})
 
+@app.post("/api/transcribe_window")
+async def transcribe_window(
+    audio: UploadFile = File(...),
+    prompt: Optional[str] = Form(""),
+    language: Optional[str] = Form("ta")
+):
+    """
+    Streaming pass: audio is raw 16 kHz mono PCM16 (the rolling buffer of one
+    speaker). Returns word timestamps relative to the start of the buffer.
+    """
+    pcm = np.frombuffer(await audio.read(), dtype=np.int16).astype(np.float32) / 32768.0
+    try:
+        with metrics.span("whisper_window", len(pcm) / 16000):
+            result = await inference_pool.transcribe(
+                pcm, language=language, initial_prompt=prompt or None,
+                word_timestamps=True, condition_on_previous_text=False, priority="live")
+    except inference_pool.PoolSaturated:
+        raise HTTPException(status_code=503, detail="Transcription queue is full, retry later",
+                            headers={"Retry-After": "1"})
+    except inference_pool.JobTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    words = [
+        {"word": w["word"], "start": w["start"], "end": w["end"]}
+        for seg in result.get("segments", []) for w in seg.get("words", [])
+    ]
+    return JSONResponse({"words": words})
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    # 503 until a Whisper model (here or at INFERENCE_URL) can take jobs
+    if await inference_pool.ready():
+        return {"status": "ready", "inference": inference_pool.stats()}
+    return JSONResponse({"status": "loading"}, status_code=503)
+
+@app.get("/api/vad_stats")
+async def vad_stats():
+    return VAD_STATS
+
+@app.get("/api/cache_stats")
+async def cache_stats():
+    return cache.stats()
+
 @app.post("/api/make_docx")
 async def make_docx(segments: dict = None):
     if not segments or "segments" not in segments:
         raise HTTPException(status_code=400, detail="Missing 'segments'")
-    uid = str(uuid.uuid4())
-    doc_path = f"{UPLOAD_DIR}/{uid}.docx"
-    build_docx_from_segments(segments["segments"], doc_path, include_timestamps=True)
-    return FileResponse(doc_path, media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document", filename="tamil_transcription.docx")
+    return streaming_response(segments["segments"], "docx")
+
+@app.post("/api/export/{fmt}")
+async def export_transcript(fmt: str, segments: dict = None):
+    if not segments or "segments" not in segments:
+        raise HTTPException(status_code=400, detail="Missing 'segments'")
+    return streaming_response(segments["segments"], fmt)
@@ -0,0 +1,304 @@
+# room_store.py
+"""
+Room state for the Socket.IO room server: speaker labels, participants and
+transcript segments.
+
+Two backends share one interface:
+
+    MemoryStore  in this process. Segments are compact __slots__ records.
+                 Only ROOM_MEMORY_SEGMENTS of a room's most recent segments
+                 stay in memory; older ones are appended to a JSONL file under
+                 ROOM_SPILL_DIR. Rooms with nobody in them for ROOM_IDLE_S
+                 are written out whole and reloaded on next use.
+    SQLiteStore  one SQLite file in WAL mode, shared by every room-server
+                 process on the host (uvicorn --workers N).
+
+Both are thread-safe: their calls do file I/O or wait on another process's
+write lock, so the room server makes them from a worker thread.
+
+Segments come back as the dicts the room server has always sent:
+{"speaker", "userId", "userName", "start", "end", "text", "timestamp"[, "seq"]}.
+
+Config (env):
+    ROOM_STORE              memory (default) / sqlite
+    ROOM_STORE_PATH         SQLite file
+    ROOM_SPILL_DIR          where MemoryStore spills segments and idle rooms
+    ROOM_MEMORY_SEGMENTS    segments per room kept in memory
+    ROOM_IDLE_S             seconds an empty room stays in memory
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOM_STORE = os.getenv("ROOM_STORE", "memory")
+ROOM_STORE_PATH = os.getenv("ROOM_STORE_PATH", "/tmp/tamil_transcribe/rooms.sqlite3")
+ROOM_SPILL_DIR = os.getenv("ROOM_SPILL_DIR", "/tmp/tamil_transcribe/rooms")
+ROOM_MEMORY_SEGMENTS = int(os.getenv("ROOM_MEMORY_SEGMENTS", "2000"))
+ROOM_IDLE_S = float(os.getenv("ROOM_IDLE_S", "900"))
+
+
+def _iso(ts):
+    return datetime.utcfromtimestamp(ts).isoformat()
+
+
+class Segment:
+    __slots__ = ("speaker", "user_id", "user_name", "start", "end", "text", "ts", "seq")
+
+    def __init__(self, speaker, user_id, user_name, start, end, text, ts, seq=None):
+        self.speaker = speaker
+        self.user_id = user_id
+        self.user_name = user_name
+        self.start = start
+        self.end = end
+        self.text = text
+        self.ts = ts
+        self.seq = seq
+
+    def to_dict(self):
+        out = {"speaker": self.speaker, "userId": self.user_id, "userName": self.user_name,
+               "start": self.start, "end": self.end, "text": self.text, "timestamp": _iso(self.ts)}
+        if self.seq is not None:
+            out["seq"] = self.seq
+        return out
+
+    def to_row(self):
+        return [self.speaker, self.user_id, self.user_name, self.start, self.end, self.text, self.ts, self.seq]
+
+
+class _Room:
+    __slots__ = ("segments", "spilled", "speakers", "participants", "last_active")
+
+    def __init__(self):
+        self.segments = []        # most recent Segment records
+        self.spilled = 0          # older segments already in the spill file
+        self.speakers = {}        # userId -> "Speaker N"
+        self.participants = {}    # userId -> {"userId", "userName", "joinedAt"}
+        self.last_active = time.monotonic()
+
+
+class MemoryStore:
+    def __init__(self, spill_dir=ROOM_SPILL_DIR, memory_segments=ROOM_MEMORY_SEGMENTS, idle_s=ROOM_IDLE_S):
+        self.spill_dir = Path(spill_dir)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.memory_segments = memory_segments
+        self.idle_s = idle_s
+        self.rooms = {}
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def _paths(self, room_id):
+        name = hashlib.sha1(room_id.encode("utf-8")).hexdigest()
+        return self.spill_dir / f"{name}.jsonl", self.spill_dir / f"{name}.json"
+
+    def _room(self, room_id, create=True):
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self._load(room_id)
+            if room is None:
+                if not create:
+                    return None
+                room = _Room()
+            self.rooms[room_id] = room
+        room.last_active = time.monotonic()
+        return room
+
+    def _load(self, room_id):
+        # an evicted room comes back with its speakers; its segments stay in the spill file
+        _, meta_path = self._paths(room_id)
+        if not meta_path.exists():
+            return None
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        room = _Room()
+        room.speakers = meta["speakers"]
+        room.spilled = meta["spilled"]
+        meta_path.unlink()
+        return room
+
+    def _spill(self, room_id, room, keep):
+        seg_path, _ = self._paths(room_id)
+        out = room.segments[:len(room.segments) - keep]
+        with open(seg_path, "a", encoding="utf-8") as f:
+            for seg in out:
+                f.write(json.dumps(seg.to_row(), ensure_ascii=False) + "\n")
+        room.spilled += len(out)
+        room.segments = room.segments[len(out):]
+
+    def speaker_label(self, room_id, user_id):
+        with self._lock:
+            speakers = self._room(room_id).speakers
+            if user_id not in speakers:
+                speakers[user_id] = f"Speaker {len(speakers) + 1}"
+            return speakers[user_id]
+
+    def add_participant(self, room_id, user_id, user_name):
+        with self._lock:
+            room = self._room(room_id)
+            room.participants[user_id] = {"userId": user_id, "userName": user_name,
+                                          "joinedAt": datetime.utcnow().isoformat()}
+            return dict(room.participants)
+
+    def remove_participant(self, room_id, user_id):
+        """
+        Returns the remaining participants, or None if user_id was not in the room.
+        """
+        with self._lock:
+            room = self._room(room_id, create=False)
+            if room is None or user_id not in room.participants:
+                return None
+            del room.participants[user_id]
+            return dict(room.participants)
+
+    def append_segment(self, room_id, speaker, user_id, user_name, start, end, text, seq=None):
+        seg = Segment(speaker, user_id, user_name, start, end, text, time.time(), seq)
+        with self._lock:
+            room = self._room(room_id)
+            room.segments.append(seg)
+            if len(room.segments) > self.memory_segments:
+                self._spill(room_id, room, keep=self.memory_segments // 2)
+        return seg.to_dict()
+
+    def has_segments(self, room_id):
+        with self._lock:
+            room = self._room(room_id, create=False)
+            return room is not None and (room.spilled > 0 or bool(room.segments))
+
+    def segment_count(self, room_id):
+        with self._lock:
+            room = self._room(room_id, create=False)
+            return 0 if room is None else room.spilled + len(room.segments)
+
+    def segments(self, room_id):
+        with self._lock:
+            room = self._room(room_id, create=False)
+            if room is None:
+                return []
+            out = []
+            if room.spilled:
+                seg_path, _ = self._paths(room_id)
+                with open(seg_path, encoding="utf-8") as f:
+                    out = [Segment(*json.loads(line)).to_dict() for line in f]
+            out.extend(seg.to_dict() for seg in room.segments)
+        return out
+
+    def evict_idle(self):
+        """
+        Writes rooms that have been empty for idle_s to disk and forgets them.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for room_id, room in list(self.rooms.items()):
+                if room.participants or now - room.last_active < self.idle_s:
+                    continue
+                self._spill(room_id, room, keep=0)
+                _, meta_path = self._paths(room_id)
+                meta_path.write_text(json.dumps({"speakers": room.speakers, "spilled": room.spilled},
+                                                ensure_ascii=False), encoding="utf-8")
+                del self.rooms[room_id]
+                self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "rooms": len(self.rooms),
+                "segments_in_memory": sum(len(r.segments) for r in self.rooms.values()),
+                "evicted": self.evicted,
+            }
+
+
+class SQLiteStore:
+    def __init__(self, path=ROOM_STORE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS speakers (room TEXT, user_id TEXT, label TEXT,"
+                         " PRIMARY KEY (room, user_id))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS participants (room TEXT, user_id TEXT, user_name TEXT,"
+                         " joined_at TEXT, PRIMARY KEY (room, user_id))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS segments (id INTEGER PRIMARY KEY AUTOINCREMENT, room TEXT,"
+                         " speaker TEXT, user_id TEXT, user_name TEXT, start REAL, end REAL, text TEXT,"
+                         " ts REAL, seq INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS segments_room ON segments (room, id)")
+        self._lock = threading.Lock()
+
+    def speaker_label(self, room_id, user_id):
+        with self._lock:
+            row = self._db.execute("SELECT label FROM speakers WHERE room = ? AND user_id = ?",
+                                   (room_id, user_id)).fetchone()
+            if row is not None:
+                return row[0]
+            # numbering must not race with other processes adding a speaker to the same room
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT label FROM speakers WHERE room = ? AND user_id = ?",
+                                       (room_id, user_id)).fetchone()
+                if row is None:
+                    count = self._db.execute("SELECT COUNT(*) FROM speakers WHERE room = ?",
+                                             (room_id,)).fetchone()[0]
+                    row = (f"Speaker {count + 1}",)
+                    self._db.execute("INSERT INTO speakers VALUES (?, ?, ?)", (room_id, user_id, row[0]))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            return row[0]
+
+    def _participants(self, room_id):
+        rows = self._db.execute("SELECT user_id, user_name, joined_at FROM participants WHERE room = ?",
+                                (room_id,)).fetchall()
+        return {u: {"userId": u, "userName": n, "joinedAt": j} for u, n, j in rows}
+
+    def add_participant(self, room_id, user_id, user_name):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO participants VALUES (?, ?, ?, ?)",
+                             (room_id, user_id, user_name, datetime.utcnow().isoformat()))
+            return self._participants(room_id)
+
+    def remove_participant(self, room_id, user_id):
+        with self._lock:
+            cur = self._db.execute("DELETE FROM participants WHERE room = ? AND user_id = ?", (room_id, user_id))
+            if cur.rowcount == 0:
+                return None
+            return self._participants(room_id)
+
+    def append_segment(self, room_id, speaker, user_id, user_name, start, end, text, seq=None):
+        seg = Segment(speaker, user_id, user_name, start, end, text, time.time(), seq)
+        with self._lock:
+            self._db.execute("INSERT INTO segments (room, speaker, user_id, user_name, start, end, text, ts, seq)"
+                             " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [room_id] + seg.to_row())
+        return seg.to_dict()
+
+    def has_segments(self, room_id):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM segments WHERE room = ? LIMIT 1",
+                                    (room_id,)).fetchone() is not None
+
+    def segment_count(self, room_id):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM segments WHERE room = ?", (room_id,)).fetchone()[0]
+
+    def segments(self, room_id):
+        with self._lock:
+            rows = self._db.execute("SELECT speaker, user_id, user_name, start, end, text, ts, seq"
+                                    " FROM segments WHERE room = ? ORDER BY id", (room_id,)).fetchall()
+        return [Segment(*row).to_dict() for row in rows]
+
+    def evict_idle(self):
+        pass   # nothing is held in memory
+
+    def stats(self):
+        with self._lock:
+            rooms, segments = self._db.execute("SELECT COUNT(DISTINCT room), COUNT(*) FROM segments").fetchone()
+        return {"backend": "sqlite", "rooms": rooms, "segments": segments}
+
+
+def open_store():
+    if ROOM_STORE == "sqlite":
+        return SQLiteStore(ROOM_STORE_PATH)
+    return MemoryStore()
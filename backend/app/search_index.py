@@ -0,0 +1,287 @@
+# search_index.py
+"""
+Persistent full-text index over every transcript: uploads, background jobs
+and live rooms, with each segment's word timestamps.
+
+One SQLite file (WAL, shared by the transcription and room servers) holds
+the segments and an FTS5 inverted index over their tokens. Segments are
+added as they are produced, so a room's transcript is searchable while the
+meeting is still going.
+
+Tokenisation is done here, not by SQLite: NFC, casefold, ZWJ/ZWNJ dropped,
+and a token is a run of letters and digits together with their combining
+marks. Python's \\w (and FTS5's default tokenizer) count Tamil vowel signs
+and the pulli as separators and cut பள்ளியில் into பள ள ய ல.
+
+Queries (GET /api/search?q=...):
+    mode=all        every term (default)      any    one of the terms
+    mode=phrase     terms next to each other  substring  via the trigram index
+    term*           prefix match; Tamil case endings attach to the stem, so
+                    பள்ளி* finds பள்ளிக்கு and பள்ளியில் (prefix=true: every term)
+    order=recent    newest segments first (default); order=rank for BM25
+    session=, source=  restrict to one transcript/room or to upload/job/room
+
+Each hit is a segment with start_ms / end_ms and the matching words with
+their own offsets (interpolated over the text when Whisper gave no words).
+
+Config (env):
+    SEARCH_INDEX        1 (default) / 0 to disable
+    SEARCH_INDEX_PATH   SQLite file
+    SEARCH_PREFIX       FTS5 prefix index lengths, e.g. "2 3"; "" for none
+    SEARCH_NGRAM        1 (default) keeps the trigram index for mode=substring
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "1") != "0"
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "/tmp/tamil_transcribe/search.sqlite3")
+SEARCH_PREFIX = os.getenv("SEARCH_PREFIX", "2 3")
+SEARCH_NGRAM = os.getenv("SEARCH_NGRAM", "1") != "0"
+
+MODES = ("all", "any", "phrase", "substring")
+ORDERS = ("recent", "rank")
+MAX_LIMIT = 200
+
+# letters/digits plus combining marks (Latin accents, Indic vowel signs and
+# viramas from Devanagari to Sinhala, which includes the Tamil block)
+_TOKEN = re.compile(r"(?:[^\W_]|[\u0300-\u036f\u0900-\u0dff])+")
+_JOINERS = dict.fromkeys([0x200C, 0x200D])
+_FTS_TOKENIZER = "unicode61 categories 'L* N* Co M*' remove_diacritics 0"
+
+
+def normalize(text):
+    return unicodedata.normalize("NFC", text).translate(_JOINERS).casefold()
+
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text))
+
+
+def _ms(seconds):
+    return int(round(float(seconds or 0.0) * 1000))
+
+
+def segment_words(seg):
+    """
+    [(word, start_ms, end_ms)] from Whisper's words, or the text's words
+    spread over the segment in proportion to their length.
+    """
+    if seg.get("words"):
+        return [(w["word"].strip(), _ms(w["start"]), _ms(w["end"])) for w in seg["words"] if w["word"].strip()]
+    words = seg.get("text", "").split()
+    start, end = _ms(seg.get("start")), _ms(seg.get("end"))
+    total = sum(len(w) for w in words) or 1
+    out, pos = [], 0
+    for w in words:
+        out.append((w, start + (end - start) * pos // total, start + (end - start) * (pos + len(w)) // total))
+        pos += len(w)
+    return out
+
+
+class Query:
+    """
+    A parsed query: terms as (token, prefix) pairs, plus the FTS5 match
+    expression for the chosen mode.
+    """
+    def __init__(self, text, mode="all", prefix=False):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {list(MODES)}")
+        self.mode = mode
+        self.terms = []
+        for piece in text.split():
+            star = piece.endswith("*")
+            self.terms.extend((t, prefix or star) for t in tokenize(piece))
+        self.text = " ".join(t for t, _ in self.terms)
+
+    def expression(self):
+        if not self.terms:
+            return None
+        if self.mode == "substring":
+            return f'"{self.text}"' if len(self.text) >= 3 else None
+        if self.mode == "phrase":
+            return f'"{self.text}"' + (" *" if self.terms[-1][1] else "")
+        quoted = [f'"{t}"' + (" *" if p else "") for t, p in self.terms]
+        return (" OR " if self.mode == "any" else " AND ").join(quoted)
+
+    def matches(self, word):
+        tokens = tokenize(word)
+        if self.mode == "substring":
+            return self.text in " ".join(tokens)
+        return any(t == term or (p and t.startswith(term)) for t in tokens for term, p in self.terms)
+
+
+class SearchIndex:
+    def __init__(self, path=SEARCH_INDEX_PATH, prefix=SEARCH_PREFIX, ngram=SEARCH_NGRAM):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            " id INTEGER PRIMARY KEY, source TEXT, session TEXT, transcript TEXT, speaker TEXT,"
+            " start_ms INTEGER, end_ms INTEGER, text TEXT, words TEXT, ts REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS segments_session ON segments (session, source)")
+        prefix_opt = f", prefix='{prefix}'" if prefix.strip() else ""
+        self._db.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5("
+                         f"tokens, content='', tokenize=\"{_FTS_TOKENIZER}\"{prefix_opt})")
+        self.ngram = ngram
+        if ngram:
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS grams USING fts5("
+                             "tokens, content='', tokenize='trigram')")
+        self._lock = threading.Lock()
+        self._writer = None
+        self.counters = {"segments_added": 0, "queries": 0, "query_seconds": 0.0, "write_errors": 0}
+
+    def add(self, source, session, segments, transcript=None):
+        """
+        Appends segments ({"speaker", "start", "end", "text"[, "words"]}, times
+        in seconds) of one transcript in a single transaction.
+        """
+        rows, now = [], time.time()
+        for seg in segments:
+            text = seg.get("text", "")
+            tokens = " ".join(tokenize(text))
+            if not tokens:
+                continue
+            words = seg.get("words")
+            words = json.dumps([[w["word"].strip(), _ms(w["start"]), _ms(w["end"])] for w in words],
+                               ensure_ascii=False) if words else None
+            rows.append(((source, session, transcript or session, seg.get("speaker"),
+                          _ms(seg.get("start")), _ms(seg.get("end")), text, words, now), tokens))
+        if not rows:
+            return 0
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for row, tokens in rows:
+                    rowid = self._db.execute(
+                        "INSERT INTO segments (source, session, transcript, speaker, start_ms, end_ms, text, words, ts)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row).lastrowid
+                    self._db.execute("INSERT INTO terms (rowid, tokens) VALUES (?, ?)", (rowid, tokens))
+                    if self.ngram:
+                        self._db.execute("INSERT INTO grams (rowid, tokens) VALUES (?, ?)", (rowid, tokens))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        self.counters["segments_added"] += len(rows)
+        return len(rows)
+
+    def add_later(self, source, session, segments, transcript=None):
+        """
+        add() on the index's own writer thread, in call order, so an event
+        loop never waits on the SQLite transaction (or another process's lock).
+        """
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+        self._writer.submit(self._add_logged, source, session, segments, transcript)
+
+    def _add_logged(self, source, session, segments, transcript):
+        try:
+            self.add(source, session, segments, transcript)
+        except Exception as e:
+            self.counters["write_errors"] += 1
+            print("Search index write failed:", e)
+
+    def search(self, text, mode="all", prefix=False, source=None, session=None,
+               limit=20, offset=0, order="recent"):
+        started = time.perf_counter()
+        query = Query(text, mode, prefix)
+        expression = query.expression()
+        hits = []
+        if expression is not None and (mode != "substring" or self.ngram):
+            table = "grams" if mode == "substring" else "terms"
+            sql = (f"SELECT s.id, s.source, s.session, s.transcript, s.speaker, s.start_ms, s.end_ms,"
+                   f" s.text, s.words, s.ts FROM {table} JOIN segments s ON s.id = {table}.rowid"
+                   f" WHERE {table} MATCH ?")
+            params = [expression]
+            if source:
+                sql += " AND s.source = ?"
+                params.append(source)
+            if session:
+                sql += " AND s.session = ?"
+                params.append(session)
+            with self._lock:
+                if session:
+                    # the session's rowid range, so FTS5 skips the rest of the postings
+                    lo, hi = self._db.execute("SELECT MIN(id), MAX(id) FROM segments WHERE session = ?",
+                                              (session,)).fetchone()
+                    sql += f" AND {table}.rowid BETWEEN ? AND ?"
+                    params += [lo or 0, hi or 0]
+                # newest first walks the postings in rowid order and stops at limit;
+                # rank has to score every match first
+                sql += " ORDER BY " + ("rank" if order == "rank" else f"{table}.rowid DESC") + " LIMIT ? OFFSET ?"
+                params += [max(1, min(int(limit), MAX_LIMIT)), max(0, int(offset))]
+                rows = self._db.execute(sql, params).fetchall()
+            hits = [self._hit(row, query) for row in rows]
+        took = time.perf_counter() - started
+        self.counters["queries"] += 1
+        self.counters["query_seconds"] += took
+        return {"query": query.text, "mode": mode, "hits": hits, "took_ms": round(took * 1000, 3)}
+
+    def _hit(self, row, query):
+        seg_id, source, session, transcript, speaker, start_ms, end_ms, text, words, ts = row
+        if words:
+            words = [(w, s, e) for w, s, e in json.loads(words)]
+        else:
+            words = segment_words({"text": text, "start": start_ms / 1000, "end": end_ms / 1000})
+        return {
+            "id": seg_id, "source": source, "session": session, "transcript": transcript,
+            "speaker": speaker, "start_ms": start_ms, "end_ms": end_ms, "text": text,
+            "timestamp": datetime.utcfromtimestamp(ts).isoformat(),
+            "matches": [{"word": w, "start_ms": s, "end_ms": e} for w, s, e in words if query.matches(w)],
+        }
+
+    def stats(self):
+        with self._lock:
+            segments, sessions = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT session) FROM segments").fetchone()
+        return dict(self.counters, segments=segments, sessions=sessions)
+
+
+class _DisabledIndex:
+    def add(self, source, session, segments, transcript=None):
+        return 0
+
+    def add_later(self, source, session, segments, transcript=None):
+        pass
+
+    def search(self, text, mode="all", prefix=False, source=None, session=None,
+               limit=20, offset=0, order="recent"):
+        Query(text, mode, prefix)
+        return {"query": text, "mode": mode, "hits": [], "took_ms": 0.0}
+
+    def stats(self):
+        return {"disabled": True}
+
+
+def open_index():
+    return SearchIndex() if SEARCH_INDEX else _DisabledIndex()
+
+
+def install(app, index):
+    """
+    GET /api/search on app, answered from index.
+    """
+    from fastapi import HTTPException, Query as Param
+    from fastapi.concurrency import run_in_threadpool
+
+    @app.get("/api/search")
+    async def search(q: str, mode: str = "all", prefix: bool = False, source: str = None,
+                     session: str = None, limit: int = Param(20, ge=1, le=MAX_LIMIT),
+                     offset: int = Param(0, ge=0), order: str = "recent"):
+        if mode not in MODES:
+            raise HTTPException(status_code=400, detail=f"mode must be one of {list(MODES)}")
+        if order not in ORDERS:
+            raise HTTPException(status_code=400, detail=f"order must be one of {list(ORDERS)}")
+        return await run_in_threadpool(index.search, q, mode, prefix, source, session, limit, offset, order)
@@ -0,0 +1,160 @@
+# service_client.py
+"""
+Application-lifetime HTTP client for calls from the room server to the
+transcription service.
+
+One aiohttp session (keep-alive connection pool) is shared by every request.
+Requests that fail with a connection error or a 502/503/504 are retried with
+jittered exponential backoff, honouring Retry-After. A POST that timed out
+(504, or no answer within the timeout) is not retried: the service may have
+done the work already, and a retry would only add to its load. A circuit breaker opens
+after SERVICE_BREAKER_FAILURES failures in a row; while it is open calls fail
+fast with CircuitOpen instead of queueing on a saturated service, and after
+SERVICE_BREAKER_RESET_S one trial request is let through to probe it.
+
+    resp = await client.request("POST", "/api/transcribe_text", data=make_form)
+    async with resp:
+        data = await resp.json()
+
+`data` may be a callable returning a fresh body (FormData can only be sent
+once). The returned response is open; the caller reads or streams it and
+releases it with `async with`.
+
+Config (env):
+    SERVICE_MAX_CONNECTIONS   pooled connections in total
+    SERVICE_MAX_PER_HOST      pooled connections to one host
+    SERVICE_RETRIES           retries after the first attempt
+    SERVICE_BACKOFF_S         base delay; attempt n waits up to base * 2**n
+    SERVICE_BREAKER_FAILURES  consecutive failures that open the breaker
+    SERVICE_BREAKER_RESET_S   seconds the breaker stays open
+"""
+import asyncio
+import os
+import random
+import time
+
+import aiohttp
+
+MAX_CONNECTIONS = int(os.getenv("SERVICE_MAX_CONNECTIONS", "100"))
+MAX_PER_HOST = int(os.getenv("SERVICE_MAX_PER_HOST", "32"))
+RETRIES = int(os.getenv("SERVICE_RETRIES", "3"))
+BACKOFF_S = float(os.getenv("SERVICE_BACKOFF_S", "0.2"))
+BREAKER_FAILURES = int(os.getenv("SERVICE_BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("SERVICE_BREAKER_RESET_S", "10"))
+
+RETRY_STATUSES = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+MAX_RETRY_AFTER_S = 10.0
+
+
+class CircuitOpen(Exception):
+    """Raised while the breaker is open and the service is not being called."""
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, reset_s=BREAKER_RESET_S):
+        self.max_failures = failures
+        self.reset_s = reset_s
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_s:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.probing:
+            # one trial request at a time decides whether to close again
+            self.probing = True
+            return True
+        return False
+
+    def release(self):
+        # a trial request that ended without a verdict (cancelled, bad body, ...)
+        self.probing = False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.max_failures or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+class ServiceClient:
+    def __init__(self, base_url, retries=RETRIES, backoff_s=BACKOFF_S, breaker=None):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.breaker = breaker or CircuitBreaker()
+        self._session = None
+
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, limit_per_host=MAX_PER_HOST,
+                                             keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _delay(self, attempt, resp=None):
+        if resp is not None and resp.headers.get("Retry-After", "").isdigit():
+            return min(float(resp.headers["Retry-After"]), MAX_RETRY_AFTER_S) * random.uniform(0.5, 1.0)
+        # full jitter so retrying clients do not arrive together
+        return random.uniform(0, self.backoff_s * (2 ** attempt))
+
+    async def request(self, method, path, data=None, json=None, timeout=120, retries=None):
+        """
+        Returns the open aiohttp response. After the last retry a 5xx response
+        is returned as is; connection errors are re-raised.
+        """
+        retries = self.retries if retries is None else retries
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpen(f"{self.base_url} is failing; retry in a few seconds")
+            try:
+                body = data() if callable(data) else data
+                resp = await self.session().request(method, f"{self.base_url}{path}", data=body, json=json,
+                                                    timeout=aiohttp.ClientTimeout(total=timeout))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                self.breaker.failure()
+                if attempt == retries or (isinstance(e, asyncio.TimeoutError) and not idempotent):
+                    raise
+                await asyncio.sleep(self._delay(attempt))
+                continue
+            except aiohttp.ClientError:
+                self.breaker.failure()
+                raise
+            except BaseException:
+                # cancelled, or data() failed: never leave a half-open probe claimed
+                self.breaker.release()
+                raise
+            if resp.status not in RETRY_STATUSES:
+                self.breaker.success()
+                return resp
+            self.breaker.failure()
+            if attempt == retries or (resp.status == 504 and not idempotent):
+                return resp
+            delay = self._delay(attempt, resp)
+            resp.release()
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {"base_url": self.base_url, "breaker": self.breaker.state, "failures": self.breaker.failures}
@@ -1,12 +1,18 @@
 @echo off
+echo Starting inference service on port 8002...
+start cmd /k "python -m uvicorn inference_service:app --host 127.0.0.1 --port 8002"
+
+rem main and the transcription service share the inference service's model
+set INFERENCE_URL=http://127.0.0.1:8002
+
 echo Starting main app on port 8001...
 start cmd /k "python -m uvicorn main:app --host 0.0.0.0 --port 8001 --reload"
 
 echo Starting socket app on port 4000...
-start cmd /k "cd room && python -m uvicorn main:socket_app --host 0.0.0.0 --port 4000 --reload"
+start cmd /k "python -m uvicorn room.main:socket_app --host 0.0.0.0 --port 4000 --reload"
 
 echo Starting transcription service on port 8000...
-start cmd /k "cd room && python -m uvicorn transcription_service:app --host 0.0.0.0 --port 8000 --reload"
+start cmd /k "python -m uvicorn room.transcription_service:app --host 0.0.0.0 --port 8000 --reload"
 
 echo All servers started!
 pause
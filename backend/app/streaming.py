@@ -0,0 +1,106 @@
+# streaming.py
+"""
+Incremental (streaming) transcription with LocalAgreement-2.
+
+A speaker's audio is appended to a rolling buffer. Each pass re-transcribes
+the buffer with word timestamps; words on which two consecutive passes agree
+are committed (final), the rest is a tentative tail (partial). The committed
+text is passed back as the decoding prompt, and the buffer is trimmed at the
+last committed word so each pass stays short.
+
+transcribe_fn(audio, prompt) must be an async callable returning a list of
+{"word", "start", "end"} with times relative to the start of `audio`.
+"""
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def _norm(word):
+    return word.strip().lower().strip(".,!?;:\"'")
+
+
+class OnlineTranscriber:
+    def __init__(self, transcribe_fn, min_chunk_s=1.0, max_buffer_s=15.0, prompt_chars=200):
+        self.transcribe_fn = transcribe_fn
+        self.min_chunk = int(min_chunk_s * SAMPLE_RATE)
+        self.max_buffer = int(max_buffer_s * SAMPLE_RATE)
+        self.prompt_chars = prompt_chars
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.buffer_offset = 0.0   # stream time (s) of self.audio[0]
+        self.committed = []        # latest committed words (enough for the prompt), stream time
+        self.tentative = []        # last pass's uncommitted words
+        self._unprocessed = 0
+
+    def insert_audio(self, pcm: np.ndarray):
+        self.audio = np.concatenate([self.audio, pcm.astype(np.float32, copy=False)])
+        self._unprocessed += len(pcm)
+
+    def ready(self) -> bool:
+        return self._unprocessed >= self.min_chunk
+
+    def prompt(self) -> str:
+        return "".join(w["word"] for w in self.committed)[-self.prompt_chars:]
+
+    async def process(self):
+        """
+        Run one pass over the buffer. Returns (newly committed words, tentative words).
+        """
+        self._unprocessed = 0
+        if len(self.audio) == 0:
+            return [], self.tentative
+        words = await self.transcribe_fn(self.audio, self.prompt())
+        last_end = self.committed[-1]["end"] if self.committed else 0.0
+        hyp = []
+        for w in words:
+            w = {"word": w["word"], "start": w["start"] + self.buffer_offset, "end": w["end"] + self.buffer_offset}
+            # words already committed by an earlier pass reappear at the buffer head
+            if w["end"] <= last_end + 0.05:
+                continue
+            hyp.append(w)
+
+        agreed = 0
+        while (agreed < len(hyp) and agreed < len(self.tentative)
+               and _norm(hyp[agreed]["word"]) == _norm(self.tentative[agreed]["word"])):
+            agreed += 1
+        new_words = hyp[:agreed]
+        self._commit(new_words)
+        self.tentative = hyp[agreed:]
+        self._trim()
+        return new_words, self.tentative
+
+    async def finish(self):
+        """
+        End of stream: the tentative tail becomes final as-is. Returns every
+        word not returned as committed before (the last pass's plus the tail).
+        """
+        new_words = []
+        if self._unprocessed:
+            new_words, _ = await self.process()
+        tail = self.tentative
+        self._commit(tail)
+        self.tentative = []
+        self.audio = np.zeros(0, dtype=np.float32)
+        return new_words + tail
+
+    def _commit(self, words):
+        # emitted words are the caller's; keep only what the prompt and the next pass need
+        self.committed.extend(words)
+        chars = 0
+        for i in range(len(self.committed) - 1, 0, -1):
+            chars += len(self.committed[i]["word"])
+            if chars >= self.prompt_chars:
+                del self.committed[:i]
+                break
+
+    def _trim(self):
+        if len(self.audio) <= self.max_buffer:
+            return
+        if self.committed and self.committed[-1]["end"] > self.buffer_offset:
+            cut = int((self.committed[-1]["end"] - self.buffer_offset) * SAMPLE_RATE)
+        else:
+            # nothing to anchor on; drop the oldest audio so the buffer stays bounded
+            cut = len(self.audio) - self.max_buffer
+        cut = min(cut, len(self.audio))
+        self.audio = self.audio[cut:]
+        self.buffer_offset += cut / SAMPLE_RATE
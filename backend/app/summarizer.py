@@ -0,0 +1,306 @@
+# summarizer.py
+"""
+Map-reduce summaries of meeting transcripts for /api/summary, /api/min_meet
+and the two DOCX downloads.
+
+The transcript ("speaker: text" lines) is split on speaker turns into chunks
+under LLM_CHUNK_TOKENS. A transcript that fits in one chunk gets the task
+prompt directly, as before. Longer ones are summarised chunk by chunk,
+LLM_CONCURRENCY at a time (map), and the task prompt then runs on the
+ordered partial summaries (reduce), repeating the reduce if the partials
+are themselves too long.
+
+Chunk summaries do not depend on the task, and both they and final outputs
+are memoised by content hash, so summary, minutes and both downloads of the
+same meeting share the work. Concurrent identical calls share one request.
+
+The LLM sits behind a small async client interface (`complete(prompt,
+max_tokens)` and `stream(prompt, max_tokens)` yielding text deltas);
+LLM_BACKEND=stub swaps in a deterministic local stub for tests and benchmarks.
+`Summarizer.stream` yields the final answer as it is generated and memoises
+the joined text, so streamed and plain responses are the same.
+
+Config (env):
+    LLM_BACKEND        groq (default) / stub
+    LLM_MODEL          model name for the Groq client
+    LLM_CHUNK_TOKENS   token budget per map chunk
+    LLM_MAX_TOKENS     tokens for a final answer
+    LLM_MAP_TOKENS     tokens for one chunk summary
+    LLM_CONCURRENCY    map calls in flight
+    LLM_MEMO_SIZE      memoised chunk summaries and outputs
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+import metrics
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "3000"))
+MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1024"))
+MAP_TOKENS = int(os.getenv("LLM_MAP_TOKENS", "512"))
+CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+MEMO_SIZE = int(os.getenv("LLM_MEMO_SIZE", "512"))
+
+PROMPTS = {
+    ("minutes", "ta"): (
+        "இந்த உரையை முழுமையான கூட்ட நொடிகள் (Minutes of Meeting) வடிவில் உருவாக்கவும். "
+        "இதில் முக்கியமான விவாதங்கள், முடிவுகள், செயல்பாடுகள் (action items) ஆகியவற்றை "
+        "சுருக்கமாக குறிப்பிடவும்:\n{text}"
+    ),
+    ("minutes", "en"): (
+        "Generate a detailed Minutes of Meeting report from the following text. "
+        "Include key discussions, decisions made, and action items:\n{text}"
+    ),
+    ("summary", "ta"): "இந்த உரையை தமிழில் சுருக்கமாக விவரிக்கவும்:\n{text}",
+    ("summary", "en"): "Summarize the following text in English:\n{text}",
+    ("notes", "ta"): "இந்த உரையை தமிழில் சுருக்கமாகக் குறிப்புகள் (bullet points) வடிவில் உருவாக்கவும்:\n{text}",
+    # map step: one part of a longer meeting
+    ("chunk", "ta"): (
+        "பின்வருவது ஒரு நீண்ட கூட்டத்தின் ஒரு பகுதி. பேச்சாளர்கள், முக்கிய விவாதங்கள், "
+        "முடிவுகள், செயல்பாடுகள் ஆகியவற்றை விடாமல் தமிழில் சுருக்கவும்:\n{text}"
+    ),
+    ("chunk", "en"): (
+        "The following is one part of a longer meeting transcript. Summarise it in English, "
+        "keeping who said what, key discussion points, decisions and action items:\n{text}"
+    ),
+}
+
+
+def prompt_for(task, language, text):
+    template = PROMPTS.get((task, language)) or PROMPTS.get((task, "en")) or PROMPTS[(task, "ta")]
+    return template.format(text=text)
+
+
+def count_tokens(text):
+    """
+    Rough token count without a tokenizer: ~4 ASCII characters per token, and
+    one token per character of other scripts (Tamil splits into many tokens).
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def chunk_lines(lines, budget=CHUNK_TOKENS):
+    """
+    Groups transcript lines (speaker turns) into chunks of at most budget
+    tokens. A single turn over budget is cut at word boundaries.
+    """
+    chunks, current, size = [], [], 0
+    for line in lines:
+        cost = count_tokens(line)
+        if cost > budget:
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            piece = []
+            for word in line.split(" "):
+                piece.append(word)
+                if count_tokens(" ".join(piece)) > budget and len(piece) > 1:
+                    chunks.append(" ".join(piece[:-1]))
+                    piece = [word]
+            line, cost = " ".join(piece), count_tokens(" ".join(piece))
+        if current and size + cost > budget:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += cost
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _record_rate(tokens, start, first):
+    elapsed = time.perf_counter() - (first or start)
+    if tokens and elapsed > 0:
+        metrics.LLM_TOKENS_PER_SECOND.observe(tokens / elapsed)
+
+
+class GroqClient:
+    """
+    Groq's OpenAI-compatible chat completions. client_factory returns the
+    (lazily created) openai.AsyncOpenAI client.
+    """
+    name = "groq"
+
+    def __init__(self, client_factory, model=LLM_MODEL):
+        self.client_factory = client_factory
+        self.model = model
+
+    def _request(self, prompt, max_tokens, **extra):
+        return self.client_factory().chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=max_tokens,
+            **extra,
+        )
+
+    async def complete(self, prompt, max_tokens=MAX_TOKENS):
+        start = time.perf_counter()
+        response = await self._request(prompt, max_tokens)
+        usage = getattr(response, "usage", None)
+        _record_rate(getattr(usage, "completion_tokens", 0), start, None)
+        return response.choices[0].message.content
+
+    async def stream(self, prompt, max_tokens=MAX_TOKENS):
+        """
+        Yields text deltas as the model produces them.
+        """
+        start, first, tokens = time.perf_counter(), None, 0
+        async for chunk in await self._request(prompt, max_tokens, stream=True):
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first is None:
+                    first = time.perf_counter()
+                    metrics.LLM_TTFT.observe(first - start)
+                tokens += 1   # one content chunk per token on the wire
+                yield delta
+        _record_rate(tokens, start, first)
+
+
+class StubClient:
+    """
+    Deterministic offline stand-in: echoes the start of the prompt's body.
+    stream() yields the same text word by word.
+    """
+    name = "stub"
+
+    def __init__(self, words=40, delay_s=0.0):
+        self.words = words
+        self.delay_s = delay_s
+        self.calls = 0
+
+    async def complete(self, prompt, max_tokens=MAX_TOKENS):
+        self.calls += 1
+        if self.delay_s:
+            await asyncio.sleep(self.delay_s)
+        body = prompt.split("\n", 1)[-1]
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        return f"[{digest}] " + " ".join(body.split()[:min(self.words, max_tokens)])
+
+    async def stream(self, prompt, max_tokens=MAX_TOKENS):
+        start = time.perf_counter()
+        text = await self.complete(prompt, max_tokens)
+        words = text.split(" ")
+        first = time.perf_counter()
+        metrics.LLM_TTFT.observe(first - start)
+        for i, word in enumerate(words):
+            yield word if i == 0 else " " + word
+            await asyncio.sleep(0)
+        _record_rate(len(words), start, first)
+
+
+class Summarizer:
+    def __init__(self, client, chunk_tokens=CHUNK_TOKENS, concurrency=CONCURRENCY, memo_size=MEMO_SIZE):
+        self.client = client
+        self.chunk_tokens = chunk_tokens
+        self.memo_size = memo_size
+        self._slots = asyncio.Semaphore(concurrency)
+        self._memo = OrderedDict()   # key -> asyncio.Task / Future
+        self.counts = {"llm_calls": 0, "memo_hits": 0}
+
+    def _lookup(self, key):
+        # a live or successful entry; failed ones are forgotten so the next call retries
+        future = self._memo.get(key)
+        if future is None or (future.done() and (future.cancelled() or future.exception())):
+            return None
+        self._memo.move_to_end(key)
+        self.counts["memo_hits"] += 1
+        return future
+
+    def _store(self, key, future):
+        self._memo[key] = future
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return future
+
+    def _memoised(self, key, make):
+        return self._lookup(key) or self._store(key, asyncio.ensure_future(make()))
+
+    async def _call(self, prompt, max_tokens):
+        async with self._slots:
+            self.counts["llm_calls"] += 1
+            return await self.client.complete(prompt, max_tokens)
+
+    def _summarise_chunk(self, chunk, language):
+        key = ("chunk", language, hashlib.sha256(chunk.encode("utf-8")).hexdigest())
+        return self._memoised(key, lambda: self._call(prompt_for("chunk", language, chunk), MAP_TOKENS))
+
+    async def _condense(self, language, text, previous=None):
+        """
+        Map rounds until the text fits in one chunk (or stops shrinking);
+        returns the text the final task prompt runs on.
+        """
+        chunks = chunk_lines(text.split("\n"), self.chunk_tokens)
+        if len(chunks) == 1 or (previous is not None and len(chunks) >= previous):
+            return text
+        partials = await asyncio.gather(*(self._summarise_chunk(c, language) for c in chunks))
+        # partial summaries stay in meeting order, one paragraph each
+        return await self._condense(language, "\n".join(p.replace("\n", " ") for p in partials), len(chunks))
+
+    async def _reduce(self, task, language, text):
+        return await self._call(prompt_for(task, language, await self._condense(language, text)), MAX_TOKENS)
+
+    @staticmethod
+    def _key(task, language, text):
+        return (task, language, hashlib.sha256(text.encode("utf-8")).hexdigest())
+
+    async def run(self, task, lines, language="ta"):
+        """
+        task: summary / minutes / notes; lines: "speaker: text" turns.
+        """
+        text = "\n".join(lines)
+        key = self._key(task, language, text)
+        # shielded: a client going away must not cancel work other requests share
+        return await asyncio.shield(self._memoised(key, lambda: self._reduce(task, language, text)))
+
+    async def stream(self, task, lines, language="ta"):
+        """
+        Same result as run(), yielded as text deltas. The map rounds run first;
+        the final answer is streamed from the model. A result that is already
+        memoised (or being produced by another request) comes as one delta.
+        """
+        text = "\n".join(lines)
+        key = self._key(task, language, text)
+        existing = self._lookup(key)
+        if existing is not None:
+            yield await asyncio.shield(existing)
+            return
+        future = self._store(key, asyncio.get_running_loop().create_future())
+        parts = []
+        try:
+            prompt = prompt_for(task, language, await self._condense(language, text))
+            async with self._slots:
+                self.counts["llm_calls"] += 1
+                async for delta in self.client.stream(prompt, MAX_TOKENS):
+                    parts.append(delta)
+                    yield delta
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("stream cancelled"))
+            future.exception()   # mark retrieved; waiters still see it
+            raise
+        future.set_result("".join(parts))
+
+    def stats(self):
+        return {"backend": self.client.name, "memoised": len(self._memo), **self.counts}
+
+
+def transcript_lines(segments, default_speaker="பேச்சாளர் ?"):
+    lines = []
+    for s in segments:
+        text = s.get("text", "").strip()
+        if text:
+            lines.append(f"{s.get('speaker', default_speaker)}: {text}")
+    return lines
+
+
+def open_client(client_factory):
+    if LLM_BACKEND == "stub":
+        return StubClient()
+    return GroqClient(client_factory)
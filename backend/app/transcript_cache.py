@@ -0,0 +1,279 @@
+# transcript_cache.py
+"""
+Content-addressed cache for the transcription pipeline.
+
+Everything is keyed by a hash of the decoded 16 kHz PCM plus the options
+that affect each stage, and each stage is stored on its own so a request
+that changes one option reuses the others:
+
+    audio        VAD-trimmed / denoised buffer   (pcm, vad, denoise)
+    whisper      final Whisper segments          (pcm, vad, denoise, model, engine, language, words)
+    embeddings   speaker embedding per window    (pcm, vad, denoise, embedder)
+
+Two backends share the same interface: SQLiteBackend (on disk, default) and
+MemoryBackend. Both evict least-recently-used entries once the total stored
+size goes over the limit.
+
+Config (env):
+    TRANSCRIPT_CACHE          1 (default) / 0 to disable
+    TRANSCRIPT_CACHE_BACKEND  sqlite (default) / memory
+    TRANSCRIPT_CACHE_PATH     SQLite file
+    TRANSCRIPT_CACHE_MAX_MB   size limit
+    TRANSCRIPT_CACHE_AUDIO_MB largest processed buffer worth caching; longer
+                              audio only caches its Whisper and embedding stages
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_ENABLED = os.getenv("TRANSCRIPT_CACHE", "1") != "0"
+CACHE_BACKEND = os.getenv("TRANSCRIPT_CACHE_BACKEND", "sqlite")
+CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", "/tmp/tamil_transcribe/transcript_cache.sqlite3")
+CACHE_MAX_BYTES = int(float(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+# 64 MB is ~17 min of 16 kHz float32
+CACHE_AUDIO_MAX_BYTES = int(float(os.getenv("TRANSCRIPT_CACHE_AUDIO_MB", "64")) * 1024 * 1024)
+
+
+def audio_digest(data: np.ndarray) -> str:
+    return hashlib.sha256(np.ascontiguousarray(data, dtype=np.float32).tobytes()).hexdigest()
+
+
+def stage_keys(pcm_hash, model_name, language, vad, denoise, engine=None, words=False):
+    """
+    Cache keys for each stage of one request; all None when pcm_hash is None
+    (e.g. the temp-file fallback, which is not cached). engine is the
+    Whisper backend (inference_pool.ENGINE); words whether the cached
+    segments carry word timestamps.
+    """
+    if pcm_hash is None:
+        return {"audio": None, "whisper": None, "diarization": None}
+    audio = f"{pcm_hash}:vad={int(bool(vad))}:denoise={int(bool(denoise))}"
+    return {
+        "audio": audio,
+        "whisper": f"{audio}:model={model_name}:engine={engine}:lang={language}:words={int(bool(words))}",
+        "diarization": audio,   # + the embedder, see Diarizer.cache_key
+    }
+
+
+class MemoryBackend:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total = 0
+        self._entries = OrderedDict()   # (kind, key) -> (value, meta)
+        self._lock = threading.Lock()
+
+    def get(self, kind, key):
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is not None:
+                self._entries.move_to_end((kind, key))
+            return entry
+
+    def put(self, kind, key, value, meta):
+        with self._lock:
+            old = self._entries.pop((kind, key), None)
+            if old is not None:
+                self.total -= len(old[0])
+            self._entries[(kind, key)] = (value, meta)
+            self.total += len(value)
+            while self.total > self.max_bytes and len(self._entries) > 1:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.total -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    The file may be shared by several processes (main.py and the room
+    transcription service), so the stored size is a row in the file,
+    updated in the same transaction as the entries, not a per-process count.
+    """
+    def __init__(self, path, max_bytes):
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " kind TEXT, key TEXT, value BLOB, meta TEXT, size INTEGER, last_access REAL,"
+            " PRIMARY KEY (kind, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value INTEGER)")
+        # a file from before the totals table gets its row from the entries
+        self._db.execute("INSERT OR IGNORE INTO totals SELECT 'size', COALESCE(SUM(size), 0) FROM entries")
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        with self._lock:
+            return self._db.execute("SELECT value FROM totals WHERE name = 'size'").fetchone()[0]
+
+    def get(self, kind, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, meta FROM entries WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE entries SET last_access = ? WHERE kind = ? AND key = ?",
+                    (time.time(), kind, key),
+                )
+            return row
+
+    def put(self, kind, key, value, meta):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                old = self._db.execute(
+                    "SELECT size FROM entries WHERE kind = ? AND key = ?", (kind, key)
+                ).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, key, value, meta, len(value), time.time()),
+                )
+                self._add_size(len(value) - (old[0] if old is not None else 0))
+                self._evict()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _add_size(self, delta):
+        if delta:
+            self._db.execute("UPDATE totals SET value = value + ? WHERE name = 'size'", (delta,))
+        return self._db.execute("SELECT value FROM totals WHERE name = 'size'").fetchone()[0]
+
+    def _evict(self):
+        total = self._add_size(0)
+        while total > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT kind, key, size FROM entries ORDER BY last_access LIMIT 32"
+            ).fetchall()
+            if len(rows) <= 1:
+                break
+            for kind, key, size in rows:
+                self._db.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+                total = self._add_size(-size)
+                if total <= self.max_bytes:
+                    break
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class TranscriptCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = {}
+        self.misses = {}
+
+    def _count(self, kind, hit):
+        counters = self.hits if hit else self.misses
+        counters[kind] = counters.get(kind, 0) + 1
+
+    def get_json(self, kind, key):
+        if key is None:
+            return None
+        entry = self.backend.get(kind, key)
+        self._count(kind, entry is not None)
+        return None if entry is None else json.loads(entry[0])
+
+    def put_json(self, kind, key, obj):
+        if key is not None:
+            self.backend.put(kind, key, json.dumps(obj, ensure_ascii=False).encode("utf-8"), None)
+
+    def get_audio(self, key):
+        """
+        Returns (audio, spans) or None. audio is None for chunks VAD found silent.
+        """
+        if key is None:
+            return None
+        entry = self.backend.get("audio", key)
+        self._count("audio", entry is not None)
+        if entry is None:
+            return None
+        value, meta = entry
+        meta = json.loads(meta)
+        audio = np.frombuffer(value, dtype=np.float32).copy() if not meta["silent"] else None
+        return audio, meta["spans"]
+
+    def put_audio(self, key, audio, spans):
+        if key is None or (audio is not None and audio.size * 4 > CACHE_AUDIO_MAX_BYTES):
+            return
+        value = b"" if audio is None else np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+        meta = json.dumps({"silent": audio is None, "spans": spans})
+        self.backend.put("audio", key, value, meta)
+
+    def get_embeddings(self, key):
+        """
+        Returns diarization.Windows or None.
+        """
+        if key is None:
+            return None
+        entry = self.backend.get("embeddings", key)
+        self._count("embeddings", entry is not None)
+        if entry is None:
+            return None
+        from diarization import Windows
+        value, meta = entry
+        meta = json.loads(meta)
+        vectors = np.frombuffer(value, dtype=np.float32).copy()
+        count = len(meta["starts"])
+        return Windows(meta["starts"], meta["ends"], vectors.reshape(count, -1) if count else vectors.reshape(0, 0))
+
+    def put_embeddings(self, key, windows):
+        if key is None:
+            return
+        meta = json.dumps({"starts": windows.starts.tolist(), "ends": windows.ends.tolist()})
+        self.backend.put("embeddings", key, np.ascontiguousarray(windows.vectors).tobytes(), meta)
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "bytes": self.backend.total,
+            "max_bytes": self.backend.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class _DisabledCache(TranscriptCache):
+    def __init__(self):
+        super().__init__(MemoryBackend(0))
+
+    def get_json(self, kind, key):
+        return None
+
+    def put_json(self, kind, key, obj):
+        pass
+
+    def get_audio(self, key):
+        return None
+
+    def put_audio(self, key, audio, spans):
+        pass
+
+    def get_embeddings(self, key):
+        return None
+
+    def put_embeddings(self, key, windows):
+        pass
+
+
+def open_cache():
+    if not CACHE_ENABLED:
+        return _DisabledCache()
+    if CACHE_BACKEND == "memory":
+        return TranscriptCache(MemoryBackend(CACHE_MAX_BYTES))
+    return TranscriptCache(SQLiteBackend(CACHE_PATH, CACHE_MAX_BYTES))
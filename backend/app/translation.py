@@ -0,0 +1,209 @@
+# translation.py
+"""
+Segment translation for non-Tamil targets (Whisper transcribes those in
+English first).
+
+Segment texts are de-duplicated, looked up in an LRU keyed by
+(text, target), and the misses are packed into requests of at most
+TRANSLATE_BATCH_CHARS that run TRANSLATE_CONCURRENCY at a time.
+
+Engines (TRANSLATE_ENGINE):
+    google  Google Translate web endpoint (what deep_translator calls), one
+            pooled aiohttp session; a batch is the texts joined by newlines
+    nllb    local NLLB-200 model via transformers, CPU, no network;
+            TRANSLATE_MODEL may be a local directory
+
+    stats = await translator.translate_segments(segments, "hi")
+    # {"engine", "seconds", "segments", "cache_hits", "requests"}
+
+Config (env):
+    TRANSLATE_ENGINE, TRANSLATE_MODEL, TRANSLATE_BATCH_CHARS,
+    TRANSLATE_CONCURRENCY, TRANSLATE_CACHE_SIZE
+"""
+import asyncio
+import html
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+
+ENGINE = os.getenv("TRANSLATE_ENGINE", "google")
+MODEL = os.getenv("TRANSLATE_MODEL", "facebook/nllb-200-distilled-600M")
+BATCH_CHARS = int(os.getenv("TRANSLATE_BATCH_CHARS", "4000"))
+CONCURRENCY = int(os.getenv("TRANSLATE_CONCURRENCY", "8"))
+CACHE_SIZE = int(os.getenv("TRANSLATE_CACHE_SIZE", "20000"))
+
+# ISO 639-1 -> NLLB-200 codes for the languages the UI offers
+NLLB_CODES = {
+    "en": "eng_Latn", "ta": "tam_Taml", "hi": "hin_Deva", "te": "tel_Telu", "ml": "mal_Mlym",
+    "kn": "kan_Knda", "bn": "ben_Beng", "mr": "mar_Deva", "gu": "guj_Gujr", "pa": "pan_Guru",
+    "ur": "urd_Arab", "si": "sin_Sinh", "fr": "fra_Latn", "de": "deu_Latn", "es": "spa_Latn",
+    "ar": "arb_Arab", "zh-cn": "zho_Hans", "ja": "jpn_Jpan",
+}
+
+
+class GoogleEngine:
+    name = "google"
+    url = "https://translate.google.com/m"
+    _result = re.compile(r'<div class="result-container">(.*?)</div>', re.S)
+
+    def __init__(self):
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=CONCURRENCY, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        return self._session
+
+    async def _request(self, text, source, target):
+        params = {"sl": source, "tl": target, "q": text}
+        async with self._get_session().get(self.url, params=params) as resp:
+            resp.raise_for_status()
+            match = self._result.search(await resp.text())
+        if match is None:
+            raise RuntimeError("no translation in response")
+        return html.unescape(match.group(1))
+
+    async def translate_batch(self, texts, source, target):
+        out = (await self._request("\n".join(texts), source, target)).split("\n")
+        if len(out) != len(texts):
+            # the service merged or split lines; fall back to one request per text
+            out = await asyncio.gather(*(self._request(t, source, target) for t in texts))
+        return [t.strip() for t in out]
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class NLLBEngine:
+    name = "nllb"
+    batch_size = 16
+
+    def __init__(self, model_name=MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._tokenizers = {}
+        self._lock = threading.Lock()
+
+    def _load(self, source):
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        if self._model is None:
+            self._model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
+            self._model.eval()
+        if source not in self._tokenizers:
+            self._tokenizers[source] = AutoTokenizer.from_pretrained(self.model_name, src_lang=source)
+        return self._model, self._tokenizers[source]
+
+    def _translate(self, texts, source, target):
+        import torch
+        src = NLLB_CODES.get(source, NLLB_CODES["en"])   # "auto" means Whisper's English
+        if target not in NLLB_CODES:
+            raise ValueError(f"No local translation model code for {target!r}")
+        with self._lock, torch.inference_mode():
+            model, tokenizer = self._load(src)
+            out = []
+            for i in range(0, len(texts), self.batch_size):
+                batch = tokenizer(texts[i:i + self.batch_size], return_tensors="pt", padding=True, truncation=True)
+                generated = model.generate(**batch, max_new_tokens=256,
+                                           forced_bos_token_id=tokenizer.convert_tokens_to_ids(NLLB_CODES[target]))
+                out.extend(tokenizer.batch_decode(generated, skip_special_tokens=True))
+            return out
+
+    async def translate_batch(self, texts, source, target):
+        return await run_in_threadpool(self._translate, texts, source, target)
+
+    async def close(self):
+        pass
+
+
+ENGINES = {GoogleEngine.name: GoogleEngine, NLLBEngine.name: NLLBEngine}
+
+
+def _batches(texts, max_chars):
+    batch, size = [], 0
+    for text in texts:
+        if batch and size + len(text) + 1 > max_chars:
+            yield batch
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text) + 1
+    if batch:
+        yield batch
+
+
+class Translator:
+    def __init__(self, engine=ENGINE, cache_size=CACHE_SIZE, batch_chars=BATCH_CHARS, concurrency=CONCURRENCY):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown TRANSLATE_ENGINE {engine!r}; choose from {sorted(ENGINES)}")
+        self.engine = ENGINES[engine]()
+        self.cache_size = cache_size
+        self.batch_chars = batch_chars
+        self.concurrency = concurrency
+        self._cache = OrderedDict()
+        self.counts = {"hits": 0, "misses": 0, "requests": 0}
+
+    def _get(self, key):
+        value = self._cache.get(key)
+        if value is not None:
+            self._cache.move_to_end(key)
+        return value
+
+    def _put(self, key, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def translate_texts(self, texts, target, source="auto"):
+        """
+        Returns (translations in input order, stats).
+        """
+        start = time.perf_counter()
+        # newlines separate texts inside a batch, so they cannot appear in one
+        clean = [" ".join(t.split()) for t in texts]
+        found = {t: self._get((t, target)) for t in set(clean) if t}
+        missing = [t for t, v in found.items() if v is None]
+        hits = len(found) - len(missing)
+
+        batches = list(_batches(missing, self.batch_chars))
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def run(batch):
+            async with slots:
+                translated = await self.engine.translate_batch(batch, source, target)
+            for text, out in zip(batch, translated):
+                found[text] = out
+                self._put((text, target), out)
+
+        await asyncio.gather(*(run(b) for b in batches))
+        self.counts["hits"] += hits
+        self.counts["misses"] += len(missing)
+        self.counts["requests"] += len(batches)
+        stats = {"engine": self.engine.name, "seconds": time.perf_counter() - start,
+                 "segments": len(texts), "cache_hits": hits, "requests": len(batches)}
+        return [found.get(t, t) if t else t for t in clean], stats
+
+    async def translate_segments(self, segments, target, source="auto"):
+        """
+        Replaces each segment's text with its translation in place; returns stats.
+        """
+        texts = [seg.get("text") or "" for seg in segments]
+        translated, stats = await self.translate_texts(texts, target, source)
+        for seg, text in zip(segments, translated):
+            if seg.get("text"):
+                seg["text"] = text
+        return stats
+
+    def stats(self):
+        return {"engine": self.engine.name, "cached": len(self._cache), **self.counts}
+
+    async def close(self):
+        await self.engine.close()
@@ -0,0 +1,230 @@
+# whisper_backends.py
+"""
+Inference backends behind run_whisper / the inference pool.
+
+Every backend loads one model and exposes
+
+    transcribe(audio, **options)  -> {"text", "language", "segments": [...]}
+    decode_batch(audios, **options) -> [result, ...]   (clips of <= 30 s, timed
+                                                        segments, no words)
+
+with segments in one schema: {"id", "start", "end", "text", "avg_logprob",
+"no_speech_prob"} plus "words" [{"word", "start", "end", "probability"}]
+when word_timestamps=True. audio is a WAV path or a 16 kHz float32 array.
+
+Pick one with WHISPER_BACKEND:
+    openai-whisper   PyTorch reference implementation (default)
+    faster-whisper   CTranslate2, int8 on CPU by default (WHISPER_COMPUTE_TYPE)
+    stub             no model: deterministic text from the audio itself, for
+                     benchmarks and load tests offline (WHISPER_STUB_RTF
+                     seconds of simulated inference per second of audio)
+"""
+import os
+import time
+import zlib
+
+import numpy as np
+
+BACKEND = os.getenv("WHISPER_BACKEND", "openai-whisper")
+COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+STUB_RTF = float(os.getenv("WHISPER_STUB_RTF", "0"))
+
+SAMPLE_RATE = 16000
+
+
+def _segment(i, start, end, text, avg_logprob=None, no_speech_prob=None, words=None):
+    seg = {"id": i, "start": float(start), "end": float(end), "text": text,
+           "avg_logprob": avg_logprob, "no_speech_prob": no_speech_prob}
+    if words is not None:
+        seg["words"] = words
+    return seg
+
+
+class OpenAIWhisperBackend:
+    name = "openai-whisper"
+
+    def __init__(self, model_name):
+        import whisper
+        self.whisper = whisper
+        self.model = whisper.load_model(model_name)
+
+    def transcribe(self, audio, **options):
+        options.setdefault("fp16", self.model.device.type == "cuda")
+        result = self.model.transcribe(audio, **options)
+        segments = [
+            _segment(i, s["start"], s["end"], s["text"], s.get("avg_logprob"), s.get("no_speech_prob"),
+                     [{"word": w["word"], "start": w["start"], "end": w["end"], "probability": w.get("probability")}
+                      for w in s["words"]] if "words" in s else None)
+            for i, s in enumerate(result.get("segments", []))
+        ]
+        return {"text": result.get("text", ""), "language": result.get("language"), "segments": segments}
+
+    def _timestamp_begin(self, options):
+        kwargs = {"num_languages": self.model.num_languages} if hasattr(self.model, "num_languages") else {}
+        tokenizer = self.whisper.tokenizer.get_tokenizer(
+            self.model.is_multilingual, language=options.get("language"), task=options.get("task", "transcribe"),
+            **kwargs)
+        return tokenizer, tokenizer.timestamp_begin
+
+    @staticmethod
+    def _split(tokens, tokenizer, timestamp_begin, duration, avg_logprob, no_speech_prob):
+        # <|t0|> text <|t1|><|t1|> text <|t2|> ... -> segments, as whisper.transcribe cuts them
+        segments, start, text = [], 0.0, []
+        for token in tokens:
+            if token < timestamp_begin:
+                text.append(token)
+                continue
+            t = min((token - timestamp_begin) * 0.02, duration)
+            if text:
+                segments.append(_segment(len(segments), start, t, tokenizer.decode(text), avg_logprob, no_speech_prob))
+                text = []
+            start = t
+        if text:
+            segments.append(_segment(len(segments), start, duration, tokenizer.decode(text), avg_logprob, no_speech_prob))
+        segments = [s for s in segments if s["text"].strip()]
+        for i, seg in enumerate(segments):
+            seg["id"] = i
+        return segments
+
+    def decode_batch(self, audios, **options):
+        """
+        One encoder/decoder pass over several <=30 s clips. Each clip is padded
+        to a full 30 s mel window and the stack is decoded as a single batch,
+        with timestamp tokens, so every clip is cut into timed segments. A clip
+        whose greedy decode fails transcribe()'s quality checks is decoded
+        again on its own with the temperature fallback.
+        """
+        import torch
+        whisper = self.whisper
+        model = self.model
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(a)), model.dims.n_mels)
+            for a in audios
+        ]).to(model.device)
+        options = dict(options)
+        options.setdefault("fp16", model.device.type == "cuda")
+        decoded = whisper.decode(model, mel, whisper.DecodingOptions(without_timestamps=False, **options))
+        tokenizer, timestamp_begin = self._timestamp_begin(options)
+        results = []
+        for audio, r in zip(audios, decoded):
+            # same silence and fallback rules whisper.transcribe applies per window
+            silent = r.no_speech_prob > 0.6 and r.avg_logprob < -1.0
+            if silent:
+                results.append({"text": "", "language": r.language, "segments": []})
+                continue
+            if r.compression_ratio > 2.4 or r.avg_logprob < -1.0:
+                results.append(self.transcribe(audio, **options))
+                continue
+            segments = self._split(r.tokens, tokenizer, timestamp_begin, len(audio) / SAMPLE_RATE,
+                                   r.avg_logprob, r.no_speech_prob)
+            results.append({"text": "".join(s["text"] for s in segments), "language": r.language,
+                            "segments": segments})
+        return results
+
+
+class FasterWhisperBackend:
+    name = "faster-whisper"
+
+    # openai-whisper options faster-whisper spells the same way
+    _PASSTHROUGH = ("language", "task", "initial_prompt", "word_timestamps",
+                    "condition_on_previous_text", "temperature", "beam_size", "best_of")
+
+    def __init__(self, model_name):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model_name, device="cpu", compute_type=COMPUTE_TYPE,
+                                  cpu_threads=CPU_THREADS)
+
+    def transcribe(self, audio, **options):
+        kwargs = {k: v for k, v in options.items() if k in self._PASSTHROUGH}
+        segments_iter, info = self.model.transcribe(audio, vad_filter=False, **kwargs)
+        segments = []
+        for i, s in enumerate(segments_iter):
+            words = None
+            if kwargs.get("word_timestamps"):
+                words = [{"word": w.word, "start": w.start, "end": w.end, "probability": w.probability}
+                         for w in (s.words or [])]
+            segments.append(_segment(i, s.start, s.end, s.text, s.avg_logprob, s.no_speech_prob, words))
+        return {"text": "".join(s["text"] for s in segments), "language": info.language, "segments": segments}
+
+    def decode_batch(self, audios, **options):
+        # CTranslate2 decoding is already cheap per clip; run the clips back to back
+        return [self.transcribe(audio, **options) for audio in audios]
+
+
+class StubBackend:
+    """
+    Same interface and segment schema as the real backends, no model. Audio
+    is cut into SEGMENT_S pieces; a piece with any signal becomes a segment
+    of about two words per second, picked by a hash of its samples, so the
+    same audio always gives the same transcript. Silent pieces give nothing.
+    """
+    name = "stub"
+    SEGMENT_S = 5.0
+    WORDS = ("வணக்கம் இன்று கூட்டம் நூலகம் திட்டம் முடிவு அடுத்த வாரம் பட்ஜெட் குழு "
+             "பள்ளி மாணவர்கள் தலைவர் அறிக்கை நன்றி கேள்வி பதில் செலவு").split()
+
+    def __init__(self, model_name, rtf=STUB_RTF):
+        self.rtf = rtf
+
+    @staticmethod
+    def _load(audio):
+        if isinstance(audio, str):
+            import soundfile as sf
+            audio, _ = sf.read(audio, dtype="float32")
+            if audio.ndim > 1:
+                audio = audio.mean(axis=1)
+        return np.asarray(audio, dtype=np.float32)
+
+    def _text(self, piece):
+        seed = zlib.crc32(np.round(piece * 1000).astype(np.int16).tobytes())
+        n = max(1, int(round(len(piece) / SAMPLE_RATE * 2)))
+        return [self.WORDS[i] for i in np.random.default_rng(seed).integers(len(self.WORDS), size=n)]
+
+    def _pieces(self, audio):
+        step = int(self.SEGMENT_S * SAMPLE_RATE)
+        for pos in range(0, len(audio), step):
+            piece = audio[pos:pos + step]
+            if len(piece) and np.sqrt(np.mean(piece ** 2)) > 1e-3:
+                yield pos / SAMPLE_RATE, piece
+
+    def _simulate(self, audio):
+        if self.rtf > 0:
+            time.sleep(self.rtf * len(audio) / SAMPLE_RATE)
+
+    def transcribe(self, audio, **options):
+        audio = self._load(audio)
+        self._simulate(audio)
+        segments = []
+        for start, piece in self._pieces(audio):
+            end = start + len(piece) / SAMPLE_RATE
+            words = self._text(piece)
+            step = (end - start) / len(words)
+            timed = [{"word": " " + w, "start": round(start + i * step, 2),
+                      "end": round(start + (i + 1) * step, 2), "probability": 1.0} for i, w in enumerate(words)]
+            segments.append(_segment(len(segments), start, end, " " + " ".join(words), -0.2, 0.01,
+                                     timed if options.get("word_timestamps") else None))
+        return {"text": "".join(s["text"] for s in segments), "language": options.get("language") or "ta",
+                "segments": segments}
+
+    def decode_batch(self, audios, **options):
+        # timed segments, without words, like the batched decode of the real backends
+        return [self.transcribe(audio, **dict(options, word_timestamps=False)) for audio in audios]
+
+
+BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def backend_id(name=BACKEND):
+    # the engine, and for faster-whisper its compute type: both change the output
+    return f"{name}:{COMPUTE_TYPE}" if name == FasterWhisperBackend.name else name
+
+
+def load_backend(name, model_name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown WHISPER_BACKEND {name!r}; choose from {sorted(BACKENDS)}")
+    return BACKENDS[name](model_name)